@@ -1,19 +1,163 @@
 import os
-import requests
-from typing import TypedDict, List
+import copy
+import json
+import time
+import asyncio
+import hashlib
+import contextvars
+from typing import TypedDict, List, Annotated
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langgraph.graph import StateGraph, END
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, START, END
+from rag_cache import RAGIndexCache
+from embedding_cache import CachedEmbeddings
+from ingest import build_faiss_streaming
+from compact_index import compress_index
+from market_cache import MarketDataCache
+from perplexity_client import PerplexityClient
+from rate_limit import AsyncTokenBucket, RateLimiter, DEFAULT_USER, default_rate_limiter
+from answer_cache import SemanticAnswerCache
+from ticker_resolver import resolve_ticker, canonical_query
+from single_flight import SingleFlight, default_single_flight
+from context_packer import DEFAULT_CONTEXT_BUDGET, PackedContext, pack_context
+from prompts import (
+    build_system_prompt, build_user_prompt, analysis_messages, pack_principles, prompt_cache_key,
+    cached_tokens
+)
+from metrics import LogSink, node_metrics, count_tokens
+from retrieval import (
+    STATIC_QUERIES, QUERY_DEPTH, PRINCIPLE_DEPTH, RETRIEVAL_MODES, FUSION_DEPTH,
+    attach_static_vectors, attach_bm25, batch_search, lexical_search, rrf_fuse,
+    embed_query_cached, aembed_query_cached, index_signature
+)
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+EMBEDDING_MODEL = "text-embedding-ada-002"
+CHUNK_CACHE_FILE = "chunk_embeddings.sqlite"
+PERPLEXITY_MODEL = "sonar-pro"
+ANALYSIS_MODEL = "gpt-4o"
+
+# analyze_many 호출 하나에만 적용되는 공급자별 초당 요청 수 제한 (동시 배치끼리 섞이지 않게 컨텍스트별)
+_batch_rate_limits = contextvars.ContextVar("batch_rate_limits", default=None)
+
+# RAG 미초기화 시 사용하는 기본 원칙
+DEFAULT_INSIGHTS = [
+    "경제적 해자(Economic Moat)가 있는 기업을 찾아라",
+    "이해할 수 있는 비즈니스에만 투자하라",
+    "훌륭한 경영진이 있는가를 확인하라",
+    "적정 가격에 매수하라"
+]
+
+
+def merge_errors(left: str, right: str) -> str:
+    """병렬 브랜치의 에러 메시지를 모두 유지"""
+    if not left:
+        return right or ""
+    if not right or right in left.split("; "):
+        return left
+    return f"{left}; {right}"
+
+
+def merge_dicts(left: dict, right: dict) -> dict:
+    """노드별 소요 시간 / 측정값 병합"""
+    return {**(left or {}), **(right or {})}
+
+
+def build_vector_store(pdf_path: str, embeddings, rag_cache: RAGIndexCache = None,
+                       force_rebuild: bool = False, index_type: str = "flat"):
+    """PDF로 FAISS 벡터 스토어 생성 (rag_cache 가 있으면 디스크 캐시 우선)
+
+    에이전트와 독립적이므로 여러 세션이 공유할 인덱스를 한 번만 만들 때도 사용한다.
+    인덱스 캐시가 빗나가도(PDF 변경) 청크 임베딩 캐시로 바뀐 청크만 새로 임베딩한다.
+    index_type 이 flat 이 아니면 fp16 / sq8 / ivf / ivfpq 압축 인덱스로 바꿔 저장한다.
+    """
+    cache_key = None
+    if rag_cache:
+        pdf_sha256 = rag_cache.file_digest(pdf_path)
+        cache_key = rag_cache.make_key(
+            pdf_sha256, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL, index_type
+        )
+        if force_rebuild:
+            rag_cache.invalidate(cache_key)
+        else:
+            cached = rag_cache.load(cache_key, embeddings)
+            if cached is not None:
+                attach_static_vectors(cached, embeddings)
+                # 캐시에 BM25 파일이 없으면 청크로 다시 만들어 하이브리드 검색이 유지되게 한다
+                attach_bm25(cached)
+                print(f"✓ RAG 캐시 로드 완료: {cache_key[:12]}")
+                return cached
+
+    print(f"📄 PDF 로딩 중: {pdf_path}")
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+
+    chunk_embeddings = None
+    if rag_cache:
+        chunk_embeddings = CachedEmbeddings(
+            embeddings, os.path.join(rag_cache.cache_dir, CHUNK_CACHE_FILE), EMBEDDING_MODEL
+        )
+
+    # 페이지 병렬 추출 -> 분할 -> 배치 임베딩을 스트리밍으로 처리
+    vector_store, chunk_count = build_faiss_streaming(
+        pdf_path, text_splitter, chunk_embeddings or embeddings
+    )
+    if vector_store is None:
+        print(f"⚠️ PDF에서 텍스트를 추출하지 못했습니다: {pdf_path}")
+        return None
+
+    if index_type != "flat":
+        flat_bytes = vector_store.index.ntotal * vector_store.index.d * 4
+        vector_store.index = compress_index(vector_store.index, index_type)
+        print(f"🗜️ {index_type} 인덱스로 압축 (원본 벡터 {flat_bytes / 1024 ** 2:.1f}MB)")
+
+    attach_static_vectors(vector_store, chunk_embeddings or embeddings)
+    # 같은 청크로 BM25 역색인도 만들어 인덱스와 함께 저장
+    attach_bm25(vector_store)
+    # 검색 시에는 원래 임베딩 객체를 사용
+    vector_store.embedding_function = embeddings
+
+    if chunk_embeddings:
+        stats = chunk_embeddings.stats()
+        print(f"🧩 청크 임베딩 캐시: 재사용 {stats['hits']}개 / 신규 {stats['misses']}개 "
+              f"(적중률 {stats['hit_ratio']:.0%})")
+        chunk_embeddings.prune()
+
+    if cache_key:
+        rag_cache.save(cache_key, vector_store, {
+            "pdf_sha256": pdf_sha256,
+            "pdf_path": os.path.abspath(pdf_path),
+            "chunks": chunk_count,
+            "embedding_model": EMBEDDING_MODEL,
+            "index_type": index_type,
+            "chunk_cache": chunk_embeddings.stats() if chunk_embeddings else None,
+        })
+
+    print(f"✓ RAG 초기화 완료: {chunk_count}개 청크")
+    return vector_store
 
 
 class InvestmentState(TypedDict):
     user_query: str
+    # 질문에서 로컬로 찾은 대표 티커 (없으면 ""), 캐시 키 / 요청 병합에 사용
+    ticker: str
+    # 공정 큐에서 요청 차례를 나누는 단위 (세션, 배치 등)
+    user_id: str
     market_data: dict
     buffett_insights: List[str]
+    # 고정 검색어(STATIC_QUERIES) 결과, 질문과 무관하므로 프롬프트 캐시 접두부에 넣는다
+    buffett_principles: List[str]
     final_analysis: str
-    error: str
+    error: Annotated[str, merge_errors]
+    # 실패는 아니지만 품질이 떨어진 처리 (어휘 검색 대체 등), 재시도 / 캐시 판단에는 쓰지 않는다
+    warnings: Annotated[str, merge_errors]
+    node_timings: Annotated[dict, merge_dicts]
+    metrics: Annotated[dict, merge_dicts]
     perplexity_max_tokens: int
     perplexity_temperature: float
     openai_max_tokens: int
@@ -21,11 +165,49 @@ class InvestmentState(TypedDict):
 
 
 class InvestmentAgent:
-    def __init__(self, openai_api_key: str, perplexity_api_key: str, pdf_path: str = None):
+    def __init__(self, openai_api_key: str, perplexity_api_key: str, pdf_path: str = None,
+                 rag_cache_dir: str = ".rag_cache", market_cache: MarketDataCache = None,
+                 perplexity_client: PerplexityClient = None, metrics_sinks: list = None,
+                 vector_store=None, index_type: str = "flat", mmap_index: bool = False,
+                 retrieval_mode: str = "vector", embedding_timeout: float = None,
+                 answer_cache: SemanticAnswerCache = None, single_flight: SingleFlight = None,
+                 context_token_budget: int = DEFAULT_CONTEXT_BUDGET, openai_base_url: str = None,
+                 perplexity_base_url: str = None, rate_limiter: RateLimiter = None):
         self.openai_api_key = openai_api_key
         self.perplexity_api_key = perplexity_api_key
-        self.vector_store = None
-        os.environ["OPENAI_API_KEY"] = openai_api_key
+        # 기본 엔드포인트 대신 호환 서버(로컬 스텁, 프록시 등)로 보낼 때 지정
+        self.openai_base_url = openai_base_url
+        # 공유 인덱스를 넘겨받으면 읽기 전용으로 사용 (검색어 임베딩은 이 에이전트의 키로)
+        self.vector_store = vector_store
+        # API 키는 환경 변수가 아닌 클라이언트에 직접 전달해 세션 간 섞이지 않게 한다
+        # embedding_timeout 을 넘기면 실패로 보고 BM25 어휘 검색으로 대체한다
+        self.embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, api_key=openai_api_key,
+                                           timeout=embedding_timeout, base_url=openai_base_url)
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"지원하지 않는 검색 방식: {retrieval_mode} (가능: {', '.join(RETRIEVAL_MODES)})")
+        # vector: 임베딩 검색 / hybrid: 임베딩 + BM25 (RRF) / lexical: BM25 만 (네트워크 호출 없음)
+        self.retrieval_mode = retrieval_mode
+        # rag_cache_dir=None 이면 디스크 캐시 없이 매번 새로 임베딩
+        # index_type: flat / fp16 / sq8 / ivf / ivfpq, mmap_index: 캐시 인덱스를 메모리 맵으로 로드
+        self.index_type = index_type
+        self.rag_cache = RAGIndexCache(rag_cache_dir, mmap=mmap_index) if rag_cache_dir else None
+        # 여러 에이전트가 공유하려면 같은 MarketDataCache 인스턴스를 넘긴다
+        self.market_cache = market_cache if market_cache is not None else MarketDataCache()
+        # 연결 풀/재시도/타임아웃을 가진 클라이언트를 에이전트 수명 동안 재사용
+        self.perplexity_client = perplexity_client or PerplexityClient(
+            perplexity_api_key, base_url=perplexity_base_url
+        )
+        # 공급자별 요청 / 토큰 한도와 사용자별 공정 큐 (기본: 환경 변수 한도, 프로세스 전체 공유)
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        # 비슷한 질문의 이전 분석 재사용 (여러 에이전트가 공유하려면 같은 인스턴스를 넘긴다)
+        self.answer_cache = answer_cache if answer_cache is not None else SemanticAnswerCache()
+        # 같은 질문이 동시에 들어오면 파이프라인 한 번만 실행 (기본: 프로세스 전체 공유,
+        # SingleFlight(SQLiteFlightStore(...)) 를 넘기면 워커 프로세스 간에도 병합)
+        self.single_flight = single_flight or default_single_flight
+        # 분석 프롬프트에 넣을 시장 정보 + 인사이트 토큰 상한
+        self.context_token_budget = context_token_budget
+        # 분석이 끝날 때마다 노드별 측정값을 전달할 곳 (LogSink / JsonlSink / PrometheusSink)
+        self.metrics_sinks = metrics_sinks if metrics_sinks is not None else [LogSink()]
 
         # PDF 경로가 제공되면 즉시 RAG 초기화
         if pdf_path and os.path.exists(pdf_path):
@@ -40,67 +222,159 @@ class InvestmentAgent:
 
         print(f"🔍 Perplexity로 정보 수집 중: '{user_query}'")
         print(f"   📊 설정: max_tokens={max_tokens}, temperature={temperature}")
+        started = time.perf_counter()
 
         try:
-            url = "https://api.perplexity.ai/chat/completions"
-            payload = {
-                "model": "sonar-pro",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": """You are a financial data researcher. When asked about a stock:
-1. Identify the company and ticker symbol
-2. Provide current stock price and today's change
-3. Recent news (last 7 days)
-4. Analyst ratings summary
-5. Key financial metrics (P/E, market cap, revenue growth)
-6. Major risks or concerns
+            cache_key = self._market_cache_key(state, max_tokens, temperature)
+            fetch_started = time.perf_counter()
+            cached, cache_status = self.market_cache.get_or_fetch(
+                cache_key,
+                lambda: self.fetch_market_data(user_query, max_tokens, temperature, state.get("user_id"))
+            )
+            fetch_time = time.perf_counter() - fetch_started
+            market_data = {**cached, "user_query": user_query}
 
-Be concise and factual. Always include the ticker symbol in your response.
-Only use information from reliable financial sources."""
-                    },
-                    {"role": "user", "content": user_query}
-                ],
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "return_citations": True,
-                "search_domain_filter": [
-                    "bloomberg.com", "reuters.com", "wsj.com",
-                    "finance.yahoo.com", "investing.com", "seekingalpha.com"
-                ]
+            elapsed = time.perf_counter() - started
+            print(f"✓ Perplexity 정보 수집 완료 ({elapsed:.2f}초, 캐시 {cache_status})")
+            return {
+                "market_data": market_data,
+                "node_timings": {"perplexity_research": elapsed},
+                "metrics": {"perplexity_research": self._perplexity_metrics(
+                    elapsed, fetch_time, cached, cache_status
+                )}
             }
 
-            headers = {
-                "Authorization": f"Bearer {self.perplexity_api_key}",
-                "Content-Type": "application/json"
+        except Exception as e:
+            print(f"❌ Perplexity API 오류: {str(e)}")
+            return {
+                "market_data": {
+                    "raw_response": f"정보 수집 실패: {str(e)}",
+                    "user_query": user_query
+                },
+                "error": str(e),
+                "node_timings": {"perplexity_research": time.perf_counter() - started},
+                "metrics": {"perplexity_research": node_metrics(time.perf_counter() - started)}
             }
 
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
+    async def aperplexity_research_node(self, state: InvestmentState) -> InvestmentState:
+        """Perplexity API로 정보 수집 (비동기)"""
+        user_query = state["user_query"]
+        max_tokens = state.get("perplexity_max_tokens", 1500)
+        temperature = state.get("perplexity_temperature", 0.2)
+        started = time.perf_counter()
+
+        try:
+            cache_key = self._market_cache_key(state, max_tokens, temperature)
+            fetch_started = time.perf_counter()
+            cached, cache_status = await self.market_cache.aget_or_fetch(
+                cache_key,
+                lambda: self.afetch_market_data(user_query, max_tokens, temperature, state.get("user_id"))
+            )
+            fetch_time = time.perf_counter() - fetch_started
+            market_data = {**cached, "user_query": user_query}
 
-            result = response.json()
-            market_data = {
-                "raw_response": result["choices"][0]["message"]["content"],
-                "citations": result.get("citations", []),
-                "user_query": user_query
+            elapsed = time.perf_counter() - started
+            print(f"✓ Perplexity 정보 수집 완료: '{user_query}' ({elapsed:.2f}초, 캐시 {cache_status})")
+            return {
+                "market_data": market_data,
+                "node_timings": {"perplexity_research": elapsed},
+                "metrics": {"perplexity_research": self._perplexity_metrics(
+                    elapsed, fetch_time, cached, cache_status
+                )}
             }
 
-            print(f"✓ Perplexity 정보 수집 완료")
-            return {**state, "market_data": market_data}
-
         except Exception as e:
             print(f"❌ Perplexity API 오류: {str(e)}")
             return {
-                **state,
                 "market_data": {
                     "raw_response": f"정보 수집 실패: {str(e)}",
                     "user_query": user_query
                 },
-                "error": str(e)
+                "error": str(e),
+                "node_timings": {"perplexity_research": time.perf_counter() - started},
+                "metrics": {"perplexity_research": node_metrics(time.perf_counter() - started)}
             }
 
-    def initialize_rag(self, pdf_path: str):
-        """RAG 시스템 초기화"""
+    def _market_cache_key(self, state: InvestmentState, max_tokens: int, temperature: float) -> str:
+        """종목 표현만 다른 질문("Apple 배당", "애플 배당")은 같은 키, 질문 내용이 다르면 다른 키"""
+        query = canonical_query(state["user_query"])
+        return self.market_cache.make_key(query, PERPLEXITY_MODEL, max_tokens, temperature)
+
+    def fetch_market_data(self, user_query: str, max_tokens: int, temperature: float,
+                          user_id: str = None) -> dict:
+        """Perplexity API 호출 (캐시 미스 / 백그라운드 갱신 시 사용)"""
+        payload = self._market_data_payload(user_query, max_tokens, temperature)
+        waited = self._throttle("perplexity", self._payload_tokens(payload), user_id)
+        result = self.perplexity_client.chat_completions(payload)
+        return {**self._parse_market_data(result, user_query), "rate_limit_wait": waited}
+
+    async def afetch_market_data(self, user_query: str, max_tokens: int, temperature: float,
+                                 user_id: str = None) -> dict:
+        """Perplexity API 비동기 호출"""
+        payload = self._market_data_payload(user_query, max_tokens, temperature)
+        waited = await self._athrottle("perplexity", self._payload_tokens(payload), user_id)
+        result = await self.perplexity_client.achat_completions(payload)
+        return {**self._parse_market_data(result, user_query), "rate_limit_wait": waited}
+
+    @staticmethod
+    def _payload_tokens(payload: dict) -> int:
+        """토큰 예산용 요청 크기 (입력 추정 + 최대 출력)"""
+        return sum(count_tokens(m["content"]) for m in payload["messages"]) + payload["max_tokens"]
+
+    @staticmethod
+    def _market_data_payload(user_query: str, max_tokens: int, temperature: float) -> dict:
+        return {
+            "model": PERPLEXITY_MODEL,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": """You are a financial data researcher. When asked about a stock:
+1. Identify the company and ticker symbol
+2. Provide current stock price and today's change
+3. Recent news (last 7 days)
+4. Analyst ratings summary
+5. Key financial metrics (P/E, market cap, revenue growth)
+6. Major risks or concerns
+
+Be concise and factual. Always include the ticker symbol in your response.
+Only use information from reliable financial sources."""
+                },
+                {"role": "user", "content": user_query}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "return_citations": True,
+            "search_domain_filter": [
+                "bloomberg.com", "reuters.com", "wsj.com",
+                "finance.yahoo.com", "investing.com", "seekingalpha.com"
+            ]
+        }
+
+    @staticmethod
+    def _parse_market_data(result: dict, user_query: str) -> dict:
+        return {
+            "raw_response": result["choices"][0]["message"]["content"],
+            "citations": result.get("citations", []),
+            "usage": result.get("usage", {}),
+            "user_query": user_query
+        }
+
+    @staticmethod
+    def _perplexity_metrics(elapsed: float, fetch_time: float, market_data: dict,
+                            cache_status: str) -> dict:
+        """캐시 미스일 때만 HTTP 시간과 토큰/비용을 집계"""
+        if cache_status != "miss":
+            return node_metrics(elapsed, model=PERPLEXITY_MODEL, cache=cache_status)
+        usage = market_data.get("usage", {})
+        waited = market_data.get("rate_limit_wait", 0.0)
+        return node_metrics(
+            elapsed, fetch_time - waited, PERPLEXITY_MODEL,
+            usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0),
+            cache=cache_status, rate_limit_wait=waited
+        )
+
+    def initialize_rag(self, pdf_path: str, force_rebuild: bool = False):
+        """RAG 시스템 초기화 (디스크 캐시 우선)"""
         if not pdf_path:
             print("⚠️ PDF 경로가 제공되지 않았습니다. RAG 초기화 건너뜀")
             return
@@ -109,121 +383,357 @@ Only use information from reliable financial sources."""
             print(f"⚠️ PDF 파일을 찾을 수 없습니다: {pdf_path}")
             return
 
-        print(f"📄 PDF 로딩 중: {pdf_path}")
-
-        loader = PyPDFLoader(pdf_path)
-        documents = loader.load()
-
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+        self.vector_store = build_vector_store(
+            pdf_path, self.embeddings, self.rag_cache, force_rebuild, self.index_type
         )
-        splits = text_splitter.split_documents(documents)
-
-        embeddings = OpenAIEmbeddings()
-        self.vector_store = FAISS.from_documents(splits, embeddings)
-
-        print(f"✓ RAG 초기화 완료: {len(splits)}개 청크")
 
     def rag_buffett_wisdom_node(self, state: InvestmentState) -> InvestmentState:
         """버크셔 서한에서 투자 철학 검색"""
         user_query = state["user_query"]
         print(f"📚 버핏의 투자 철학 검색 중...")
+        started = time.perf_counter()
 
         if self.vector_store is None:
             print("⚠️ RAG 시스템이 초기화되지 않았습니다. 기본 원칙 사용")
             return {
-                **state,
-                "buffett_insights": [
-                    "경제적 해자(Economic Moat)가 있는 기업을 찾아라",
-                    "이해할 수 있는 비즈니스에만 투자하라",
-                    "훌륭한 경영진이 있는가를 확인하라",
-                    "적정 가격에 매수하라"
-                ]
+                "buffett_insights": list(DEFAULT_INSIGHTS),
+                "buffett_principles": list(DEFAULT_INSIGHTS),
+                "node_timings": {"rag_wisdom": time.perf_counter() - started},
+                "metrics": {"rag_wisdom": node_metrics(time.perf_counter() - started)}
+            }
+
+        mode = self.retrieval_mode
+        embed_time = 0.0
+        embed_hit = None
+        waits = []
+        warning = ""
+        try:
+            vector_results = None
+            if mode != "lexical":
+                try:
+                    # 고정 검색어 벡터는 인덱스에 붙어 있고, 사용자 질문만 LRU 를 거쳐 임베딩
+                    static_vectors = attach_static_vectors(self.vector_store, self.embeddings)
+                    embed_started = time.perf_counter()
+                    query_vector, embed_hit = embed_query_cached(
+                        self.embeddings, user_query, EMBEDDING_MODEL,
+                        throttle=self._embedding_throttle(user_query, state.get("user_id"), waits)
+                    )
+                    embed_time = time.perf_counter() - embed_started - sum(waits)
+
+                    # 세 검색어를 FAISS 한 번의 배치 검색으로 처리
+                    vectors = [query_vector] + [static_vectors[q] for q in STATIC_QUERIES]
+                    vector_results = batch_search(self.vector_store, vectors, k=self._vector_depth())
+                except Exception as e:
+                    # 임베딩 API 가 느리거나 실패하면 로컬 BM25 로 대체
+                    warning = f"임베딩 검색 실패, 어휘 검색으로 대체: {str(e)}"
+                    print(f"⚠️ {warning}")
+                    mode = "lexical"
+            results = self._retrieve(user_query, vector_results, mode)
+        except Exception as e:
+            # 병렬 브랜치에서 예외가 나면 그래프 전체가 중단되므로 에러로 기록
+            print(f"❌ RAG 검색 오류: {str(e)}")
+            return {
+                "buffett_insights": [],
+                "buffett_principles": [],
+                "error": str(e),
+                "node_timings": {"rag_wisdom": time.perf_counter() - started},
+                "metrics": {"rag_wisdom": node_metrics(time.perf_counter() - started, embed_time)}
+            }
+
+        # 자르기는 분석 직전 pack_context 가 문장 단위로 한다
+        insights = [doc.page_content for docs in results for doc in docs]
+        principles = [doc.page_content for docs in results[1:] for doc in docs]
+        elapsed = time.perf_counter() - started
+        print(f"✓ {len(insights)}개 인사이트 추출 완료 ({elapsed:.2f}초, {mode})")
+        update = {
+            "buffett_insights": insights,
+            "buffett_principles": principles,
+            "node_timings": {"rag_wisdom": elapsed},
+            "metrics": {"rag_wisdom": self._rag_metrics(
+                elapsed, embed_time, user_query, embed_hit, mode, sum(waits)
+            )}
+        }
+        if warning:
+            update["warnings"] = warning
+        return update
+
+    async def arag_buffett_wisdom_node(self, state: InvestmentState) -> InvestmentState:
+        """버크셔 서한에서 투자 철학 검색 (비동기)"""
+        user_query = state["user_query"]
+        started = time.perf_counter()
+
+        if self.vector_store is None:
+            return {
+                "buffett_insights": list(DEFAULT_INSIGHTS),
+                "buffett_principles": list(DEFAULT_INSIGHTS),
+                "node_timings": {"rag_wisdom": time.perf_counter() - started},
+                "metrics": {"rag_wisdom": node_metrics(time.perf_counter() - started)}
             }
 
-        search_queries = [
-            user_query,
-            "competitive advantage moat",
-            "business quality evaluation",
-            "valuation principles"
-        ]
+        mode = self.retrieval_mode
+        embed_time = 0.0
+        embed_hit = None
+        waits = []
+        warning = ""
+        try:
+            vector_results = None
+            if mode != "lexical":
+                try:
+                    static_vectors = getattr(self.vector_store, "static_query_vectors", None)
+                    if not static_vectors:
+                        static_vectors = await asyncio.to_thread(
+                            attach_static_vectors, self.vector_store, self.embeddings
+                        )
+                    embed_started = time.perf_counter()
+                    query_vector, embed_hit = await aembed_query_cached(
+                        self.embeddings, user_query, EMBEDDING_MODEL,
+                        throttle=self._aembedding_throttle(user_query, state.get("user_id"), waits)
+                    )
+                    embed_time = time.perf_counter() - embed_started - sum(waits)
+
+                    vectors = [query_vector] + [static_vectors[q] for q in STATIC_QUERIES]
+                    vector_results = batch_search(self.vector_store, vectors, k=self._vector_depth())
+                except Exception as e:
+                    warning = f"임베딩 검색 실패, 어휘 검색으로 대체: {str(e)}"
+                    mode = "lexical"
+            results = self._retrieve(user_query, vector_results, mode)
+        except Exception as e:
+            print(f"❌ RAG 검색 오류: {str(e)}")
+            return {
+                "buffett_insights": [],
+                "buffett_principles": [],
+                "error": str(e),
+                "node_timings": {"rag_wisdom": time.perf_counter() - started},
+                "metrics": {"rag_wisdom": node_metrics(time.perf_counter() - started, embed_time)}
+            }
+
+        # 자르기는 분석 직전 pack_context 가 문장 단위로 한다
+        insights = [doc.page_content for docs in results for doc in docs]
+        principles = [doc.page_content for docs in results[1:] for doc in docs]
+        elapsed = time.perf_counter() - started
+        update = {
+            "buffett_insights": insights,
+            "buffett_principles": principles,
+            "node_timings": {"rag_wisdom": elapsed},
+            "metrics": {"rag_wisdom": self._rag_metrics(
+                elapsed, embed_time, user_query, embed_hit, mode, sum(waits)
+            )}
+        }
+        if warning:
+            update["warnings"] = warning
+        return update
+
+    def _vector_depth(self) -> int:
+        """hybrid 는 RRF 결합용 후보를 넉넉히 가져온다"""
+        return FUSION_DEPTH if self.retrieval_mode == "hybrid" else PRINCIPLE_DEPTH
 
-        insights = []
-        for query in search_queries[:3]:
-            docs = self.vector_store.similarity_search(query, k=2)
-            for doc in docs:
-                insights.append(doc.page_content[:300])
+    def _retrieve(self, user_query: str, vector_results: list, mode: str) -> list:
+        """검색 방식에 따라 검색어별 문서 목록 결정 (질문 QUERY_DEPTH 개, 고정 검색어 PRINCIPLE_DEPTH 개)"""
+        depths = [QUERY_DEPTH] + [PRINCIPLE_DEPTH] * len(STATIC_QUERIES)
+        queries = [user_query] + STATIC_QUERIES
+        if mode == "vector":
+            results = vector_results
+        elif mode == "lexical":
+            results = lexical_search(self.vector_store, queries, k=max(depths))
+        else:
+            lexical_results = lexical_search(self.vector_store, queries, k=FUSION_DEPTH)
+            results = [rrf_fuse([v, l], k=d) for v, l, d in zip(vector_results, lexical_results, depths)]
+        return [docs[:d] for docs, d in zip(results, depths)]
 
-        print(f"✓ {len(insights)}개 인사이트 추출 완료")
-        return {**state, "buffett_insights": insights}
+    @staticmethod
+    def _rag_metrics(elapsed: float, embed_time: float, user_query: str, embed_hit: bool,
+                     mode: str = "vector", rate_limit_wait: float = 0.0) -> dict:
+        """임베딩 호출은 LRU 미스일 때 사용자 질문 한 번뿐 (lexical 은 호출 없음)"""
+        if embed_hit is None:
+            return node_metrics(elapsed, embed_time, retrieval=mode)
+        if embed_hit:
+            return node_metrics(elapsed, model=EMBEDDING_MODEL, embedding_cache="hit",
+                                retrieval=mode)
+        return node_metrics(
+            elapsed, embed_time, EMBEDDING_MODEL, count_tokens(user_query, EMBEDDING_MODEL),
+            embedding_cache="miss", retrieval=mode, rate_limit_wait=rate_limit_wait
+        )
 
     def openai_analysis_node(self, state: InvestmentState) -> InvestmentState:
         """OpenAI로 종합 분석"""
-        user_query = state["user_query"]
-        market_data = state["market_data"]
-        buffett_insights = state["buffett_insights"]
         max_tokens = state.get("openai_max_tokens", 2000)
         temperature = state.get("openai_temperature", 0.3)
 
         print(f"🤖 OpenAI로 종합 분석 중...")
         print(f"   📊 설정: max_tokens={max_tokens}, temperature={temperature}")
+        started = time.perf_counter()
 
-        prompt = f"""당신은 워렌 버핏의 투자 철학을 깊이 이해하는 전문 애널리스트입니다.
-
-## 사용자 질문
-{user_query}
-
-## Perplexity가 수집한 최신 시장 정보
-{market_data.get('raw_response', '정보 없음')}
-
-## 버크셔 해서웨이 서한에서 추출한 투자 원칙
-{chr(10).join(f"- {insight[:200]}..." for insight in buffett_insights)}
+        try:
+            llm = ChatOpenAI(
+                model=ANALYSIS_MODEL,
+                api_key=self.openai_api_key,
+                base_url=self.openai_base_url,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream_usage=True
+            )
+            packed = self.pack_context(state)
+            system_prompt, messages = self.build_analysis_messages(state, packed)
+            waited = self._throttle("openai", self._message_tokens(messages, max_tokens), state.get("user_id"))
+            http_started = time.perf_counter()
+            response = llm.invoke(messages, prompt_cache_key=prompt_cache_key(system_prompt))
+            http_time = time.perf_counter() - http_started
+            analysis = response.content
 
-## 분석 요청
-위 정보를 바탕으로 다음 구조로 분석하세요:
+            elapsed = time.perf_counter() - started
+            print(f"✓ 분석 완료 ({len(analysis)} 글자, {elapsed:.2f}초)")
+            return {
+                "final_analysis": analysis,
+                "node_timings": {"openai_analysis": elapsed},
+                "metrics": {"openai_analysis": self._analysis_metrics(
+                    elapsed, http_time, response, packed, waited
+                )}
+            }
 
-1. **회사 및 티커 확인**
-2. **비즈니스 이해도** (1-5점)
-3. **경제적 해자** (1-5점)
-4. **경영진 평가** (1-5점)
-5. **밸류에이션** (1-5점)
-6. **종합 투자 의견**
+        except Exception as e:
+            print(f"❌ OpenAI API 오류: {str(e)}")
+            return {
+                "final_analysis": f"분석 중 오류 발생: {str(e)}",
+                "error": str(e),
+                "node_timings": {"openai_analysis": time.perf_counter() - started},
+                "metrics": {"openai_analysis": node_metrics(time.perf_counter() - started)}
+            }
 
-한국어로 명확하고 실용적으로 작성해주세요.
-"""
+    async def aopenai_analysis_node(self, state: InvestmentState) -> InvestmentState:
+        """OpenAI로 종합 분석 (비동기)"""
+        started = time.perf_counter()
 
         try:
+            max_tokens = state.get("openai_max_tokens", 2000)
             llm = ChatOpenAI(
-                model="gpt-4o",
-                temperature=temperature,
-                max_tokens=max_tokens
+                model=ANALYSIS_MODEL,
+                api_key=self.openai_api_key,
+                base_url=self.openai_base_url,
+                temperature=state.get("openai_temperature", 0.3),
+                max_tokens=max_tokens,
+                stream_usage=True
+            )
+            packed = self.pack_context(state)
+            system_prompt, messages = self.build_analysis_messages(state, packed)
+            waited = await self._athrottle(
+                "openai", self._message_tokens(messages, max_tokens), state.get("user_id")
             )
-            response = llm.invoke(prompt)
+            http_started = time.perf_counter()
+            response = await llm.ainvoke(messages, prompt_cache_key=prompt_cache_key(system_prompt))
+            http_time = time.perf_counter() - http_started
             analysis = response.content
 
-            print(f"✓ 분석 완료 ({len(analysis)} 글자)")
-            return {**state, "final_analysis": analysis}
+            elapsed = time.perf_counter() - started
+            print(f"✓ 분석 완료: '{state['user_query']}' ({len(analysis)} 글자, {elapsed:.2f}초)")
+            return {
+                "final_analysis": analysis,
+                "node_timings": {"openai_analysis": elapsed},
+                "metrics": {"openai_analysis": self._analysis_metrics(
+                    elapsed, http_time, response, packed, waited
+                )}
+            }
 
         except Exception as e:
             print(f"❌ OpenAI API 오류: {str(e)}")
             return {
-                **state,
                 "final_analysis": f"분석 중 오류 발생: {str(e)}",
-                "error": str(e)
+                "error": str(e),
+                "node_timings": {"openai_analysis": time.perf_counter() - started},
+                "metrics": {"openai_analysis": node_metrics(time.perf_counter() - started)}
             }
 
+    @staticmethod
+    def _analysis_metrics(elapsed: float, http_time: float, response,
+                          packed: PackedContext = None, rate_limit_wait: float = 0.0) -> dict:
+        usage = getattr(response, "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens", 0)
+        cached = cached_tokens(response)
+        return node_metrics(
+            elapsed, http_time, ANALYSIS_MODEL, prompt_tokens, usage.get("output_tokens", 0),
+            cached_tokens=cached,
+            prompt_cache_hit_rate=cached / prompt_tokens if prompt_tokens else 0.0,
+            rate_limit_wait=rate_limit_wait,
+            **(packed.stats if packed else {})
+        )
+
+    def pack_context(self, state: InvestmentState) -> PackedContext:
+        """질문별 시장 정보와 인사이트를 context_token_budget 안으로 압축
+
+        고정 원칙은 시스템 프롬프트에 들어가므로 제외하고, 원칙과 겹치는 문장도 다시 넣지 않는다.
+        """
+        principles = state.get("buffett_principles") or []
+        insights = [i for i in state["buffett_insights"] if i not in principles]
+        packed = pack_context(
+            state["user_query"], state["market_data"].get("raw_response", ""),
+            insights, self.context_token_budget, ANALYSIS_MODEL,
+            exclude=pack_principles(tuple(principles), ANALYSIS_MODEL)
+        )
+        stats = packed.stats
+        print(f"   📦 컨텍스트 {stats['context_tokens_raw']} -> {stats['context_tokens']} 토큰 "
+              f"(인사이트 {stats['insights_kept']}개, 중복 {stats['insights_duplicate']}개 제거)")
+        return packed
+
+    @staticmethod
+    def build_analysis_messages(state: InvestmentState, packed: PackedContext) -> tuple:
+        """(시스템 프롬프트, 메시지 목록)
+
+        지시문과 고정 원칙은 시스템 메시지(요청 간 공유 접두부), 질문별 데이터는 마지막 사용자 메시지.
+        """
+        principles = state.get("buffett_principles") or DEFAULT_INSIGHTS
+        system_prompt = build_system_prompt(pack_principles(tuple(principles), ANALYSIS_MODEL))
+        return system_prompt, analysis_messages(
+            system_prompt, build_user_prompt(state["user_query"], packed)
+        )
+
+    @staticmethod
+    def _message_tokens(messages: list, max_tokens: int) -> int:
+        """토큰 예산용 요청 크기 (입력 추정 + 최대 출력)"""
+        return sum(count_tokens(m.content, ANALYSIS_MODEL) for m in messages) + max_tokens
+
+    def _throttle(self, provider: str, tokens: int, user_id: str = None) -> float:
+        """공유 한도에서 차례와 예산을 받을 때까지 대기 (대기 시간 반환)"""
+        return self.rate_limiter.acquire(provider, tokens, user_id or DEFAULT_USER)
+
+    async def _athrottle(self, provider: str, tokens: int = 0, user_id: str = None) -> float:
+        """analyze_many 의 초당 요청 수 제한 + 공유 한도 (대기 시간 반환)"""
+        started = time.perf_counter()
+        limiter = (_batch_rate_limits.get() or {}).get(provider)
+        if limiter is not None:
+            await limiter.acquire()
+        await self.rate_limiter.aacquire(provider, tokens, user_id or DEFAULT_USER)
+        return time.perf_counter() - started
+
+    def _embedding_throttle(self, text: str, user_id: str, waits: list):
+        """검색어 LRU 미스로 실제 임베딩을 호출할 때만 부르는 제한 (대기 시간은 waits 에 추가)"""
+        return lambda: waits.append(self._throttle("embeddings", count_tokens(text, EMBEDDING_MODEL), user_id))
+
+    def _aembedding_throttle(self, text: str, user_id: str, waits: list):
+        async def throttle():
+            waits.append(await self._athrottle("embeddings", count_tokens(text, EMBEDDING_MODEL), user_id))
+        return throttle
+
     def create_workflow(self):
-        """워크플로우 생성"""
+        """워크플로우 생성
+
+        perplexity_research 와 rag_wisdom 은 서로의 결과를 쓰지 않으므로
+        START 에서 병렬로 실행하고 openai_analysis 에서 합류한다.
+        """
         workflow = StateGraph(InvestmentState)
 
-        workflow.add_node("perplexity_research", self.perplexity_research_node)
-        workflow.add_node("rag_wisdom", self.rag_buffett_wisdom_node)
-        workflow.add_node("openai_analysis", self.openai_analysis_node)
+        # invoke/stream 은 동기 노드, ainvoke 는 비동기 노드를 사용
+        workflow.add_node("perplexity_research", RunnableLambda(
+            self.perplexity_research_node, afunc=self.aperplexity_research_node
+        ))
+        workflow.add_node("rag_wisdom", RunnableLambda(
+            self.rag_buffett_wisdom_node, afunc=self.arag_buffett_wisdom_node
+        ))
+        workflow.add_node("openai_analysis", RunnableLambda(
+            self.openai_analysis_node, afunc=self.aopenai_analysis_node
+        ))
 
-        workflow.set_entry_point("perplexity_research")
-        workflow.add_edge("perplexity_research", "rag_wisdom")
-        workflow.add_edge("rag_wisdom", "openai_analysis")
+        workflow.add_edge(START, "perplexity_research")
+        workflow.add_edge(START, "rag_wisdom")
+        workflow.add_edge(["perplexity_research", "rag_wisdom"], "openai_analysis")
         workflow.add_edge("openai_analysis", END)
 
         return workflow.compile()
@@ -235,9 +745,16 @@ Only use information from reliable financial sources."""
         perplexity_max_tokens: int = 1500,
         perplexity_temperature: float = 0.2,
         openai_max_tokens: int = 2000,
-        openai_temperature: float = 0.3
+        openai_temperature: float = 0.3,
+        stream: bool = False,
+        user_id: str = None
     ):
-        """주식 분석 실행"""
+        """주식 분석 실행
+
+        stream=True 이면 결과 dict 대신 이벤트 제너레이터를 반환한다.
+        ("token", 분석 텍스트 조각) 이 도착하는 대로 나오고 마지막에 ("result", 최종 상태).
+        user_id 는 공유 속도 제한의 공정 큐에서 차례를 나누는 단위.
+        """
         print("=" * 60)
         print("🎯 버핏 스타일 주식 분석 시작")
         print("=" * 60)
@@ -248,26 +765,371 @@ Only use information from reliable financial sources."""
 
         app = self.create_workflow()
 
-        initial_state = {
+        initial_state = self._initial_state(
+            user_query, perplexity_max_tokens, perplexity_temperature,
+            openai_max_tokens, openai_temperature, user_id
+        )
+
+        if initial_state["ticker"]:
+            print(f"🏷️ 종목: {initial_state['ticker']}")
+
+        cached, lookup = self._lookup_answer(initial_state)
+        if cached is not None:
+            self.emit_metrics(cached)
+            if stream:
+                return iter([("token", cached["final_analysis"]), ("result", cached)])
+            return cached
+
+        flight_key = self._flight_key(initial_state)
+        if stream:
+            return self._stream_coalesced(app, initial_state, lookup, flight_key)
+
+        started = time.perf_counter()
+
+        def run():
+            result = app.invoke(initial_state)
+            timings = result["node_timings"]
+            timings["total"] = time.perf_counter() - started
+            self.print_timings(timings)
+            self._store_answer(result, lookup)
+            result["metrics"]["single_flight"] = node_metrics(0.0, cache="miss")
+            self.emit_metrics(result)
+            return result
+
+        result, shared = self.single_flight.do(flight_key, run)
+        if shared:
+            result = self._coalesced_result(initial_state, result, time.perf_counter() - started)
+            self.emit_metrics(result)
+
+        print("\n" + "=" * 60)
+        print("📊 분석 결과")
+        print("=" * 60)
+        print(result["final_analysis"])
+
+        if result.get("error"):
+            print(f"\n⚠️ 경고: {result['error']}")
+        if result.get("warnings"):
+            print(f"\nℹ️ 참고: {result['warnings']}")
+
+        return result
+
+    async def aanalyze_stock(
+        self,
+        user_query: str,
+        pdf_path: str = None,
+        perplexity_max_tokens: int = 1500,
+        perplexity_temperature: float = 0.2,
+        openai_max_tokens: int = 2000,
+        openai_temperature: float = 0.3,
+        user_id: str = None
+    ):
+        """주식 분석 실행 (비동기)"""
+        if pdf_path:
+            await asyncio.to_thread(self.initialize_rag, pdf_path)
+
+        app = self.create_workflow()
+        initial_state = self._initial_state(
+            user_query, perplexity_max_tokens, perplexity_temperature,
+            openai_max_tokens, openai_temperature, user_id
+        )
+
+        cached, lookup = await self._alookup_answer(initial_state)
+        if cached is not None:
+            self.emit_metrics(cached)
+            return cached
+
+        started = time.perf_counter()
+
+        async def run():
+            result = await app.ainvoke(initial_state)
+            result["node_timings"]["total"] = time.perf_counter() - started
+            self._store_answer(result, lookup)
+            result["metrics"]["single_flight"] = node_metrics(0.0, cache="miss")
+            self.emit_metrics(result)
+            return result
+
+        result, shared = await self.single_flight.ado(self._flight_key(initial_state), run)
+        if shared:
+            result = self._coalesced_result(initial_state, result, time.perf_counter() - started)
+            self.emit_metrics(result)
+        return result
+
+    async def aanalyze_many(self, queries: List[str], concurrency: int = 8,
+                            rate_limits: dict = None, on_result=None, **params) -> list:
+        """여러 종목을 하나의 이벤트 루프에서 동시 분석
+
+        concurrency 는 동시에 실행할 파이프라인 수, rate_limits 는
+        {"perplexity": 초당 요청 수, "embeddings": ..., "openai": ...} 형식.
+        on_result(index, result) 는 각 분석이 끝나는 즉시 호출된다.
+        결과는 queries 순서대로 반환하며 실패한 항목은 error 필드에 기록한다.
+        """
+        # 제한은 이 호출의 태스크들만 보므로 공유 에이전트의 다른 배치와 섞이지 않는다
+        limits_token = _batch_rate_limits.set({
+            provider: AsyncTokenBucket(rate)
+            for provider, rate in (rate_limits or {}).items()
+        })
+        semaphore = asyncio.Semaphore(concurrency)
+        done = 0
+
+        async def run(index: int, user_query: str):
+            nonlocal done
+            async with semaphore:
+                try:
+                    result = await self.aanalyze_stock(user_query, **params)
+                except Exception as e:
+                    result = {**self._initial_state(user_query), "error": str(e)}
+            done += 1
+            print(f"📈 [{done}/{len(queries)}] 완료: {user_query}")
+            if on_result is not None:
+                on_result(index, result)
+            return result
+
+        started = time.perf_counter()
+        try:
+            async with self.perplexity_client.async_session():
+                try:
+                    results = await asyncio.gather(*(run(i, query) for i, query in enumerate(queries)))
+                finally:
+                    # stale 응답 뒤의 백그라운드 갱신이 루프 종료로 취소되지 않게 기다린다
+                    await self.market_cache.adrain()
+        finally:
+            _batch_rate_limits.reset(limits_token)
+        print(f"✓ {len(queries)}개 종목 분석 완료 ({time.perf_counter() - started:.2f}초)")
+        return results
+
+    def analyze_many(self, queries: List[str], concurrency: int = 8,
+                     rate_limits: dict = None, on_result=None, **params) -> list:
+        """aanalyze_many 의 동기 진입점"""
+        return asyncio.run(
+            self.aanalyze_many(queries, concurrency, rate_limits, on_result, **params)
+        )
+
+    @staticmethod
+    def _initial_state(user_query: str, perplexity_max_tokens: int = 1500,
+                       perplexity_temperature: float = 0.2, openai_max_tokens: int = 2000,
+                       openai_temperature: float = 0.3, user_id: str = None) -> dict:
+        return {
             "user_query": user_query,
+            "ticker": resolve_ticker(user_query),
+            "user_id": user_id or DEFAULT_USER,
             "market_data": {},
             "buffett_insights": [],
+            "buffett_principles": [],
             "final_analysis": "",
             "error": "",
+            "warnings": "",
+            "node_timings": {},
+            "metrics": {},
             "perplexity_max_tokens": perplexity_max_tokens,
             "perplexity_temperature": perplexity_temperature,
             "openai_max_tokens": openai_max_tokens,
             "openai_temperature": openai_temperature
         }
 
-        result = app.invoke(initial_state)
+    def _answer_scope(self, state: dict) -> tuple:
+        """같은 종목 / 분석 파라미터 / 검색 방식 / 인덱스로 만든 답변끼리만 재사용
 
-        print("\n" + "=" * 60)
-        print("📊 분석 결과")
-        print("=" * 60)
-        print(result["final_analysis"])
+        티커가 다르면("What is AMD?" 와 "What is NVIDIA?") 임베딩이 비슷해도 재사용하지 않는다.
+        """
+        return (
+            state.get("ticker", ""),
+            state["perplexity_max_tokens"], state["perplexity_temperature"],
+            state["openai_max_tokens"], state["openai_temperature"],
+            self.retrieval_mode, index_signature(self.vector_store), self.context_token_budget,
+        )
+
+    def _cached_result(self, state: dict, value: dict, similarity: float, metrics: dict) -> dict:
+        print(f"💾 비슷한 질문의 분석 재사용 (유사도 {similarity:.3f}): {value['user_query']}")
+        return {
+            **state,
+            "market_data": value["market_data"],
+            "buffett_insights": value["buffett_insights"],
+            "buffett_principles": value.get("buffett_principles", []),
+            "final_analysis": value["final_analysis"],
+            "node_timings": {"answer_cache": metrics["wall_time"], "total": metrics["wall_time"]},
+            "metrics": {"answer_cache": metrics},
+            "cached_from": value["user_query"],
+        }
+
+    def _answer_cache_metrics(self, elapsed: float, state: dict, embed_hit: bool,
+                              hit: bool, similarity: float, rate_limit_wait: float = 0.0) -> dict:
+        if embed_hit:
+            return node_metrics(elapsed, cache="hit" if hit else "miss", similarity=similarity)
+        return node_metrics(
+            elapsed, elapsed - rate_limit_wait, EMBEDDING_MODEL,
+            count_tokens(state["user_query"], EMBEDDING_MODEL),
+            cache="hit" if hit else "miss", similarity=similarity, rate_limit_wait=rate_limit_wait
+        )
+
+    def _lookup_answer(self, state: dict) -> tuple:
+        """(캐시된 결과 또는 None, 저장용 조회 정보)
+
+        질문 임베딩은 검색어 LRU 에 남으므로 미스여도 RAG 노드에서 다시 호출하지 않는다.
+        lexical 모드는 임베딩 호출을 하지 않기로 했으므로 캐시를 건너뛴다.
+        """
+        if self.answer_cache is None or self.retrieval_mode == "lexical":
+            return None, None
+        started = time.perf_counter()
+        waits = []
+        try:
+            vector, embed_hit = embed_query_cached(
+                self.embeddings, state["user_query"], EMBEDDING_MODEL,
+                throttle=self._embedding_throttle(state["user_query"], state.get("user_id"), waits)
+            )
+        except Exception as e:
+            print(f"⚠️ 답변 캐시 조회 실패: {str(e)}")
+            return None, None
+        return self._finish_lookup(state, vector, embed_hit, started, sum(waits))
+
+    async def _alookup_answer(self, state: dict) -> tuple:
+        """_lookup_answer 의 비동기 버전"""
+        if self.answer_cache is None or self.retrieval_mode == "lexical":
+            return None, None
+        started = time.perf_counter()
+        waits = []
+        try:
+            vector, embed_hit = await aembed_query_cached(
+                self.embeddings, state["user_query"], EMBEDDING_MODEL,
+                throttle=self._aembedding_throttle(state["user_query"], state.get("user_id"), waits)
+            )
+        except Exception as e:
+            print(f"⚠️ 답변 캐시 조회 실패: {str(e)}")
+            return None, None
+        return self._finish_lookup(state, vector, embed_hit, started, sum(waits))
+
+    def _finish_lookup(self, state: dict, vector, embed_hit: bool, started: float,
+                       rate_limit_wait: float = 0.0) -> tuple:
+        scope = self._answer_scope(state)
+        value, similarity = self.answer_cache.lookup(vector, scope)
+        elapsed = time.perf_counter() - started
+        metrics = self._answer_cache_metrics(
+            elapsed, state, embed_hit, value is not None, similarity, rate_limit_wait
+        )
+        if value is not None:
+            return self._cached_result(state, value, similarity, metrics), None
+        return None, (vector, scope, metrics)
+
+    def _store_answer(self, result: dict, lookup: tuple):
+        """조회 측정값을 결과에 붙이고, 오류 없이 끝난 분석만 캐시에 저장"""
+        if lookup is None:
+            return
+        vector, scope, metrics = lookup
+        result["metrics"]["answer_cache"] = metrics
+        if not result.get("error") and result.get("final_analysis"):
+            self.answer_cache.put(vector, scope, {
+                "user_query": result["user_query"],
+                "market_data": result["market_data"],
+                "buffett_insights": result["buffett_insights"],
+                "buffett_principles": result.get("buffett_principles", []),
+                "final_analysis": result["final_analysis"],
+            })
+
+    def _flight_key(self, state: dict) -> str:
+        """동시 요청 병합 키 (종목 표현을 티커로 바꾼 질문 + 답변 캐시와 같은 범위)"""
+        raw = json.dumps([canonical_query(state["user_query"]), self._answer_scope(state)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _coalesced_result(state: dict, result: dict, waited: float) -> dict:
+        """같은 키로 먼저 시작한 분석의 결과를 이 요청용으로 복사"""
+        print(f"🔗 진행 중이던 같은 분석 결과 공유 ({waited:.2f}초 대기): {result['user_query']}")
+        return {
+            **copy.deepcopy(result),
+            "user_query": state["user_query"],
+            "node_timings": {"single_flight": waited, "total": waited},
+            "metrics": {"single_flight": node_metrics(waited, cache="hit")},
+            "coalesced_from": result["user_query"],
+        }
+
+    def _stream_coalesced(self, app, initial_state: dict, lookup: tuple, flight_key: str):
+        """스트리밍 분석의 동시 요청 병합 (프로세스 내)
+
+        리더는 토큰을 그대로 흘려보내고, 기다린 요청은 완성된 분석을 한 번에 받는다.
+        """
+        started = time.perf_counter()
+        call, leader, _ = self.single_flight.begin(flight_key)
+        if not leader:
+            result = self._coalesced_result(initial_state, call.wait(), time.perf_counter() - started)
+            self.emit_metrics(result)
+            yield "token", result["final_analysis"]
+            yield "result", result
+            return
+
+        finished = False
+        try:
+            for kind, payload in self._stream_workflow(app, initial_state, lookup):
+                if kind == "result":
+                    # 기다리는 요청은 마지막 이벤트를 소비하기 전에 바로 깨운다
+                    self.single_flight.finish(flight_key, call, payload)
+                    finished = True
+                yield kind, payload
+        except Exception as e:
+            if not finished:
+                self.single_flight.finish(flight_key, call, error=e)
+                finished = True
+            raise
+        finally:
+            if not finished:
+                # 소비자가 중간에 스트림을 닫은 경우
+                self.single_flight.finish(
+                    flight_key, call, error=RuntimeError("분석 스트림이 중단되었습니다")
+                )
+
+    def _stream_workflow(self, app, initial_state: dict, lookup: tuple = None):
+        """openai_analysis 노드의 LLM 토큰을 도착 즉시 전달"""
+        started = time.perf_counter()
+        first_token_at = None
+        result = initial_state
+
+        for mode, payload in app.stream(initial_state, stream_mode=["messages", "values"]):
+            if mode == "values":
+                result = payload
+                continue
+
+            chunk, metadata = payload
+            if metadata.get("langgraph_node") != "openai_analysis" or not chunk.content:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter() - started
+            yield "token", chunk.content
+
+        timings = result["node_timings"]
+        timings["total"] = time.perf_counter() - started
+        if first_token_at is not None:
+            timings["time_to_first_token"] = first_token_at
+        self.print_timings(timings)
+        self._store_answer(result, lookup)
+        result["metrics"]["single_flight"] = node_metrics(0.0, cache="miss")
+        self.emit_metrics(result)
 
         if result.get("error"):
             print(f"\n⚠️ 경고: {result['error']}")
+        if result.get("warnings"):
+            print(f"\nℹ️ 참고: {result['warnings']}")
 
-        return result
+        yield "result", result
+
+    def emit_metrics(self, result: dict):
+        """노드별 측정값을 등록된 sink 로 전달 (sink 오류는 분석에 영향 없음)"""
+        context = {
+            "user_query": result["user_query"],
+            "total_time": result["node_timings"].get("total", 0.0),
+            "error": result.get("error", ""),
+        }
+        for sink in self.metrics_sinks:
+            try:
+                sink.emit(result.get("metrics", {}), context)
+            except Exception as e:
+                print(f"⚠️ 메트릭 기록 실패 ({type(sink).__name__}): {str(e)}")
+
+    @staticmethod
+    def print_timings(timings: dict):
+        """노드별 소요 시간 및 병렬 실행으로 절약한 시간 출력"""
+        pplx = timings.get("perplexity_research", 0.0)
+        rag = timings.get("rag_wisdom", 0.0)
+        print(f"⏱️ Perplexity {pplx:.2f}초 | RAG {rag:.2f}초 | "
+              f"OpenAI {timings.get('openai_analysis', 0.0):.2f}초 | "
+              f"전체 {timings.get('total', 0.0):.2f}초 "
+              f"(병렬 실행 절약 {min(pplx, rag):.2f}초)")
+        if "time_to_first_token" in timings:
+            print(f"⚡ 첫 토큰까지 {timings['time_to_first_token']:.2f}초")
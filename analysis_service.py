@@ -0,0 +1,425 @@
+"""분석 작업 큐 HTTP 서비스 (워밍된 InvestmentAgent 하나를 여러 클라이언트가 공유)
+
+    POST /jobs               {"query": "...", "params": {...}, "user": "..."} -> 202 {"job_id", "status", "position"}
+                             큐가 가득 차면 429 + Retry-After
+    GET  /jobs/<id>          상태 (queued / running / done / failed, 대기 시간)
+    GET  /jobs/<id>/result   끝났으면 200 + 결과, 아직이면 202 + 상태, 없거나 보관 기간이 지났으면 404
+    GET  /health             큐 길이, 워커 수, 상태별 작업 수
+    GET  /metrics            Prometheus 텍스트 (노드별 측정값 + 작업 수 / 큐 대기 시간)
+
+워커 수는 공급자 분당 요청 한도에서 정한다 (--workers 로 직접 지정 가능).
+같은 한도로 공유 속도 제한을 걸고, user 별 공정 큐로 한 사용자의 대량 작업이 다른 사용자를 막지 않게 한다.
+
+    uv run python analysis_service.py --port 8000 --perplexity-rpm 50 --openai-rpm 500
+"""
+import os
+import json
+import math
+import time
+import uuid
+import queue
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+from agent import InvestmentAgent
+from app_session import DEFAULT_ANALYSIS_PARAMS
+from compact_index import INDEX_TYPES
+from metrics import LogSink, PrometheusSink
+from rate_limit import DEFAULT_USER, PROVIDERS, ProviderLimit, RateLimiter, SQLiteBudgetStore
+from retrieval import RETRIEVAL_MODES
+
+# 분석 한 건이 공급자별로 보내는 요청 수 (고정 검색어 임베딩은 인덱스에 캐시됨)
+CALLS_PER_ANALYSIS = {"perplexity": 1, "embeddings": 1, "openai": 1}
+DEFAULT_WORKERS = 4
+JOB_STATES = ("queued", "running", "done", "failed")
+
+
+def workers_for_quota(quotas: dict, analysis_seconds: float) -> int:
+    """공급자 분당 요청 한도(quotas)로 유지할 수 있는 동시 분석 수
+
+    리틀의 법칙: 동시 수 = 처리율 x 지연. 분석 한 건이 analysis_seconds 동안 공급자마다
+    CALLS_PER_ANALYSIS 만큼 요청하므로 가장 빡빡한 공급자가 워커 수를 정한다.
+    """
+    limits = [rpm / 60 / CALLS_PER_ANALYSIS[provider] * analysis_seconds
+              for provider, rpm in quotas.items() if rpm]
+    return max(1, math.floor(min(limits))) if limits else DEFAULT_WORKERS
+
+
+def validate_params(params: dict) -> dict:
+    """요청 파라미터 검증 (허용된 키만, 숫자만). 잘못되면 ValueError"""
+    unknown = set(params) - set(DEFAULT_ANALYSIS_PARAMS)
+    if unknown:
+        raise ValueError(f"지원하지 않는 파라미터: {', '.join(sorted(unknown))}")
+    checked = {}
+    for name, value in params.items():
+        default = DEFAULT_ANALYSIS_PARAMS[name]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{name} 는 숫자여야 합니다")
+        checked[name] = type(default)(value)
+    return checked
+
+
+class AnalysisService:
+    """크기 제한 작업 큐 + 워커 스레드 풀 + 결과 보관
+
+    모든 워커가 같은 에이전트(인덱스, 시장 데이터 / 답변 캐시, 요청 병합)를 공유한다.
+    끝난 작업은 retention 초 동안, 최대 max_retained 개까지 보관한다.
+    """
+
+    def __init__(self, agent: InvestmentAgent, workers: int = DEFAULT_WORKERS, max_queue: int = 100,
+                 retention: float = 3600, max_retained: int = 1000, sink: PrometheusSink = None):
+        self.agent = agent
+        self.workers = workers
+        self.retention = retention
+        self.max_retained = max_retained
+        self.sink = sink
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._finished = []
+        self._lock = threading.Lock()
+        self._threads = []
+        self._closed = False
+        # 최근 분석 시간 (Retry-After 추정용 지수 이동 평균)
+        self._service_time = None
+
+    def start(self) -> "AnalysisService":
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"analysis-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, wait: bool = True):
+        """새 작업을 받지 않고, 큐에 남은 작업을 끝낸 뒤 워커 종료"""
+        self._closed = True
+        self._signal_stop()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def submit(self, query: str, params: dict = None, user: str = DEFAULT_USER) -> dict:
+        """작업 등록. 큐가 가득 찼거나 종료 중이면 queue.Full"""
+        if self._closed:
+            raise queue.Full
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "query": query,
+            "user": user,
+            "params": params or {},
+            "status": "queued",
+            "submitted_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": "",
+        }
+        with self._lock:
+            self._expire(now)
+            self._jobs[job["job_id"]] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job["job_id"]]
+            self._count("rejected")
+            raise
+        self._count("submitted")
+        return self.describe(job["job_id"])
+
+    def get(self, job_id: str) -> dict:
+        """작업 스냅샷 (워커가 고치는 중인 dict 를 그대로 내주지 않는다)"""
+        with self._lock:
+            self._expire(time.time())
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def describe(self, job_id: str) -> dict:
+        """결과를 뺀 작업 상태 (없으면 None)"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        info = {k: v for k, v in job.items() if k not in ("result", "params")}
+        if job["started_at"] is not None:
+            info["queue_wait"] = job["started_at"] - job["submitted_at"]
+        if job["status"] == "queued":
+            with self._lock:
+                info["position"] = sum(1 for j in self._jobs.values()
+                                       if j["status"] == "queued" and j["submitted_at"] < job["submitted_at"])
+        return info
+
+    def retry_after(self) -> int:
+        """큐가 빌 때까지 예상 시간(초)"""
+        per_job = self._service_time or 1.0
+        return max(1, math.ceil(self._queue.qsize() * per_job / self.workers))
+
+    def health(self) -> dict:
+        with self._lock:
+            self._expire(time.time())
+            counts = {state: 0 for state in JOB_STATES}
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+        return {
+            "workers": self.workers,
+            "queue_size": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "jobs": counts,
+            "service_time_s": self._service_time,
+            "rate_limits": self.agent.rate_limiter.stats(),
+        }
+
+    def _signal_stop(self):
+        """종료 표시(None)를 큐 끝에 넣는다. 큐가 가득 차 있으면 작업을 하나 끝낸 워커가 다시 넣는다"""
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                # 다른 워커도 멈추도록 종료 표시를 다시 넣는다
+                self._signal_stop()
+                return
+            with self._lock:
+                job["started_at"] = started = time.time()
+                job["status"] = "running"
+            wait = started - job["submitted_at"]
+            if self.sink is not None:
+                self.sink.inc("stockking_job_queue_wait_seconds_sum", wait)
+                self.sink.inc("stockking_job_queue_wait_seconds_count")
+            try:
+                result = self.agent.analyze_stock(job["query"], user_id=job["user"], **job["params"])
+                update = {"result": result, "error": result.get("error", ""), "status": "done"}
+            except Exception as e:
+                update = {"error": f"{type(e).__name__}: {e}", "status": "failed"}
+                print(f"❌ 작업 실패 ({job['job_id'][:8]}): {update['error']}")
+            finished = time.time()
+            with self._lock:
+                job.update(update, finished_at=finished)
+                elapsed = finished - started
+                self._service_time = elapsed if self._service_time is None else (
+                    0.8 * self._service_time + 0.2 * elapsed
+                )
+                self._finished.append(job["job_id"])
+            self._count(update["status"])
+            if self._closed:
+                self._signal_stop()
+
+    def _expire(self, now: float):
+        """보관 기간이 지났거나 개수를 넘은 끝난 작업 삭제 (호출 측에서 _lock 보유)"""
+        while self._finished:
+            job = self._jobs.get(self._finished[0])
+            if job is not None and now - job["finished_at"] < self.retention \
+                    and len(self._finished) <= self.max_retained:
+                break
+            self._jobs.pop(self._finished.pop(0), None)
+
+    def _count(self, status: str):
+        if self.sink is not None:
+            self.sink.inc("stockking_jobs_total", status=status)
+
+
+class ServiceServer:
+    """AnalysisService 를 HTTP 로 노출 (백그라운드 스레드, 모든 요청이 JSON)"""
+
+    def __init__(self, service: AnalysisService, host: str = "127.0.0.1", port: int = 8000):
+        self.service = service
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}"
+        self._thread = None
+
+    def _handler(self):
+        service = self.service
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.rstrip("/") != "/jobs":
+                    self._send_json(404, {"error": f"unknown path {self.path}"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                    query = payload.get("query")
+                    if not isinstance(query, str) or not query.strip():
+                        raise ValueError("query 가 필요합니다")
+                    params = validate_params(payload.get("params") or {})
+                    user = payload.get("user") or DEFAULT_USER
+                    if not isinstance(user, str):
+                        raise ValueError("user 는 문자열이어야 합니다")
+                except (ValueError, AttributeError) as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+                try:
+                    job = service.submit(query.strip(), params, user)
+                except queue.Full:
+                    retry = service.retry_after()
+                    self._send_json(429, {"error": "작업 큐가 가득 찼습니다", "retry_after": retry},
+                                    {"Retry-After": str(retry)})
+                    return
+                self._send_json(202, job, {"Location": f"/jobs/{job['job_id']}"})
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if parts == ["health"]:
+                    self._send_json(200, service.health())
+                elif parts == ["metrics"] and service.sink is not None:
+                    self._send_text(service.sink.render())
+                elif len(parts) == 2 and parts[0] == "jobs":
+                    job = service.describe(parts[1])
+                    self._send_json(200 if job else 404, job or {"error": "작업이 없거나 보관 기간이 지났습니다"})
+                elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+                    self._result(parts[1])
+                else:
+                    self._send_json(404, {"error": f"unknown path {self.path}"})
+
+            def _result(self, job_id: str):
+                job = service.get(job_id)
+                if job is None:
+                    self._send_json(404, {"error": "작업이 없거나 보관 기간이 지났습니다"})
+                elif job["status"] in ("queued", "running"):
+                    self._send_json(202, service.describe(job_id))
+                else:
+                    self._send_json(200, {**service.describe(job_id), "result": job["result"]})
+
+            def _send_json(self, status: int, body: dict, headers: dict = None):
+                data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+                self._send(status, "application/json", data, headers)
+
+            def _send_text(self, text: str):
+                self._send(200, "text/plain; version=0.0.4", text.encode("utf-8"))
+
+            def _send(self, status: int, content_type: str, data: bytes, headers: dict = None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "ServiceServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class AnalysisClient:
+    """서비스 클라이언트 (내부 도구 / 프런트엔드용)"""
+
+    def __init__(self, base_url: str = "http://127.0.0.1:8000", timeout: float = 10.0,
+                 user: str = DEFAULT_USER):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # 서비스의 공정 큐에서 차례를 나누는 단위 (도구 / 사용자 이름)
+        self.user = user
+        self.session = requests.Session()
+
+    def submit(self, query: str, **params) -> dict:
+        """작업 등록. 큐가 가득 차면 HTTPError (429, Retry-After 헤더에 예상 대기 초)"""
+        response = self.session.post(f"{self.base_url}/jobs",
+                                     json={"query": query, "params": params, "user": self.user},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def status(self, job_id: str) -> dict:
+        response = self.session.get(f"{self.base_url}/jobs/{job_id}", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def result(self, job_id: str, wait: float = None, poll: float = 0.5) -> dict:
+        """작업 결과 (wait 초 동안 끝날 때까지 폴링, 끝나지 않으면 TimeoutError)"""
+        deadline = None if wait is None else time.monotonic() + wait
+        while True:
+            response = self.session.get(f"{self.base_url}/jobs/{job_id}/result", timeout=self.timeout)
+            response.raise_for_status()
+            if response.status_code == 200:
+                return response.json()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"작업이 {wait}초 안에 끝나지 않았습니다: {job_id}")
+            time.sleep(poll)
+
+    def analyze(self, query: str, wait: float = 300, **params) -> dict:
+        """등록하고 결과까지 기다린 분석 결과 (InvestmentAgent.analyze_stock 과 같은 dict)"""
+        job = self.submit(query, **params)
+        return self.result(job["job_id"], wait=wait)["result"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="분석 작업 큐 HTTP 서비스")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--pdf", default="stockking.pdf", help="RAG용 PDF 경로")
+    parser.add_argument("--workers", type=int, help="워커 수 (기본: 공급자 한도로 계산)")
+    parser.add_argument("--perplexity-rpm", type=float, help="Perplexity 분당 요청 한도")
+    parser.add_argument("--openai-rpm", type=float, help="OpenAI chat 분당 요청 한도")
+    parser.add_argument("--embeddings-rpm", type=float, help="OpenAI 임베딩 분당 요청 한도")
+    parser.add_argument("--perplexity-tpm", type=float, help="Perplexity 분당 토큰 한도")
+    parser.add_argument("--openai-tpm", type=float, help="OpenAI chat 분당 토큰 한도")
+    parser.add_argument("--embeddings-tpm", type=float, help="OpenAI 임베딩 분당 토큰 한도")
+    parser.add_argument("--rate-limit-db", metavar="PATH",
+                        help="한도를 여러 프로세스가 나눠 쓸 SQLite 파일 (기본: 이 프로세스만)")
+    parser.add_argument("--analysis-seconds", type=float, default=20.0,
+                        help="분석 한 건의 예상 소요 시간 (워커 수 계산용)")
+    parser.add_argument("--max-queue", type=int, default=100, help="대기 작업 최대 수 (넘으면 429)")
+    parser.add_argument("--retention", type=float, default=3600, help="끝난 작업 결과 보관 시간(초)")
+    parser.add_argument("--max-retained", type=int, default=1000, help="보관할 끝난 작업 최대 수")
+    parser.add_argument("--index-type", default="flat", choices=INDEX_TYPES)
+    parser.add_argument("--retrieval", default="vector", choices=RETRIEVAL_MODES)
+    args = parser.parse_args()
+
+    workers = args.workers or workers_for_quota({
+        "perplexity": args.perplexity_rpm,
+        "openai": args.openai_rpm,
+        "embeddings": args.embeddings_rpm,
+    }, args.analysis_seconds)
+
+    # 플래그로 준 한도가 환경 변수({PROVIDER}_RPM / _TPM, RATE_LIMIT_DB) 보다 우선
+    from_env = RateLimiter.from_env()
+    limits = {**from_env.limits, **{
+        provider: ProviderLimit(getattr(args, f"{provider}_rpm"), getattr(args, f"{provider}_tpm"))
+        for provider in PROVIDERS
+        if getattr(args, f"{provider}_rpm") or getattr(args, f"{provider}_tpm")
+    }}
+    store = SQLiteBudgetStore(args.rate_limit_db) if args.rate_limit_db else from_env.store
+    rate_limiter = RateLimiter(limits, store)
+
+    sink = PrometheusSink()
+    agent = InvestmentAgent(
+        openai_api_key=os.environ.get("OPENAI_API_KEY"),
+        perplexity_api_key=os.environ.get("PERPLEXITY_API_KEY"),
+        pdf_path=args.pdf,
+        index_type=args.index_type,
+        retrieval_mode=args.retrieval,
+        metrics_sinks=[LogSink(), sink],
+        rate_limiter=rate_limiter
+    )
+    service = AnalysisService(agent, workers, args.max_queue, args.retention, args.max_retained, sink).start()
+    with ServiceServer(service, args.host, args.port) as server:
+        print(f"🛰️ 분석 서비스: {server.url} (워커 {workers}개, 큐 {args.max_queue}개)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            print("\n🛑 종료 중 (대기 중인 작업을 마칩니다)")
+        finally:
+            service.stop()
@@ -0,0 +1,79 @@
+import time
+import threading
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """의미가 비슷한 질문의 분석 결과 재사용 캐시 (메모리, 스레드 안전)
+
+    질문 임베딩의 코사인 유사도가 threshold 이상이고 ttl 초 안에 만든 결과면 적중.
+    scope(분석 파라미터, 검색 대상 인덱스 등)가 같은 항목끼리만 비교하고,
+    max_entries 를 넘으면 가장 오래 사용되지 않은 항목부터 삭제한다.
+    """
+
+    def __init__(self, threshold: float = 0.93, ttl: float = 900, max_entries: int = 500):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _purge(self, now: float):
+        self._entries = [e for e in self._entries if now - e["created"] <= self.ttl]
+
+    def lookup(self, vector, scope) -> tuple:
+        """(저장된 결과, 유사도) 또는 (None, 최고 유사도)"""
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            candidates = [e for e in self._entries if e["scope"] == scope]
+            best, best_score = None, 0.0
+            if candidates:
+                scores = np.stack([e["vector"] for e in candidates]) @ query
+                i = int(np.argmax(scores))
+                best, best_score = candidates[i], float(scores[i])
+
+            if best is None or best_score < self.threshold:
+                self.misses += 1
+                return None, best_score
+            self.hits += 1
+            best["last_used"] = now
+            return best["value"], best_score
+
+    def put(self, vector, scope, value: dict):
+        """결과 저장 후 크기 제한 적용"""
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            self._entries.append({
+                "vector": self._normalize(vector), "scope": scope, "value": value,
+                "created": now, "last_used": now,
+            })
+            if len(self._entries) > self.max_entries:
+                self._entries.sort(key=lambda e: e["last_used"], reverse=True)
+                del self._entries[self.max_entries:]
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+
+    def stats(self) -> dict:
+        """캐시 적중 통계"""
+        total = self.hits + self.misses
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": size,
+        }
@@ -0,0 +1,87 @@
+"""streamlit_app.py 한 세션의 동작 (로그인 · PDF 업로드 · 분석)
+
+Streamlit 없이도 호출할 수 있게 분리해 부하 테스트(loadtest_app.py)가 앱과 같은 코드를 실행한다.
+session 은 st.session_state 또는 dict, 코퍼스 / 캐시는 프로세스의 모든 세션이 공유한다.
+"""
+import uuid
+from agent import InvestmentAgent
+from corpus import LetterCorpus
+
+DEFAULT_ANALYSIS_PARAMS = {
+    "perplexity_max_tokens": 1500,
+    "perplexity_temperature": 0.2,
+    "openai_max_tokens": 2000,
+    "openai_temperature": 0.3,
+}
+
+
+def base_documents(corpus: LetterCorpus, pdf_path: str, embeddings) -> list:
+    """기본 PDF 를 코퍼스에 등록하고 내용 해시 목록 반환 (샤드가 디스크에 있으면 임베딩 없이 로드)"""
+    digest = corpus.add_pdf(pdf_path, embeddings)
+    return [digest] if digest else []
+
+
+def refresh_vector_store(session, corpus: LetterCorpus):
+    """기본 서한 + 이 세션에서 업로드한 서한의 샤드를 묶어 에이전트에 연결"""
+    agent = session["agent"]
+    digests = session["base_docs"] + session["uploaded_docs"]
+    agent.vector_store = corpus.view(agent.embeddings, digests) if digests else None
+
+
+def login(session, corpus: LetterCorpus, base_docs: list, openai_api_key: str,
+          perplexity_api_key: str, **agent_kwargs) -> InvestmentAgent:
+    """세션 전용 에이전트를 만들고 공유 코퍼스의 샤드를 연결"""
+    agent = InvestmentAgent(
+        openai_api_key=openai_api_key,
+        perplexity_api_key=perplexity_api_key,
+        **agent_kwargs
+    )
+    session["agent"] = agent
+    # 공유 속도 제한의 공정 큐에서 세션마다 따로 차례를 받는다
+    session["user_id"] = f"session-{uuid.uuid4().hex[:12]}"
+    session["base_docs"] = base_docs
+    session["uploaded_docs"] = []
+    refresh_vector_store(session, corpus)
+    session["logged_in"] = True
+    return agent
+
+
+def logout(session):
+    session["logged_in"] = False
+    session["agent"] = None
+    session["uploaded_docs"] = []
+
+
+def upload_pdf(session, corpus: LetterCorpus, data: bytes, name: str) -> str:
+    """업로드한 PDF 를 코퍼스에 추가하고 이 세션의 검색 대상에 포함 (텍스트가 없으면 None)
+
+    내용 해시로 저장하므로 같은 파일은 다시 임베딩하지 않는다.
+    """
+    digest = corpus.add_bytes(data, name, session["agent"].embeddings)
+    if digest and digest not in session["uploaded_docs"]:
+        session["uploaded_docs"].append(digest)
+        refresh_vector_store(session, corpus)
+    return digest
+
+
+def analysis_params(session) -> dict:
+    """사이드바 슬라이더 값 (파라미터 메뉴를 연 적이 없으면 기본값)"""
+    if "pplx_tokens" not in session:
+        return dict(DEFAULT_ANALYSIS_PARAMS)
+    return {
+        "perplexity_max_tokens": session["pplx_tokens"],
+        "perplexity_temperature": session["pplx_temp"],
+        "openai_max_tokens": session["openai_tokens"],
+        "openai_temperature": session["openai_temp"],
+    }
+
+
+def start_analysis(session, user_query: str):
+    """("token", 조각) ... ("result", 최종 상태) 이벤트 스트림
+
+    인덱스는 로그인/업로드 시 코퍼스에서 연결되므로 분석마다 다시 만들지 않는다.
+    """
+    agent = session["agent"]
+    agent.retrieval_mode = session.get("retrieval_mode", "vector")
+    return agent.analyze_stock(user_query=user_query, stream=True, user_id=session.get("user_id"),
+                               **analysis_params(session))
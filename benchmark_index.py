@@ -0,0 +1,145 @@
+"""FAISS 인덱스 형식별 recall@k / 검색 지연 / 크기 비교
+
+평면(float32) 인덱스의 정확한 검색 결과를 기준으로 각 압축 인덱스의 recall@k 를 잰다.
+검색어는 코퍼스 청크 벡터에서 무작위로 뽑는다.
+
+    uv run python benchmark_index.py --pdf stockking.pdf
+    uv run python benchmark_index.py --letters letters/ --k 5 --nprobe 1 4 16 --json bench.json
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+import faiss
+from langchain_openai import OpenAIEmbeddings
+from agent import build_vector_store, EMBEDDING_MODEL
+from rag_cache import RAGIndexCache
+from compact_index import INDEX_TYPES, compress_index, io_flags
+
+
+def load_vectors(pdf_paths: list, embeddings, rag_cache) -> np.ndarray:
+    """PDF 들의 청크 벡터 (rag_cache 가 있으면 캐시된 인덱스/청크 임베딩 재사용)"""
+    parts = []
+    for pdf_path in pdf_paths:
+        vector_store = build_vector_store(pdf_path, embeddings, rag_cache)
+        if vector_store is not None:
+            parts.append(vector_store.index.reconstruct_n(0, vector_store.index.ntotal))
+    return np.vstack(parts).astype(np.float32)
+
+
+def percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    """검색어 하나씩 검색한 지연(ms)과 recall@k, 배치 검색 처리량"""
+    latencies = []
+    found = []
+    for q in queries:
+        started = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append(ids[0])
+
+    started = time.perf_counter()
+    index.search(queries, k)
+    batch_time = time.perf_counter() - started
+
+    recall = np.mean([
+        len(set(f.tolist()) & set(t.tolist())) / k for f, t in zip(found, truth)
+    ])
+    return {
+        "recall_at_k": float(recall),
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p95": percentile(latencies, 95),
+        "latency_ms_p99": percentile(latencies, 99),
+        "batch_qps": len(queries) / batch_time if batch_time else 0.0,
+    }
+
+
+def run(vectors: np.ndarray, index_types: list, k: int, num_queries: int, nprobes: list,
+        seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    n, d = vectors.shape
+    queries = vectors[rng.choice(n, size=min(num_queries, n), replace=False)]
+    k = min(k, n)
+
+    flat = faiss.IndexFlatL2(d)
+    flat.add(vectors)
+    _, truth = flat.search(queries, k)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for index_type in index_types:
+            started = time.perf_counter()
+            index = compress_index(flat, index_type)
+            build_time = time.perf_counter() - started
+
+            # 실제 서비스처럼 파일에서 메모리 맵으로 다시 읽어 측정
+            path = os.path.join(tmp_dir, f"{index_type}.faiss")
+            faiss.write_index(index, path)
+            index = faiss.read_index(path, io_flags(index_type, mmap=True))
+
+            settings = [None]
+            if index_type.startswith("ivf"):
+                settings = sorted(set(min(p, index.nlist) for p in nprobes))
+            for nprobe in settings:
+                if nprobe is not None:
+                    index.nprobe = nprobe
+                row = {
+                    "index_type": index_type,
+                    "nprobe": nprobe,
+                    "vectors": n,
+                    "dim": d,
+                    "bytes": os.path.getsize(path),
+                    "build_seconds": build_time,
+                    **measure(index, queries, truth, k),
+                }
+                results.append(row)
+                print(f"{index_type:>6} nprobe={str(nprobe or '-'):>4} | "
+                      f"recall@{k} {row['recall_at_k']:.3f} | "
+                      f"p50 {row['latency_ms_p50']:.3f}ms p95 {row['latency_ms_p95']:.3f}ms | "
+                      f"{row['batch_qps']:.0f} qps | {row['bytes'] / 1024 ** 2:.1f}MB")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAISS 인덱스 형식별 recall / 지연 벤치마크")
+    parser.add_argument("--pdf", default="stockking.pdf", help="코퍼스 PDF")
+    parser.add_argument("--letters", metavar="DIR", help="PDF 디렉토리 (지정하면 --pdf 대신 전체 사용)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200, help="검색어 수")
+    parser.add_argument("--index-types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[1, 4, 16],
+                        help="IVF 계열에서 비교할 nprobe 값")
+    parser.add_argument("--fake-embeddings", action="store_true",
+                        help="API 호출 없이 임의 벡터로 실행 (캐시를 사용하지 않음)")
+    parser.add_argument("--json", metavar="PATH", help="결과를 JSON 으로 저장")
+    args = parser.parse_args()
+
+    if args.letters:
+        pdf_paths = [os.path.join(args.letters, f) for f in sorted(os.listdir(args.letters))
+                     if f.lower().endswith(".pdf")]
+    else:
+        pdf_paths = [args.pdf]
+
+    if args.fake_embeddings:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        # 가짜 벡터가 실제 임베딩 캐시에 섞이지 않도록 캐시 없이 만든다
+        embeddings, rag_cache = DeterministicFakeEmbedding(size=1536), None
+    else:
+        embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL,
+                                      api_key=os.environ.get("OPENAI_API_KEY"))
+        rag_cache = RAGIndexCache()
+
+    vectors = load_vectors(pdf_paths, embeddings, rag_cache)
+    print(f"\n📐 벡터 {vectors.shape[0]}개 x {vectors.shape[1]}차원, "
+          f"검색어 {min(args.queries, vectors.shape[0])}개, k={args.k}\n")
+    results = run(vectors, args.index_types, args.k, args.queries, args.nprobe)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ 결과 저장: {args.json}")
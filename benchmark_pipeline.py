@@ -0,0 +1,319 @@
+"""파이프라인 오프라인 벤치마크 (로컬 스텁 Perplexity / OpenAI 서버)
+
+API 키나 네트워크 없이 initialize_rag 와 analyze_stock 를 실제 HTTP 경로로 실행하고
+시나리오별 p50/p95/p99 지연, 처리량, 최대 RSS 를 JSON 으로 남긴다.
+커밋마다 같은 설정으로 돌려 --baseline 으로 이전 결과와 비교한다.
+
+    uv run python benchmark_pipeline.py --json bench.json
+    uv run python benchmark_pipeline.py --profile realistic --latency-scale 0.2 --baseline bench.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from agent import InvestmentAgent, EMBEDDING_MODEL
+from metrics import tokenizer_available
+from market_cache import MarketDataCache
+from ticker_resolver import COMPANIES
+from stub_providers import PROFILES, StubServer
+
+SCENARIOS = ("rag_cold", "rag_warm", "analyze", "analyze_concurrent", "analyze_stream",
+             "analyze_async", "answer_cache_hit")
+# 질문마다 다른 종목을 써서 시장 데이터 / 답변 캐시 / 요청 병합에 걸리지 않게 한다
+QUERIES = [f"{english[0].title()} 주식 분석" for _, _, english, _ in COMPANIES]
+
+
+def make_agent(stub, pdf_path: str = None, **kwargs) -> InvestmentAgent:
+    """스텁 서버(또는 카세트 재생 서버)로 요청하는 에이전트"""
+    agent = InvestmentAgent(
+        openai_api_key="sk-stub", perplexity_api_key="pplx-stub",
+        openai_base_url=stub.openai_url, perplexity_base_url=stub.perplexity_url,
+        metrics_sinks=[], **kwargs
+    )
+    if not tokenizer_available(EMBEDDING_MODEL):
+        # tiktoken 인코딩 파일을 받을 수 없으면 (오프라인) 청크 문자열을 그대로 보낸다
+        agent.embeddings.check_embedding_ctx_length = False
+    if pdf_path:
+        agent.initialize_rag(pdf_path)
+    return agent
+
+
+def current_rss() -> int:
+    """현재 RSS (bytes, /proc 이 없으면 지금까지의 최대값)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if platform.system() == "Darwin" else peak * 1024
+
+
+class RSSSampler:
+    """시나리오 동안 RSS 를 주기적으로 읽어 최대값 기록"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start_rss = self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def summarize(name: str, latencies: list, wall: float, errors: int, sampler: RSSSampler,
+              **extra) -> dict:
+    return {
+        "scenario": name,
+        "runs": len(latencies),
+        "errors": errors,
+        "latency_s_p50": percentile(latencies, 50),
+        "latency_s_p95": percentile(latencies, 95),
+        "latency_s_p99": percentile(latencies, 99),
+        "latency_s_mean": float(np.mean(latencies)) if latencies else 0.0,
+        "throughput_per_s": len(latencies) / wall if wall else 0.0,
+        "wall_s": wall,
+        "rss_start_mb": sampler.start_rss / 1024 ** 2,
+        "rss_peak_mb": sampler.peak / 1024 ** 2,
+        **extra,
+    }
+
+
+def timed(fn) -> tuple:
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+class Benchmark:
+    def __init__(self, stub: StubServer, pdf_path: str, iterations: int, concurrency: int,
+                 work_dir: str):
+        self.stub = stub
+        self.pdf_path = pdf_path
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.work_dir = work_dir
+        self.rag_cache_dir = None
+        self.vector_store = None
+        self._started = 0.0
+
+    def queries(self, count: int, offset: int = 0) -> list:
+        return [QUERIES[(offset + i) % len(QUERIES)] for i in range(count)]
+
+    def analysis_agent(self) -> InvestmentAgent:
+        """매 분석이 전체 파이프라인을 타도록 시장 데이터 / 답변 캐시를 끈 에이전트"""
+        agent = make_agent(self.stub, rag_cache_dir=None, vector_store=self.vector_store,
+                           market_cache=MarketDataCache(ttl=0, stale_ttl=0))
+        agent.answer_cache = None
+        return agent
+
+    def rag(self, warm: bool) -> tuple:
+        """cold: 빈 캐시 디렉토리에서 인덱스 생성, warm: 마지막 cold 결과를 디스크 캐시에서 로드"""
+        latencies = []
+        for _ in range(self.iterations if warm else min(3, self.iterations)):
+            if not warm:
+                # 인덱스 캐시와 청크 임베딩 캐시 모두 비운 상태에서 시작
+                self.rag_cache_dir = tempfile.mkdtemp(dir=self.work_dir)
+            agent = make_agent(self.stub, rag_cache_dir=self.rag_cache_dir)
+            elapsed, _ = timed(lambda: agent.initialize_rag(self.pdf_path))
+            latencies.append(elapsed)
+            self.vector_store = agent.vector_store
+        return latencies, 0, {"chunks": self.vector_store.index.ntotal if self.vector_store else 0}
+
+    def analyze(self, offset: int) -> tuple:
+        agent = self.analysis_agent()
+        latencies, errors = [], 0
+        for query in self.queries(self.iterations, offset):
+            elapsed, result = timed(lambda: agent.analyze_stock(query))
+            latencies.append(elapsed)
+            errors += bool(result.get("error"))
+        return latencies, errors, {}
+
+    def analyze_concurrent(self, offset: int) -> tuple:
+        agent = self.analysis_agent()
+
+        def run(query):
+            return timed(lambda: agent.analyze_stock(query))
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            outcomes = list(pool.map(run, self.queries(self.iterations, offset)))
+        return ([e for e, _ in outcomes], sum(bool(r.get("error")) for _, r in outcomes),
+                {"concurrency": self.concurrency})
+
+    def analyze_stream(self, offset: int) -> tuple:
+        agent = self.analysis_agent()
+        latencies, first_tokens, errors = [], [], 0
+        for query in self.queries(self.iterations, offset):
+            started = time.perf_counter()
+            first = None
+            for kind, payload in agent.analyze_stock(query, stream=True):
+                if kind == "token" and first is None:
+                    first = time.perf_counter() - started
+                elif kind == "result":
+                    errors += bool(payload.get("error"))
+            latencies.append(time.perf_counter() - started)
+            first_tokens.append(first or 0.0)
+        return latencies, errors, {
+            "first_token_s_p50": percentile(first_tokens, 50),
+            "first_token_s_p95": percentile(first_tokens, 95),
+        }
+
+    def analyze_async(self, offset: int) -> tuple:
+        agent = self.analysis_agent()
+        latencies = []
+
+        async def run(query):
+            started = time.perf_counter()
+            result = await agent.aanalyze_stock(query)
+            latencies.append(time.perf_counter() - started)
+            return result
+
+        async def main():
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def bounded(query):
+                async with semaphore:
+                    return await run(query)
+
+            async with agent.perplexity_client.async_session():
+                return await asyncio.gather(*(bounded(q) for q in self.queries(self.iterations, offset)))
+
+        results = asyncio.run(main())
+        return latencies, sum(bool(r.get("error")) for r in results), {"concurrency": self.concurrency}
+
+    def answer_cache_hit(self, offset: int) -> tuple:
+        """같은 질문 반복 (첫 실행 후 답변 캐시 적중 경로)"""
+        agent = make_agent(self.stub, rag_cache_dir=None, vector_store=self.vector_store)
+        query = self.queries(1, offset)[0]
+        agent.analyze_stock(query)
+        # 처리량은 캐시를 채운 첫 실행을 빼고 계산
+        self._started = time.perf_counter()
+        latencies, errors = [], 0
+        for _ in range(self.iterations):
+            elapsed, result = timed(lambda: agent.analyze_stock(query))
+            latencies.append(elapsed)
+            errors += not result.get("cached_from")
+        return latencies, errors, {}
+
+    def run(self, name: str, offset: int) -> dict:
+        if name in ("rag_cold", "rag_warm"):
+            fn = lambda: self.rag(warm=name == "rag_warm")
+        else:
+            fn = lambda: getattr(self, name)(offset)
+        with RSSSampler() as sampler:
+            self._started = time.perf_counter()
+            latencies, errors, extra = fn()
+            wall = time.perf_counter() - self._started
+        return summarize(name, latencies, wall, errors, sampler, **extra)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: list, baseline: dict):
+    """이전 결과 대비 p50 / p95 / 처리량 / RSS 변화율"""
+    previous = {r["scenario"]: r for r in baseline.get("scenarios", [])}
+    print(f"\n📊 기준 결과 대비 ({baseline.get('revision') or '알 수 없음'})")
+    for row in results:
+        old = previous.get(row["scenario"])
+        if old is None:
+            continue
+        changes = []
+        for key, label in (("latency_s_p50", "p50"), ("latency_s_p95", "p95"),
+                           ("throughput_per_s", "처리량"), ("rss_peak_mb", "RSS")):
+            if old.get(key):
+                changes.append(f"{label} {(row[key] - old[key]) / old[key]:+.1%}")
+        print(f"  {row['scenario']:>18} | " + " | ".join(changes))
+
+
+def print_row(row: dict):
+    print(f"{row['scenario']:>18} | n={row['runs']:<3} err={row['errors']:<2} | "
+          f"p50 {row['latency_s_p50'] * 1000:8.1f}ms p95 {row['latency_s_p95'] * 1000:8.1f}ms "
+          f"p99 {row['latency_s_p99'] * 1000:8.1f}ms | {row['throughput_per_s']:7.2f}/s | "
+          f"RSS {row['rss_peak_mb']:.0f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="스텁 공급자로 파이프라인 지연 / 처리량 / 메모리 측정")
+    parser.add_argument("--pdf", default="stockking.pdf", help="RAG 인덱스용 PDF")
+    parser.add_argument("--profile", default="fast", choices=sorted(PROFILES),
+                        help="스텁 지연 프로필 (기본: fast)")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="프로필 지연에 곱할 배율 (realistic 을 빠르게 돌릴 때 0.1 등)")
+    parser.add_argument("--error-rate", type=float, help="스텁이 429 를 돌려줄 비율 (프로필 값 대신)")
+    parser.add_argument("--iterations", type=int, default=20, help="시나리오별 실행 수")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시 실행 시나리오의 동시 수")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--json", metavar="PATH", help="결과를 JSON 으로 저장")
+    parser.add_argument("--baseline", metavar="PATH", help="비교할 이전 결과 JSON")
+    parser.add_argument("--verbose", action="store_true", help="에이전트 로그 출력")
+    args = parser.parse_args()
+
+    profile = dict(PROFILES[args.profile])
+    if args.error_rate is not None:
+        profile["error_rate"] = args.error_rate
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir, StubServer(profile, args.latency_scale) as stub:
+        bench = Benchmark(stub, args.pdf, args.iterations, args.concurrency, work_dir)
+        scenarios = list(args.scenarios)
+        # 분석 시나리오는 인덱스가 필요하므로 rag_cold 를 항상 먼저 실행
+        if "rag_cold" not in scenarios:
+            scenarios.insert(0, "rag_cold")
+        print(f"🧪 스텁 프로필 {args.profile} (x{args.latency_scale}) | {stub.url}\n")
+        for i, name in enumerate(sorted(scenarios, key=SCENARIOS.index)):
+            with open(os.devnull, "w") as devnull, redirect_stdout(sys.stdout if args.verbose else devnull):
+                row = bench.run(name, offset=i * args.iterations)
+            if name in args.scenarios:
+                results.append(row)
+                print_row(row)
+        provider_stats = dict(stub.provider.stats)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "profile": args.profile,
+        "profile_settings": profile,
+        "latency_scale": args.latency_scale,
+        "iterations": args.iterations,
+        "concurrency": args.concurrency,
+        "provider_requests": provider_stats,
+        "scenarios": results,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ 결과 저장: {args.json}")
@@ -0,0 +1,75 @@
+import re
+import math
+import heapq
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# 거의 모든 청크에 나오는 단어는 점수에 기여하지 않고 게시 목록만 길게 만든다
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he in is it its of on or our "
+    "that the their this to was we were which will with you".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """소문자 단어 토큰 (영문/숫자/한글)"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """청크 텍스트 BM25 역색인 (문서 번호 = FAISS 벡터 id)
+
+    임베딩 호출 없이 로컬에서만 검색하므로 네트워크 지연이 없다.
+    """
+
+    def __init__(self, postings: dict, doc_lengths: list, k1: float = 1.5, b: float = 0.75):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        n = len(doc_lengths)
+        avg_length = (sum(doc_lengths) / n) if n else 0.0
+        # 문서 길이 정규화 항은 검색마다 같으므로 미리 계산
+        self._norms = [
+            k1 * (1 - b + b * length / avg_length) if avg_length else k1
+            for length in doc_lengths
+        ]
+        self._idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, (docs, _) in postings.items()
+        }
+
+    @classmethod
+    def build(cls, texts: list, **kwargs) -> "BM25Index":
+        """텍스트 목록으로 역색인 생성"""
+        postings = {}
+        doc_lengths = []
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                docs, tfs = postings.setdefault(term, ([], []))
+                docs.append(i)
+                tfs.append(tf)
+        return cls(postings, doc_lengths, **kwargs)
+
+    def search(self, query: str, k: int = 2) -> list:
+        """(문서 번호, 점수) 상위 k 개"""
+        scores = {}
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            idf = self._idf[term]
+            for doc, tf in zip(*entry):
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / (tf + self._norms[doc])
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def to_dict(self) -> dict:
+        return {"k1": self.k1, "b": self.b, "doc_lengths": self.doc_lengths,
+                "postings": {term: [docs, tfs] for term, (docs, tfs) in self.postings.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        postings = {term: (docs, tfs) for term, (docs, tfs) in data["postings"].items()}
+        return cls(postings, data["doc_lengths"], data.get("k1", 1.5), data.get("b", 0.75))
@@ -0,0 +1,413 @@
+"""Perplexity / OpenAI 요청 녹화 · 재생 (카세트)
+
+record: 로컬 프록시가 요청을 실제 API 로 넘기고 응답과 시간(스트리밍은 이벤트별)을 카세트에 기록
+replay: 같은 요청이 오면 기록된 응답을 돌려준다 (기록된 지연 그대로, 배율, 또는 즉시)
+
+카세트는 한 줄에 한 건인 gzip JSONL 이다. 요청 본문은 키(해시)만 남기고,
+임베딩 응답은 OpenAI SDK 가 받는 base64 그대로 저장해 크기를 줄인다.
+분석 단위 기록(CassetteSink)이 함께 있으면 하루치 질문을 새 빌드에 그대로 다시 돌릴 수 있다.
+
+    uv run python main.py --batch watchlist.csv --cassette day.cassette.gz --cassette-mode record
+    uv run python cassette.py replay day.cassette.gz --speed 0 --json replay.json
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import httpx
+from perplexity_client import DEFAULT_BASE_URL as PERPLEXITY_BASE_URL
+from stub_providers import embedding_vector
+
+CASSETTE_VERSION = 1
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+MODES = ("record", "replay")
+# 응답과 함께 돌려줄 헤더 (나머지는 전송 계층 헤더라 다시 만든다)
+KEPT_HEADERS = ("content-type", "retry-after")
+
+
+def request_key(provider: str, path: str, body: bytes) -> str:
+    """공급자 + 경로 + 정규화한 JSON 본문 해시"""
+    try:
+        canonical = json.dumps(json.loads(body or b"{}"), sort_keys=True, ensure_ascii=False)
+    except ValueError:
+        canonical = body.decode("utf-8", "replace")
+    return hashlib.sha256(f"{provider} {path} {canonical}".encode("utf-8")).hexdigest()
+
+
+def _summary(body: bytes) -> dict:
+    """카세트에 남길 요청 요약 (본문 전체 대신)"""
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return {}
+    summary = {"model": payload.get("model", ""), "stream": bool(payload.get("stream"))}
+    if "input" in payload:
+        inputs = payload["input"]
+        summary["inputs"] = 1 if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)) else len(inputs)
+        summary["dimensions"] = payload.get("dimensions")
+    return summary
+
+
+class Cassette:
+    """카세트 파일 (기록은 스레드 안전하게 한 줄씩 추가)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = []
+        self._file = None
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        cassette = cls(path)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    cassette.entries.append(json.loads(line))
+        return cassette
+
+    def open(self):
+        """기록 시작 (기존 파일이 있으면 이어서 추가)"""
+        self._file = gzip.open(self.path, "at", encoding="utf-8")
+        self.append({"kind": "header", "version": CASSETTE_VERSION, "created": self._started})
+
+    def offset(self) -> float:
+        """기록 시작 후 경과 시간 (재생 시 도착 간격에 사용)"""
+        return time.time() - self._started
+
+    def append(self, entry: dict):
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self.entries.append(entry)
+            if self._file is not None:
+                self._file.write(line + "\n")
+                # 중간에 프로세스가 죽어도 기록한 요청까지는 읽을 수 있게
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def interactions(self) -> list:
+        return [e for e in self.entries if e.get("kind") == "http"]
+
+    def analyses(self) -> list:
+        return [e for e in self.entries if e.get("kind") == "analysis"]
+
+
+class CassetteSink:
+    """분석마다 질문과 도착 시각을 카세트에 기록하는 metrics sink (재생할 질문 목록)"""
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    def emit(self, metrics: dict, context: dict):
+        total = context.get("total_time", 0.0)
+        self.cassette.append({
+            "kind": "analysis",
+            "query": context["user_query"],
+            # 분석이 시작된 시각 = 끝난 시각 - 소요 시간
+            "at": self.cassette.offset() - total,
+            "total_time": total,
+            "error": context.get("error", ""),
+        })
+
+
+class CassetteServer:
+    """녹화 / 재생 프록시 (/openai/... 와 /perplexity/... 를 각 공급자로)
+
+    with CassetteServer(Cassette.load(path), "replay", speed=0) as server:
+        agent = InvestmentAgent(..., openai_base_url=server.openai_url,
+                                perplexity_base_url=server.perplexity_url)
+
+    speed: 재생 지연 배율 (1 = 기록된 지연, 0 = 즉시)
+    replay 에서 정확히 같은 요청이 없으면 같은 공급자/경로/모델의 기록을 순서대로 돌려쓰고,
+    임베딩은 결정적 벡터를 만들어 준다. 몇 건이 그렇게 대체됐는지 stats 에 남는다.
+    """
+
+    def __init__(self, cassette: Cassette, mode: str = "replay", speed: float = 1.0,
+                 upstreams: dict = None, host: str = "127.0.0.1", port: int = 0):
+        if mode not in MODES:
+            raise ValueError(f"지원하지 않는 카세트 모드: {mode} (가능: {', '.join(MODES)})")
+        self.cassette = cassette
+        self.mode = mode
+        self.speed = speed
+        self.upstreams = upstreams or {
+            "openai": os.environ.get("OPENAI_BASE_URL", OPENAI_BASE_URL),
+            "perplexity": os.environ.get("PERPLEXITY_BASE_URL", PERPLEXITY_BASE_URL),
+        }
+        self.stats = {"recorded": 0, "exact": 0, "fallback": 0, "synthesized": 0, "missing": 0}
+        self._lock = threading.Lock()
+        self._client = httpx.Client(timeout=httpx.Timeout(120.0, connect=10.0)) if mode == "record" else None
+        self._by_key = {}
+        self._by_route = {}
+        if mode == "replay":
+            for entry in cassette.interactions():
+                self._by_key.setdefault(entry["key"], deque()).append(entry)
+                self._by_route.setdefault(self._route(entry), deque()).append(entry)
+
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}"
+        self.openai_url = f"{self.url}/openai"
+        self.perplexity_url = f"{self.url}/perplexity"
+
+    @staticmethod
+    def _route(entry: dict) -> tuple:
+        return entry["provider"], entry["path"], entry["request"].get("model", "")
+
+    def _next(self, queue: deque) -> dict:
+        """같은 요청이 여러 번 기록됐으면 순서대로, 다 쓰면 마지막 것을 반복"""
+        with self._lock:
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def lookup(self, provider: str, path: str, body: bytes) -> dict:
+        """재생할 기록 (없으면 None)"""
+        queue = self._by_key.get(request_key(provider, path, body))
+        if queue:
+            self._count("exact")
+            return self._next(queue)
+        summary = _summary(body)
+        if path.endswith("/embeddings"):
+            return None
+        queue = self._by_route.get((provider, path, summary.get("model", "")))
+        if queue:
+            self._count("fallback")
+            return self._next(queue)
+        return None
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                provider, _, path = self.path.lstrip("/").partition("/")
+                path = "/" + path
+                if provider not in server.upstreams:
+                    self._send(404, {"content-type": "application/json"},
+                               json.dumps({"error": {"message": f"unknown provider {provider}"}}).encode())
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if server.mode == "record":
+                    self._record(provider, path, body)
+                else:
+                    self._replay(provider, path, body)
+
+            def _record(self, provider: str, path: str, body: bytes):
+                headers = {k: v for k, v in self.headers.items()
+                           if k.lower() in ("authorization", "content-type", "accept", "openai-organization")}
+                url = server.upstreams[provider].rstrip("/") + path
+                at = server.cassette.offset()
+                started = time.perf_counter()
+                with server._client.stream("POST", url, content=body, headers=headers) as response:
+                    kept = {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS}
+                    entry = {
+                        "kind": "http", "provider": provider, "path": path,
+                        "key": request_key(provider, path, body), "request": _summary(body),
+                        "at": at, "status": response.status_code, "headers": kept,
+                    }
+                    if "text/event-stream" in response.headers.get("content-type", ""):
+                        # 스트리밍은 이벤트 줄마다 도착 시각을 남겨 첫 토큰 지연까지 재현
+                        self._start_stream(response.status_code, kept)
+                        events = []
+                        for line in response.iter_lines():
+                            events.append([time.perf_counter() - started, line])
+                            self.wfile.write(line.encode("utf-8") + b"\n")
+                            self.wfile.flush()
+                        entry["events"] = events
+                    else:
+                        content = response.read()
+                        entry["body"] = content.decode("utf-8", "replace")
+                        self._send(response.status_code, kept, content)
+                entry["elapsed"] = time.perf_counter() - started
+                server.cassette.append(entry)
+                server._count("recorded")
+
+            def _replay(self, provider: str, path: str, body: bytes):
+                entry = server.lookup(provider, path, body)
+                if entry is None and path.endswith("/embeddings"):
+                    self._synthesize_embeddings(body)
+                    return
+                if entry is None:
+                    server._count("missing")
+                    self._send(404, {"content-type": "application/json"},
+                               json.dumps({"error": {"message": "request not in cassette"}}).encode())
+                    return
+
+                if "events" not in entry:
+                    time.sleep(entry["elapsed"] * server.speed)
+                    self._send(entry["status"], entry["headers"], entry["body"].encode("utf-8"))
+                    return
+                self._start_stream(entry["status"], entry["headers"])
+                started = time.perf_counter()
+                for offset, line in entry["events"]:
+                    wait = offset * server.speed - (time.perf_counter() - started)
+                    if wait > 0:
+                        time.sleep(wait)
+                    self.wfile.write(line.encode("utf-8") + b"\n")
+                    self.wfile.flush()
+
+            def _synthesize_embeddings(self, body: bytes):
+                """새 빌드가 녹화 때와 다른 청크를 임베딩하면 결정적 벡터로 대신 응답"""
+                server._count("synthesized")
+                payload = json.loads(body or b"{}")
+                inputs = payload.get("input", [])
+                if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                    inputs = [inputs]
+                dim = payload.get("dimensions") or 1536
+                data = {
+                    "object": "list", "model": payload.get("model", ""),
+                    "data": [{"object": "embedding", "index": i, "embedding": embedding_vector(item, dim)}
+                             for i, item in enumerate(inputs)],
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                }
+                self._send(200, {"content-type": "application/json"}, json.dumps(data).encode("utf-8"))
+
+            def _start_stream(self, status: int, headers: dict):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+            def _send(self, status: int, headers: dict, content: bytes):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "CassetteServer":
+        if self.mode == "record":
+            self.cassette.open()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._client is not None:
+            self._client.close()
+        self.cassette.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def replay(path: str, speed: float, concurrency: int, pace: bool, pdf_path: str) -> dict:
+    """카세트의 분석을 새 빌드로 다시 실행하고 지연 분포 반환"""
+    from concurrent.futures import ThreadPoolExecutor
+    from benchmark_pipeline import RSSSampler, make_agent, summarize
+
+    cassette = Cassette.load(path)
+    analyses = sorted(cassette.analyses(), key=lambda a: a["at"])
+    if not analyses:
+        raise ValueError(f"카세트에 분석 기록이 없습니다: {path}")
+
+    with CassetteServer(cassette, "replay", speed) as server:
+        # 캐시는 새 빌드의 동작 그대로 둔다 (녹화 때 캐시에 걸린 질문은 요청 없이 끝난다)
+        agent = make_agent(server, pdf_path=pdf_path)
+        latencies, errors = [], 0
+        lock = threading.Lock()
+        started = time.perf_counter()
+
+        def run(entry):
+            nonlocal errors
+            if pace:
+                # 녹화 당시 도착 간격 (speed 배율) 을 지킨다
+                wait = (entry["at"] - analyses[0]["at"]) * speed - (time.perf_counter() - started)
+                if wait > 0:
+                    time.sleep(wait)
+            began = time.perf_counter()
+            result = agent.analyze_stock(entry["query"])
+            with lock:
+                latencies.append(time.perf_counter() - began)
+                errors += bool(result.get("error"))
+
+        with RSSSampler() as sampler:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(run, analyses))
+            wall = time.perf_counter() - started
+
+        recorded = [a["total_time"] for a in analyses]
+        return summarize("replay", latencies, wall, errors, sampler, speed=speed,
+                         recorded_latency_s_mean=sum(recorded) / len(recorded),
+                         requests=dict(server.stats))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perplexity / OpenAI 요청 녹화 · 재생")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    record = sub.add_parser("record", help="녹화 프록시 실행 (앱의 base URL 을 프록시로 지정)")
+    record.add_argument("cassette", help="카세트 파일 (.cassette.gz, 있으면 이어서 기록)")
+    record.add_argument("--port", type=int, default=8787)
+
+    play = sub.add_parser("replay", help="카세트의 분석을 오프라인으로 다시 실행")
+    play.add_argument("cassette")
+    play.add_argument("--speed", type=float, default=1.0, help="지연 배율 (1: 녹화 그대로, 0: 즉시)")
+    play.add_argument("--concurrency", type=int, default=1, help="동시 분석 수")
+    play.add_argument("--pace", action="store_true", help="녹화 당시 질문 도착 간격 재현")
+    play.add_argument("--pdf", default="stockking.pdf", help="RAG용 PDF 경로")
+    play.add_argument("--json", metavar="PATH", help="결과를 JSON 으로 저장")
+    play.add_argument("--verbose", action="store_true", help="에이전트 로그 출력")
+
+    serve = sub.add_parser("serve", help="재생 프록시만 실행 (다른 프로세스가 오프라인으로 호출)")
+    serve.add_argument("cassette")
+    serve.add_argument("--port", type=int, default=8787)
+    serve.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.command in ("record", "serve"):
+        if args.command == "record":
+            server = CassetteServer(Cassette(args.cassette), "record", port=args.port)
+        else:
+            server = CassetteServer(Cassette.load(args.cassette), "replay", args.speed, port=args.port)
+        server.start()
+        print(f"📼 {args.command} 프록시: {server.url}")
+        print(f"   OPENAI_BASE_URL={server.openai_url} PERPLEXITY_BASE_URL={server.perplexity_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            print(f"\n📼 {server.stats}")
+    else:
+        from contextlib import redirect_stdout
+        with open(os.devnull, "w") as devnull, redirect_stdout(sys.stdout if args.verbose else devnull):
+            row = replay(args.cassette, args.speed, args.concurrency, args.pace, args.pdf)
+        print(f"📼 재생 {row['runs']}건 (err={row['errors']}) | p50 {row['latency_s_p50'] * 1000:.1f}ms "
+              f"p95 {row['latency_s_p95'] * 1000:.1f}ms p99 {row['latency_s_p99'] * 1000:.1f}ms | "
+              f"{row['throughput_per_s']:.2f}/s | RSS {row['rss_peak_mb']:.0f}MB")
+        print(f"   요청: {row['requests']}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(row, f, ensure_ascii=False, indent=2)
+            print(f"\n✅ 결과 저장: {args.json}")
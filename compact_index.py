@@ -0,0 +1,62 @@
+import math
+import faiss
+
+# flat: float32 그대로 / fp16, sq8: 스칼라 양자화 / ivf, ivfpq: 역파일 (+ 곱 양자화)
+INDEX_TYPES = ("flat", "fp16", "sq8", "ivf", "ivfpq")
+
+
+def default_nlist(n: int) -> int:
+    """IVF 클러스터 수 (학습에 클러스터당 39개 이상의 벡터가 필요)"""
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def default_pq_m(d: int) -> int:
+    """PQ 부분 벡터 수 (d 의 약수 중 부분 벡터당 16차원 이상이 되는 가장 큰 값)"""
+    for m in range(max(1, d // 16), 0, -1):
+        if d % m == 0:
+            return m
+    return 1
+
+
+def compress_index(index, index_type: str = "flat", nlist: int = None, pq_m: int = None,
+                   nbits: int = 8, nprobe: int = None):
+    """평면 인덱스의 벡터로 압축 인덱스를 새로 만든다 (벡터 id 순서는 그대로)"""
+    if index_type == "flat":
+        return index
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"지원하지 않는 인덱스 형식: {index_type} (가능: {', '.join(INDEX_TYPES)})")
+
+    d, n, metric = index.d, index.ntotal, index.metric_type
+    vectors = index.reconstruct_n(0, n)
+
+    if index_type == "fp16":
+        compact = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16, metric)
+    elif index_type == "sq8":
+        compact = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, metric)
+        compact.train(vectors)
+    else:
+        nlist = nlist or default_nlist(n)
+        quantizer = faiss.IndexFlat(d, metric)
+        if index_type == "ivf":
+            compact = faiss.IndexIVFFlat(quantizer, d, nlist, metric)
+        else:
+            # 코드북 크기(2^nbits)가 학습 벡터 수보다 클 수 없다
+            nbits = min(nbits, max(1, int(math.log2(n))))
+            compact = faiss.IndexIVFPQ(quantizer, d, nlist, pq_m or default_pq_m(d), nbits, metric)
+        compact.train(vectors)
+        compact.nprobe = nprobe or max(1, nlist // 8)
+
+    compact.add(vectors)
+    return compact
+
+
+def io_flags(index_type: str = "flat", mmap: bool = False) -> int:
+    """faiss.read_index 플래그. mmap=True 이면 벡터를 메모리 맵으로 열어 여러 프로세스가
+    OS 페이지 캐시를 공유한다 (IVF 는 역파일 목록, 그 외는 벡터 배열을 매핑)"""
+    if not mmap:
+        return 0
+    if index_type.startswith("ivf"):
+        return faiss.IO_FLAG_MMAP
+    # 오래된 faiss 에는 평면 코드 매핑 플래그가 없다
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
@@ -0,0 +1,29 @@
+# conftest.py
+import pytest
+from stub_providers import StubServer
+from perplexity_client import PerplexityClient
+
+
+@pytest.fixture
+def stub():
+    """테스트마다 새로 띄우는 로컬 스텁 서버 (주입한 장애가 다른 테스트로 새지 않게)"""
+    with StubServer("instant") as server:
+        yield server
+
+
+@pytest.fixture
+def client(stub):
+    """스텁으로 요청하는 Perplexity 클라이언트 (재시도 대기는 짧게)"""
+    client = PerplexityClient("pplx-test", base_url=stub.perplexity_url, backoff_base=0.01,
+                              backoff_max=0.05)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def payload():
+    return {
+        "model": "sonar-pro",
+        "messages": [{"role": "user", "content": "AAPL 최근 실적"}],
+        "max_tokens": 50,
+    }
@@ -0,0 +1,158 @@
+import re
+from typing import NamedTuple
+from bm25 import tokenize
+from metrics import count_tokens
+
+# 한국어("...다.") / 영문 문장 끝 또는 줄바꿈에서 자른다
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?。])\s+|\n+")
+DEFAULT_CONTEXT_BUDGET = 1800
+# 인사이트가 충분할 때 최소한 이만큼은 인사이트 몫으로 남긴다
+INSIGHT_SHARE = 0.4
+# 남은 예산이 이보다 작으면 문장을 잘라 넣지 않는다
+MIN_FRAGMENT_TOKENS = 30
+
+
+class PackedContext(NamedTuple):
+    market_text: str
+    insights: list
+    stats: dict
+
+
+def split_sentences(text: str) -> list:
+    """(문장, 앞 구분자) 목록 (줄바꿈 등 원래 구분자를 다시 붙이기 위해 함께 보관)"""
+    parts, last, separator = [], 0, ""
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        sentence = text[last:match.start()].strip()
+        if sentence:
+            parts.append((sentence, separator))
+            separator = match.group()
+        else:
+            separator = separator or match.group()
+        last = match.end()
+    sentence = text[last:].strip()
+    if sentence:
+        parts.append((sentence, separator))
+    return parts
+
+
+def _sentence_key(sentence: str) -> str:
+    return " ".join(sentence.lower().split())
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def trim_to_budget(text: str, budget: int, model: str = "gpt-4o", seen: set = None) -> tuple:
+    """문장 단위로 앞에서부터 budget 토큰까지 (잘린 텍스트, 토큰 수)
+
+    seen 을 주면 이미 다른 곳에 넣은 문장(청크 겹침 구간)은 건너뛰고 새로 넣은 문장을 추가한다.
+    첫 문장부터 예산을 넘으면 그 문장을 단어 경계에서 자른다.
+    """
+    pieces, used, skipped = [], 0, False
+    for sentence, separator in split_sentences(text):
+        key = _sentence_key(sentence)
+        if seen is not None and key in seen:
+            skipped = True
+            continue
+        # 문장 사이 구분자 몫으로 1 토큰
+        tokens = count_tokens(sentence, model) + (1 if pieces else 0)
+        if used + tokens > budget:
+            if not pieces:
+                return _trim_words(sentence, budget, model)
+            break
+        if pieces:
+            pieces.append(" " if skipped else separator)
+        pieces.append(sentence)
+        used += tokens
+        skipped = False
+        if seen is not None:
+            seen.add(key)
+    return "".join(pieces), used
+
+
+def _trim_words(sentence: str, budget: int, model: str) -> tuple:
+    words, used = [], 0
+    for word in sentence.split():
+        tokens = count_tokens(word, model) + (1 if words else 0)
+        if used + tokens > budget:
+            break
+        words.append(word)
+        used += tokens
+    return " ".join(words), used
+
+
+def mmr_order(query: str, texts: list, lambda_: float = 0.7, duplicate_threshold: float = 0.8) -> tuple:
+    """(MMR 순서의 인덱스, 중복으로 뺀 개수)
+
+    관련도는 검색 순위와 질문 단어 겹침, 다양성은 이미 고른 텍스트와의 단어 Jaccard 로 잰다.
+    임베딩 호출 없이 로컬에서만 계산한다.
+    """
+    query_terms = set(tokenize(query))
+    term_sets = [set(tokenize(t)) for t in texts]
+    n = len(texts)
+
+    candidates, dropped = [], 0
+    for i, terms in enumerate(term_sets):
+        # 여러 검색어가 같은 청크를 찾았거나 거의 같은 청크면 하나만 남긴다
+        if any(_jaccard(terms, term_sets[j]) >= duplicate_threshold for j in candidates):
+            dropped += 1
+            continue
+        candidates.append(i)
+
+    relevance = {}
+    for i in candidates:
+        overlap = len(query_terms & term_sets[i]) / len(query_terms) if query_terms else 0.0
+        relevance[i] = 0.5 * (1 - i / n) + 0.5 * overlap
+
+    order = []
+    while candidates:
+        best = max(candidates, key=lambda i: lambda_ * relevance[i] - (1 - lambda_) * max(
+            (_jaccard(term_sets[i], term_sets[j]) for j in order), default=0.0
+        ))
+        order.append(best)
+        candidates.remove(best)
+    return order, dropped
+
+
+def pack_context(query: str, market_text: str, insights: list,
+                 budget: int = DEFAULT_CONTEXT_BUDGET, model: str = "gpt-4o",
+                 exclude: list = ()) -> PackedContext:
+    """분석 프롬프트에 넣을 시장 정보와 인사이트를 budget 토큰 안으로 압축
+
+    인사이트는 중복 제거 후 MMR 순서로 넣고, 시장 정보와 인사이트 모두 문장 경계에서 자른다.
+    exclude 에 있는 텍스트(프롬프트 앞부분에 이미 넣은 원칙)의 문장은 다시 넣지 않는다.
+    """
+    order, duplicates = mmr_order(query, insights)
+    insight_tokens = {i: count_tokens(text, model) for i, text in enumerate(insights)}
+    unique_tokens = sum(insight_tokens[i] for i in order)
+
+    # 인사이트가 몫보다 적으면 남는 만큼 시장 정보에 준다
+    market_budget = budget - min(unique_tokens, int(budget * INSIGHT_SHARE))
+    market_tokens_raw = count_tokens(market_text, model) if market_text else 0
+    if market_tokens_raw <= market_budget:
+        packed_market, market_tokens = market_text, market_tokens_raw
+    else:
+        packed_market, market_tokens = trim_to_budget(market_text, market_budget, model)
+
+    remaining = budget - market_tokens
+    seen = {_sentence_key(sentence) for text in exclude for sentence, _ in split_sentences(text)}
+    packed_insights, used = [], 0
+    for i in order:
+        if remaining - used < MIN_FRAGMENT_TOKENS:
+            break
+        text, tokens = trim_to_budget(insights[i], remaining - used, model, seen)
+        if text:
+            packed_insights.append(text)
+            used += tokens
+
+    return PackedContext(packed_market, packed_insights, {
+        "context_budget": budget,
+        "context_tokens": market_tokens + used,
+        "context_tokens_raw": market_tokens_raw + sum(insight_tokens.values()),
+        "insights_kept": len(packed_insights),
+        "insights_dropped": len(insights) - len(packed_insights),
+        "insights_duplicate": duplicates,
+    })
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from agent import build_vector_store
+from rag_cache import RAGIndexCache
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+
+class ShardedIndex:
+    """여러 문서 샤드를 하나의 인덱스처럼 다루는 읽기 전용 뷰
+
+    retrieval.batch_search 가 샤드마다 검색한 뒤 거리순으로 합친다.
+    """
+
+    def __init__(self, shards: list):
+        self.shards = shards
+        # 내적 인덱스는 값이 클수록, L2 인덱스는 작을수록 가깝다
+        self.higher_is_closer = (
+            getattr(shards[0], "distance_strategy", None) == DistanceStrategy.MAX_INNER_PRODUCT
+        )
+        # 고정 검색어 벡터는 모든 샤드가 같은 임베딩 모델이므로 하나를 공유
+        self.static_query_vectors = next(
+            (s.static_query_vectors for s in shards if getattr(s, "static_query_vectors", None)),
+            None
+        )
+
+
+class LetterCorpus:
+    """버크셔 서한 여러 편을 문서별 샤드로 관리하는 코퍼스
+
+    - 문서는 내용 해시(sha256) 이름으로 documents/ 에 저장하므로 같은 파일은 한 번만 임베딩
+    - 샤드(문서별 FAISS 인덱스)는 shards/ 디스크 캐시에 두고, 문서 추가/삭제 시 다른 샤드는 그대로
+    - view() 가 선택한 샤드를 묶어 검색 시점에 합친다
+    - 업로드 문서(원본 경로가 없는 문서)는 max_uploads 개까지, 넘으면 가장 오래 쓰이지 않은 것부터
+      문서와 샤드를 함께 삭제 (None 이면 제한 없음, 경로로 추가한 문서는 remove / sync_directory 로만 삭제)
+    """
+
+    def __init__(self, corpus_dir: str = ".corpus", index_type: str = "flat", mmap: bool = False,
+                 max_uploads: int = None):
+        self.corpus_dir = corpus_dir
+        self.max_uploads = max_uploads
+        self.documents_dir = os.path.join(corpus_dir, "documents")
+        self.manifest_path = os.path.join(corpus_dir, "manifest.json")
+        self.index_type = index_type
+        os.makedirs(self.documents_dir, exist_ok=True)
+        # 코퍼스 샤드는 LRU 로 지우지 않는다 (삭제는 remove 로만)
+        self.shard_cache = RAGIndexCache(
+            os.path.join(corpus_dir, "shards"), max_entries=None, max_bytes=None, mmap=mmap
+        )
+        self._shards = {}
+        self._building = {}
+        self._lock = threading.RLock()
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def document_path(self, digest: str) -> str:
+        """내용 해시로 저장된 PDF 경로"""
+        return os.path.join(self.documents_dir, f"{digest}.pdf")
+
+    def _store_bytes(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.document_path(digest)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def _store_file(self, pdf_path: str) -> str:
+        digest = RAGIndexCache.file_digest(pdf_path)
+        path = self.document_path(digest)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+            shutil.copyfile(pdf_path, tmp_path)
+            os.replace(tmp_path, path)
+        return digest
+
+    def _register(self, digest: str, name: str, source: str, embeddings) -> str:
+        shard = self._shard(digest, embeddings)
+        if shard is None:
+            return None
+        with self._lock:
+            entry = self.manifest.get(digest)
+            if entry is None:
+                self.manifest[digest] = {
+                    "name": name,
+                    "source": source,
+                    "added": time.time(),
+                    "used": time.time(),
+                    "chunks": len(shard.index_to_docstore_id),
+                }
+                print(f"📚 코퍼스에 추가: {name} ({digest[:12]})")
+            elif source and entry.get("source") != source:
+                # 같은 내용을 다른 경로에서 추가하면 그 경로를 따른다 (sync_directory 가 원본 위치로 판단)
+                entry.update(name=name, source=source)
+            entry = self.manifest[digest]
+            entry["used"] = time.time()
+            self._write_manifest()
+        if source is None:
+            self._evict_uploads(keep=digest)
+        return digest
+
+    def _evict_uploads(self, keep: str):
+        """업로드 문서가 max_uploads 를 넘으면 가장 오래 쓰이지 않은 것부터 삭제"""
+        if self.max_uploads is None:
+            return
+        with self._lock:
+            uploads = [d for d, entry in self.manifest.items() if not entry.get("source")]
+            # 방금 추가한 문서는 남긴다
+            oldest = sorted(
+                (d for d in uploads if d != keep),
+                key=lambda d: self.manifest[d].get("used", self.manifest[d]["added"])
+            )
+            excess = oldest[:max(0, len(uploads) - self.max_uploads)]
+        for digest in excess:
+            self.remove(digest)
+
+    def add_pdf(self, pdf_path: str, embeddings, name: str = None) -> str:
+        """PDF 파일을 코퍼스에 추가하고 내용 해시 반환 (이미 있으면 임베딩하지 않음)"""
+        digest = self._store_file(pdf_path)
+        return self._register(
+            digest, name or os.path.basename(pdf_path), os.path.abspath(pdf_path), embeddings
+        )
+
+    def add_bytes(self, data: bytes, name: str, embeddings) -> str:
+        """업로드된 PDF 바이트를 코퍼스에 추가하고 내용 해시 반환"""
+        digest = self._store_bytes(data)
+        return self._register(digest, name, None, embeddings)
+
+    def remove(self, digest: str):
+        """문서와 샤드 삭제 (다른 샤드는 영향 없음)"""
+        with self._lock:
+            entry = self.manifest.pop(digest, None)
+            self._write_manifest()
+            self._shards.pop(digest, None)
+        self.shard_cache.invalidate_digest(digest)
+        try:
+            os.remove(self.document_path(digest))
+        except OSError:
+            pass
+        if entry:
+            print(f"🗑️ 코퍼스에서 삭제: {entry['name']} ({digest[:12]})")
+
+    def sync_directory(self, directory: str, embeddings) -> list:
+        """디렉토리의 PDF 를 코퍼스와 맞춘다
+
+        새 파일/바뀐 파일만 샤드를 만들고, 디렉토리에서 사라지거나 내용이 바뀐 문서의 샤드는
+        삭제한다. 디렉토리 문서의 내용 해시 목록 반환
+        """
+        directory = os.path.abspath(directory)
+        digests = []
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith(".pdf"):
+                digest = self.add_pdf(os.path.join(directory, name), embeddings)
+                if digest:
+                    digests.append(digest)
+
+        for digest, entry in list(self.manifest.items()):
+            source = entry.get("source")
+            if source and os.path.dirname(source) == directory and digest not in digests:
+                self.remove(digest)
+        return digests
+
+    def _shard(self, digest: str, embeddings):
+        """문서 샤드 (메모리 -> 디스크 캐시 -> 새로 임베딩 순)
+
+        같은 문서는 한 번만 만들고, 서로 다른 문서는 동시에 만들 수 있다.
+        """
+        with self._lock:
+            shard = self._shards.get(digest)
+            if shard is not None:
+                return shard
+            building = self._building.setdefault(digest, threading.Lock())
+
+        with building:
+            with self._lock:
+                shard = self._shards.get(digest)
+            if shard is None:
+                shard = build_vector_store(
+                    self.document_path(digest), embeddings, self.shard_cache,
+                    index_type=self.index_type
+                )
+                if shard is not None:
+                    with self._lock:
+                        self._shards[digest] = shard
+        return shard
+
+    def view(self, embeddings, digests: list = None):
+        """선택한 문서(기본: 전체)의 샤드를 합친 검색용 인덱스 (문서가 없으면 None)"""
+        digests = list(self.manifest) if digests is None else digests
+        shards = [self._shard(d, embeddings) for d in dict.fromkeys(digests) if d in self.manifest]
+        shards = [s for s in shards if s is not None]
+        if not shards:
+            return None
+        if len(shards) == 1:
+            return shards[0]
+        return ShardedIndex(shards)
+
+    def documents(self) -> list:
+        """코퍼스 문서 목록 (추가된 순)"""
+        return sorted(
+            ({"digest": d, **entry} for d, entry in self.manifest.items()),
+            key=lambda e: e["added"]
+        )
@@ -0,0 +1,124 @@
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """청크 단위 임베딩 캐시 (SQLite, 키 = sha256(모델 + 청크 텍스트))
+
+    embed_documents 는 캐시에 없는 텍스트만 원래 임베딩으로 보내고 나머지는 재사용한다.
+    PDF 끝에 새 서한을 붙여도 기존 청크는 그대로이므로 새로 생긴 청크만 비용이 든다.
+    """
+
+    def __init__(self, embeddings, path: str, model: str, max_rows: int = 200_000):
+        self.embeddings = embeddings
+        self.path = path
+        self.model = model
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: list) -> dict:
+        found = {}
+        with self._connect() as conn:
+            # SQLite 변수 개수 제한을 피하려고 나눠서 조회
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM chunk_embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                found.update({k: np.frombuffer(v, dtype=np.float32).tolist() for k, v in rows})
+            now = time.time()
+            conn.executemany(
+                "UPDATE chunk_embeddings SET last_used = ? WHERE key = ?",
+                [(now, k) for k in found]
+            )
+        return found
+
+    def _store(self, items: list):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(k, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in items]
+            )
+
+    def _split(self, texts: list):
+        """(전체 키, 캐시 적중 벡터, 임베딩이 필요한 (키, 텍스트) 목록)"""
+        keys = [self._key(t) for t in texts]
+        found = self._lookup(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        with self._lock:
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += len(keys) - sum(1 for k in keys if k in found)
+        return keys, found, list(missing.items())
+
+    def embed_documents(self, texts: list) -> list:
+        keys, found, missing = self._split(texts)
+        if missing:
+            vectors = self.embeddings.embed_documents([text for _, text in missing])
+            new = [(key, vector) for (key, _), vector in zip(missing, vectors)]
+            self._store(new)
+            found.update(new)
+        return [found[k] for k in keys]
+
+    async def aembed_documents(self, texts: list) -> list:
+        keys, found, missing = self._split(texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents([text for _, text in missing])
+            new = [(key, vector) for (key, _), vector in zip(missing, vectors)]
+            self._store(new)
+            found.update(new)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> list:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> list:
+        return await self.embeddings.aembed_query(text)
+
+    def stats(self) -> dict:
+        """캐시 적중 통계"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+    def prune(self):
+        """max_rows 를 넘으면 오래 사용되지 않은 청크부터 삭제"""
+        with self._connect() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM chunk_embeddings").fetchone()[0]
+            if count > self.max_rows:
+                conn.execute(
+                    "DELETE FROM chunk_embeddings WHERE key IN ("
+                    "SELECT key FROM chunk_embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.max_rows,)
+                )
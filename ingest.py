@@ -0,0 +1,113 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from pypdf import PdfReader
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+
+# 이보다 페이지가 적으면 프로세스 풀 없이 현재 프로세스에서 추출
+MIN_PAGES_FOR_POOL = 16
+
+
+def page_count(pdf_path: str) -> int:
+    """PDF 전체 페이지 수"""
+    return len(PdfReader(pdf_path).pages)
+
+
+def _extract_range(pdf_path: str, start: int, end: int) -> list:
+    """[start, end) 페이지 텍스트 추출 (프로세스 풀 워커)"""
+    reader = PdfReader(pdf_path)
+    return [(i, reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def iter_pages(pdf_path: str, workers: int = None, pages_per_task: int = 8):
+    """페이지 Document 를 순서대로 하나씩 생성
+
+    페이지 구간을 프로세스 풀에서 병렬 추출하되, 동시에 제출하는 구간을 workers * 2 개로
+    제한해 문서 전체가 메모리에 올라오지 않게 한다.
+    """
+    total = page_count(pdf_path)
+    source = os.path.abspath(pdf_path)
+    workers = workers or os.cpu_count() or 1
+    ranges = [(s, min(s + pages_per_task, total)) for s in range(0, total, pages_per_task)]
+
+    def to_documents(pages):
+        for i, text in pages:
+            yield Document(
+                page_content=text,
+                metadata={"source": source, "page": i, "total_pages": total}
+            )
+
+    if workers <= 1 or total < MIN_PAGES_FOR_POOL:
+        for start, end in ranges:
+            yield from to_documents(_extract_range(pdf_path, start, end))
+        return
+
+    # 멀티스레드 프로세스(Streamlit 등)에서 fork 는 안전하지 않으므로 spawn 사용
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        remaining = iter(ranges)
+        for start, end in islice(remaining, workers * 2):
+            pending.append(pool.submit(_extract_range, pdf_path, start, end))
+        while pending:
+            pages = pending.popleft().result()
+            next_range = next(remaining, None)
+            if next_range is not None:
+                pending.append(pool.submit(_extract_range, pdf_path, *next_range))
+            yield from to_documents(pages)
+
+
+def iter_chunks(pages, text_splitter):
+    """페이지 스트림을 분할해 청크 Document 스트림으로 변환"""
+    for page in pages:
+        yield from text_splitter.split_documents([page])
+
+
+def batched(iterable, size: int):
+    """size 개씩 묶어서 생성"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def build_faiss_streaming(pdf_path: str, text_splitter, embeddings, batch_size: int = 128,
+                          max_in_flight: int = 4, workers: int = None):
+    """PDF -> 청크 -> 임베딩 -> FAISS 를 스트리밍으로 처리
+
+    임베딩 요청은 batch_size 청크씩 최대 max_in_flight 개를 동시에 보내고,
+    완료된 배치부터 순서대로 인덱스에 추가한다. 메모리 사용량은 문서 크기가 아니라
+    batch_size * max_in_flight 에 비례한다. (벡터 스토어, 청크 수) 반환
+    """
+    chunks = iter_chunks(iter_pages(pdf_path, workers), text_splitter)
+    vector_store = None
+    total = 0
+
+    def embed(batch):
+        return batch, embeddings.embed_documents([doc.page_content for doc in batch])
+
+    def add(batch, vectors):
+        nonlocal vector_store
+        text_embeddings = [(doc.page_content, vector) for doc, vector in zip(batch, vectors)]
+        metadatas = [doc.metadata for doc in batch]
+        if vector_store is None:
+            vector_store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas)
+        else:
+            vector_store.add_embeddings(text_embeddings, metadatas=metadatas)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        pending = deque()
+        for batch in batched(chunks, batch_size):
+            pending.append(pool.submit(embed, batch))
+            total += len(batch)
+            if len(pending) >= max_in_flight:
+                add(*pending.popleft().result())
+        while pending:
+            add(*pending.popleft().result())
+
+    return vector_store, total
@@ -0,0 +1,314 @@
+"""streamlit_app.py 동시 세션 부하 테스트 (로컬 스텁 Perplexity / OpenAI 서버)
+
+Streamlit 서버는 세션마다 스크립트를 별도 스레드에서 실행하고, st.cache_resource 로 만든
+코퍼스 / 시장 데이터 캐시 / 답변 캐시는 프로세스의 모든 세션이 공유한다. 같은 구성으로
+가상 사용자 N 명이 동시에 로그인 -> (일부는) PDF 업로드 -> 분석을 반복하고, 단계마다
+동시 사용자 수를 늘리며 다음을 잰다.
+
+- 세션 생성(로그인) / 업로드 / 분석 지연 분포와 첫 토큰까지 시간
+- 세션당 메모리 (모든 세션이 로그인 · 업로드를 마친 뒤 RSS 증가량 / 세션 수)
+- 오류율과 세션 간 간섭: 다른 질문의 결과를 받음, 다른 문서 구성으로 만든 캐시 답변을 받음,
+  세션 인덱스에 다른 세션의 업로드 문서가 섞임
+
+    uv run python loadtest_app.py --users 1 2 4 8 16 --upload-ratio 0.25 --json load.json
+    uv run python loadtest_app.py --profile realistic --latency-scale 0.2 --analyses 3 --think 1
+"""
+import io
+import os
+import sys
+import gc
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from pypdf import PdfWriter
+from langchain_openai import OpenAIEmbeddings
+from agent import EMBEDDING_MODEL
+from answer_cache import SemanticAnswerCache
+from app_session import base_documents, login, logout, upload_pdf, start_analysis
+from benchmark_pipeline import QUERIES, RSSSampler, current_rss, git_revision, percentile
+from corpus import LetterCorpus
+from market_cache import MarketDataCache
+from metrics import tokenizer_available
+from retrieval import index_signature
+from stub_providers import PROFILES, StubServer
+
+
+def upload_variant(data: bytes, tag: str) -> bytes:
+    """본문은 같고 내용 해시만 다른 PDF (사용자마다 새 문서를 올린 것처럼 샤드를 만든다)"""
+    writer = PdfWriter(clone_from=io.BytesIO(data))
+    writer.add_metadata({"/Subject": tag})
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+class SharedResources:
+    """streamlit_app.py 의 st.cache_resource 자원 (프로세스 하나의 모든 세션이 공유)"""
+
+    def __init__(self, stub: StubServer, work_dir: str, pdf_path: str):
+        self.stub = stub
+        self.pdf_path = pdf_path
+        self.corpus = LetterCorpus(os.path.join(work_dir, "corpus"))
+        self.market_cache = MarketDataCache(ttl=300, stale_ttl=3600)
+        self.answer_cache = SemanticAnswerCache(threshold=0.93, ttl=900, max_entries=500)
+        self._base_docs = None
+        # cache_resource 처럼 첫 호출만 계산하고 동시에 들어온 세션은 기다린다
+        self._lock = threading.Lock()
+
+    def base_docs(self) -> list:
+        with self._lock:
+            if self._base_docs is None:
+                embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, api_key="sk-stub",
+                                              base_url=self.stub.openai_url)
+                if not tokenizer_available(EMBEDDING_MODEL):
+                    embeddings.check_embedding_ctx_length = False
+                self._base_docs = base_documents(self.corpus, self.pdf_path, embeddings)
+            return self._base_docs
+
+
+class VirtualUser:
+    """세션 하나 (session 은 st.session_state 대신 dict)"""
+
+    def __init__(self, user_id: int, shared: SharedResources, upload: bytes = None):
+        self.user_id = user_id
+        self.shared = shared
+        self.upload = upload
+        self.session = {}
+        self.login_time = None
+        self.upload_time = None
+        self.errors = []
+        self.analyses = []
+
+    def start(self):
+        """로그인 (+ 업로드)"""
+        shared = self.shared
+        try:
+            started = time.perf_counter()
+            agent = login(
+                self.session, shared.corpus, shared.base_docs(), "sk-stub", "pplx-stub",
+                market_cache=shared.market_cache, answer_cache=shared.answer_cache,
+                openai_base_url=shared.stub.openai_url, perplexity_base_url=shared.stub.perplexity_url,
+                metrics_sinks=[]
+            )
+            self.login_time = time.perf_counter() - started
+            if not tokenizer_available(EMBEDDING_MODEL):
+                # tiktoken 인코딩 파일을 받을 수 없으면 (오프라인) 청크 문자열을 그대로 보낸다
+                agent.embeddings.check_embedding_ctx_length = False
+        except Exception as e:
+            self.errors.append(f"login: {e}")
+            return
+
+        if self.upload is None:
+            return
+        try:
+            started = time.perf_counter()
+            digest = upload_pdf(self.session, shared.corpus, self.upload, f"user-{self.user_id}.pdf")
+            self.upload_time = time.perf_counter() - started
+            if not digest:
+                self.errors.append("upload: 텍스트 없음")
+        except Exception as e:
+            self.errors.append(f"upload: {e}")
+
+    def analyze(self, query: str):
+        """분석 한 번 (앱처럼 스트림을 끝까지 소비하며 첫 토큰 시간 기록)"""
+        record = {"query": query, "docs": self.documents(), "first_token": None}
+        started = time.perf_counter()
+        try:
+            result = {}
+            for kind, payload in start_analysis(self.session, query):
+                if kind == "token":
+                    if record["first_token"] is None:
+                        record["first_token"] = time.perf_counter() - started
+                else:
+                    result.update(payload)
+            record["latency"] = time.perf_counter() - started
+            record["error"] = result.get("error", "")
+            record["returned_query"] = result.get("user_query")
+            record["cached_from"] = result.get("cached_from")
+            record["coalesced"] = "single_flight" in result.get("node_timings", {})
+        except Exception as e:
+            record["latency"] = time.perf_counter() - started
+            record["error"] = f"{type(e).__name__}: {e}"
+        self.analyses.append(record)
+
+    def documents(self) -> tuple:
+        return tuple(self.session.get("base_docs", []) + self.session.get("uploaded_docs", []))
+
+    def index_leaked(self) -> bool:
+        """세션 인덱스가 이 세션의 문서 구성과 다른지 (다른 세션의 업로드가 섞였는지)"""
+        agent = self.session.get("agent")
+        if agent is None:
+            return False
+        expected = self.shared.corpus.view(agent.embeddings, list(self.documents()))
+        return index_signature(agent.vector_store) != index_signature(expected)
+
+
+class LoadTest:
+    def __init__(self, shared: SharedResources, upload_ratio: float, analyses: int, think: float,
+                 seed: int = 0):
+        self.shared = shared
+        self.upload_ratio = upload_ratio
+        self.analyses = analyses
+        self.think = think
+        self._random = random.Random(seed)
+        self._next_user = 0
+        with open(shared.pdf_path, "rb") as f:
+            self.pdf_bytes = f.read()
+        # 캐시 없이 만든 답변의 (질문, 문서 구성) (단계를 넘어 답변 캐시가 유지되므로 누적)
+        self.produced = set()
+
+    def stage(self, users: int) -> dict:
+        """동시 사용자 users 명으로 로그인 -> 업로드 -> 분석"""
+        uploads = round(users * self.upload_ratio)
+        crowd = []
+        for i in range(users):
+            user_id = self._next_user + i
+            # 업로드는 새 내용 해시로 만들어 매번 샤드 생성 비용을 잰다 (측정 구간 밖에서 준비)
+            data = upload_variant(self.pdf_bytes, f"loadtest-{user_id}") if i < uploads else None
+            crowd.append(VirtualUser(user_id, self.shared, data))
+        self._next_user += users
+        self._random.shuffle(crowd)
+
+        gc.collect()
+        rss_before = current_rss()
+        with RSSSampler() as sampler, ThreadPoolExecutor(max_workers=users) as pool:
+            started = time.perf_counter()
+            list(pool.map(lambda u: u.start(), crowd))
+            sessions_time = time.perf_counter() - started
+            rss_sessions = current_rss()
+
+            active = [u for u in crowd if u.session.get("logged_in")]
+            started = time.perf_counter()
+            list(pool.map(self._analyses, active))
+            analyses_time = time.perf_counter() - started
+            leaked = sum(u.index_leaked() for u in active)
+
+        for user in active:
+            logout(user.session)
+        return self._summary(users, crowd, active, sessions_time, analyses_time,
+                             rss_before, rss_sessions, sampler, leaked)
+
+    def _analyses(self, user: VirtualUser):
+        rng = random.Random(user.user_id)
+        for n in range(self.analyses):
+            if n and self.think:
+                time.sleep(rng.uniform(0.5, 1.5) * self.think)
+            user.analyze(QUERIES[(user.user_id + n) % len(QUERIES)])
+
+    def _summary(self, users, crowd, active, sessions_time, analyses_time,
+                 rss_before, rss_sessions, sampler, leaked) -> dict:
+        logins = [u.login_time for u in crowd if u.login_time is not None]
+        uploads = [u.upload_time for u in crowd if u.upload_time is not None]
+        records = [r for u in active for r in u.analyses]
+        latencies = [r["latency"] for r in records]
+        first_tokens = [r["first_token"] for r in records if r["first_token"] is not None]
+        failed = [r for r in records if r["error"]]
+
+        for r in records:
+            if not r["error"] and not r.get("cached_from") and not r.get("coalesced"):
+                self.produced.add((r["query"], r["docs"]))
+        wrong_query = sum(1 for r in records if r.get("returned_query") not in (None, r["query"]))
+        # 답변 캐시는 같은 문서 구성으로 만든 답변만 돌려줘야 한다
+        foreign_answer = sum(1 for r in records if r.get("cached_from")
+                             and (r["cached_from"], r["docs"]) not in self.produced)
+        interference = wrong_query + foreign_answer + leaked
+        session_errors = sum(len(u.errors) for u in crowd)
+
+        return {
+            "users": users,
+            "sessions": len(active),
+            "uploads": len(uploads),
+            "login_s_p50": percentile(logins, 50),
+            "login_s_p95": percentile(logins, 95),
+            "login_s_max": max(logins, default=0.0),
+            "upload_s_p50": percentile(uploads, 50),
+            "upload_s_max": max(uploads, default=0.0),
+            "sessions_wall_s": sessions_time,
+            "analyses": len(records),
+            "analysis_s_p50": percentile(latencies, 50),
+            "analysis_s_p95": percentile(latencies, 95),
+            "analysis_s_p99": percentile(latencies, 99),
+            "first_token_s_p50": percentile(first_tokens, 50),
+            "first_token_s_p95": percentile(first_tokens, 95),
+            "analyses_per_s": len(records) / analyses_time if analyses_time else 0.0,
+            "answer_cache_hits": sum(1 for r in records if r.get("cached_from")),
+            "coalesced": sum(1 for r in records if r.get("coalesced")),
+            "memory_per_session_mb": (rss_sessions - rss_before) / max(len(active), 1) / 1024 ** 2,
+            "rss_peak_mb": sampler.peak / 1024 ** 2,
+            "session_errors": session_errors,
+            "analysis_errors": len(failed),
+            "error_rate": (session_errors + len(failed)) / (users + len(records)),
+            "interference": {"wrong_query": wrong_query, "foreign_answer": foreign_answer,
+                             "index_leak": leaked},
+            "interference_rate": interference / (len(records) + len(active)) if active else 0.0,
+            "error_samples": sorted({e for u in crowd for e in u.errors}
+                                    | {r["error"] for r in failed})[:5],
+        }
+
+
+def print_stage(row: dict):
+    print(f"👥 {row['users']:>3}명 | 로그인 p50 {row['login_s_p50'] * 1000:7.1f}ms "
+          f"p95 {row['login_s_p95'] * 1000:7.1f}ms | 업로드 {row['uploads']}건 "
+          f"max {row['upload_s_max']:.2f}s | 분석 p50 {row['analysis_s_p50'] * 1000:7.1f}ms "
+          f"p95 {row['analysis_s_p95'] * 1000:7.1f}ms p99 {row['analysis_s_p99'] * 1000:7.1f}ms "
+          f"(첫 토큰 p50 {row['first_token_s_p50'] * 1000:.1f}ms) | {row['analyses_per_s']:.2f}/s | "
+          f"세션당 {row['memory_per_session_mb']:.1f}MB, RSS {row['rss_peak_mb']:.0f}MB | "
+          f"오류 {row['error_rate']:.1%} 간섭 {row['interference_rate']:.1%}")
+    for sample in row["error_samples"]:
+        print(f"      ⚠️ {sample}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="스텁 공급자로 streamlit_app 동시 세션 부하 테스트")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="단계별 동시 사용자 수 (순서대로 늘려 간다)")
+    parser.add_argument("--upload-ratio", type=float, default=0.25,
+                        help="PDF 를 업로드하는 사용자 비율 (0 이면 업로드 없음)")
+    parser.add_argument("--analyses", type=int, default=2, help="사용자별 분석 수")
+    parser.add_argument("--think", type=float, default=0.0, help="분석 사이 평균 대기 시간(초)")
+    parser.add_argument("--pdf", default="stockking.pdf", help="기본 서한 PDF (업로드도 이 본문 사용)")
+    parser.add_argument("--profile", default="fast", choices=sorted(PROFILES),
+                        help="스텁 지연 프로필 (기본: fast)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="프로필 지연에 곱할 배율")
+    parser.add_argument("--error-rate", type=float, help="스텁이 429 를 돌려줄 비율 (프로필 값 대신)")
+    parser.add_argument("--json", metavar="PATH", help="결과를 JSON 으로 저장")
+    parser.add_argument("--verbose", action="store_true", help="에이전트 로그 출력")
+    args = parser.parse_args()
+
+    profile = dict(PROFILES[args.profile])
+    if args.error_rate is not None:
+        profile["error_rate"] = args.error_rate
+
+    stages = []
+    with tempfile.TemporaryDirectory() as work_dir, StubServer(profile, args.latency_scale) as stub:
+        test = LoadTest(SharedResources(stub, work_dir, args.pdf), args.upload_ratio,
+                        args.analyses, args.think)
+        print(f"🧪 스텁 프로필 {args.profile} (x{args.latency_scale}) | {stub.url}\n")
+        for users in args.users:
+            with open(os.devnull, "w") as devnull, redirect_stdout(sys.stdout if args.verbose else devnull):
+                row = test.stage(users)
+            stages.append(row)
+            print_stage(row)
+        provider_stats = dict(stub.provider.stats)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "profile": args.profile,
+        "profile_settings": profile,
+        "latency_scale": args.latency_scale,
+        "upload_ratio": args.upload_ratio,
+        "analyses_per_user": args.analyses,
+        "think_s": args.think,
+        "provider_requests": provider_stats,
+        "stages": stages,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ 결과 저장: {args.json}")
@@ -1,9 +1,20 @@
 from agent import InvestmentAgent
-from langchain_community.document_loaders import PyPDFLoader
+from corpus import LetterCorpus
+from compact_index import INDEX_TYPES
+from retrieval import RETRIEVAL_MODES
+from ingest import iter_pages
+from context_packer import DEFAULT_CONTEXT_BUDGET
+from cassette import Cassette, CassetteServer, CassetteSink, MODES as CASSETTE_MODES
+from metrics import LogSink
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 import os
+import re
+import csv
+import json
+import time
+import argparse
 
 # API 키 설정
 OPENAI_API_KEY = "your-openai-key-here"
@@ -72,8 +83,7 @@ def inspect_pdf_processing(pdf_path: str, openai_api_key: str):
     # 1. PDF 로드
     print("\n[1단계] PDF 로딩...")
     try:
-        loader = PyPDFLoader(pdf_path)
-        documents = loader.load()
+        documents = list(iter_pages(pdf_path))
 
         if not documents:
             print("❌ PDF는 로드되었지만 내용이 비어있습니다.")
@@ -174,6 +184,168 @@ def inspect_pdf_processing(pdf_path: str, openai_api_key: str):
     }
 
 
+def load_watchlist(path: str) -> list:
+    """CSV(ticker 열 또는 첫 번째 열) 또는 줄 단위 파일에서 종목 목록 읽기"""
+    tickers = []
+    with open(path, "r", encoding="utf-8-sig") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.reader(f))
+            if rows and rows[0] and rows[0][0].strip().lower() in ("ticker", "symbol", "종목"):
+                rows = rows[1:]
+            tickers = [row[0].strip() for row in rows if row and row[0].strip()]
+        else:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    tickers.append(line)
+
+    # 순서를 유지하며 중복 제거
+    return list(dict.fromkeys(tickers))
+
+
+def result_filename(ticker: str) -> str:
+    """결과 디렉토리용 안전한 파일명"""
+    return re.sub(r"[^\w.-]", "_", ticker) + ".json"
+
+
+def load_finished(output: str) -> set:
+    """이미 오류 없이 완료된 종목 (재시작 시 건너뜀)"""
+    finished = set()
+    if output.endswith(".jsonl"):
+        if not os.path.exists(output):
+            return finished
+        with open(output, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 중단 시점에 잘린 마지막 줄
+                    continue
+                if not record.get("error"):
+                    finished.add(record["ticker"])
+                else:
+                    finished.discard(record["ticker"])
+    elif os.path.isdir(output):
+        for name in os.listdir(output):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(output, name), "r", encoding="utf-8") as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not record.get("error"):
+                finished.add(record["ticker"])
+    return finished
+
+
+def write_result(output: str, record: dict):
+    """분석 결과를 즉시 디스크에 기록"""
+    if output.endswith(".jsonl"):
+        with open(output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    else:
+        path = os.path.join(output, result_filename(record["ticker"]))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+def run_batch(watchlist: str, output: str, workers: int = 4, pdf_path: str = None,
+              query_template: str = "{ticker} 주식 분석", letters_dir: str = None,
+              index_type: str = "flat", mmap_index: bool = False,
+              retrieval_mode: str = "vector", context_token_budget: int = DEFAULT_CONTEXT_BUDGET,
+              cassette: str = None, cassette_mode: str = "record", replay_speed: float = 1.0):
+    """워치리스트 일괄 분석 (완료된 종목은 건너뛰고 이어서 실행)
+
+    letters_dir 를 주면 pdf_path 대신 해당 디렉토리의 서한 전체를 코퍼스로 검색한다.
+    cassette 를 주면 record: API 요청/응답을 녹화, replay: 녹화된 응답으로 오프라인 실행.
+    """
+    tickers = load_watchlist(watchlist)
+    if not output.endswith(".jsonl"):
+        os.makedirs(output, exist_ok=True)
+
+    finished = load_finished(output)
+    pending = [t for t in tickers if t not in finished]
+
+    print("=" * 60)
+    print("📋 워치리스트 일괄 분석")
+    print("=" * 60)
+    print(f"전체 {len(tickers)}개 | 완료 {len(tickers) - len(pending)}개 | 남은 종목 {len(pending)}개")
+    if not pending:
+        print("✅ 모든 종목이 이미 분석되었습니다.")
+        return
+
+    server = None
+    sinks = [LogSink()]
+    if cassette:
+        loaded = Cassette(cassette) if cassette_mode == "record" else Cassette.load(cassette)
+        server = CassetteServer(loaded, cassette_mode, replay_speed).start()
+        print(f"📼 카세트 {cassette_mode}: {cassette}")
+        if cassette_mode == "record":
+            # 재생할 때 같은 질문을 다시 보낼 수 있도록 분석 단위로도 기록
+            sinks.append(CassetteSink(loaded))
+
+    try:
+        # 에이전트와 RAG 인덱스는 한 번만 준비
+        agent = InvestmentAgent(
+            openai_api_key=os.environ.get("OPENAI_API_KEY", OPENAI_API_KEY),
+            perplexity_api_key=os.environ.get("PERPLEXITY_API_KEY", PERPLEXITY_API_KEY),
+            pdf_path=None if letters_dir else pdf_path,
+            index_type=index_type,
+            mmap_index=mmap_index,
+            retrieval_mode=retrieval_mode,
+            context_token_budget=context_token_budget,
+            metrics_sinks=sinks,
+            openai_base_url=server.openai_url if server else None,
+            perplexity_base_url=server.perplexity_url if server else None
+        )
+        if letters_dir:
+            # 새로 추가되거나 바뀐 서한만 임베딩
+            corpus = LetterCorpus(index_type=index_type, mmap=mmap_index)
+            corpus.sync_directory(letters_dir, agent.embeddings)
+            agent.vector_store = corpus.view(agent.embeddings)
+
+        failed = []
+
+        def save(index: int, result: dict):
+            ticker = pending[index]
+            record = {
+                "ticker": ticker,
+                "query": result["user_query"],
+                "final_analysis": result["final_analysis"],
+                "market_data": result["market_data"],
+                "buffett_insights": result["buffett_insights"],
+                "error": result.get("error", ""),
+                "warnings": result.get("warnings", ""),
+                "node_timings": result.get("node_timings", {}),
+                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            write_result(output, record)
+            if record["error"]:
+                failed.append(ticker)
+
+        # 공유 속도 제한에서 배치 전체가 한 사용자로 차례를 받아 대화형 세션을 밀어내지 않는다
+        agent.analyze_many(
+            [query_template.format(ticker=t) for t in pending],
+            concurrency=workers,
+            on_result=save,
+            user_id="batch"
+        )
+
+        print(f"\n✅ 결과 저장: {output}")
+        if failed:
+            print(f"⚠️ 실패 {len(failed)}개 (다시 실행하면 재시도): {', '.join(failed)}")
+
+    finally:
+        if server is not None:
+            server.stop()
+            print(f"📼 카세트 요청: {server.stats}")
+
+
 def main():
     """메인 실행 함수"""
 
@@ -274,6 +446,8 @@ def main():
             # 추가 정보
             if result.get("error"):
                 print(f"\n⚠️ 경고: {result['error']}")
+            if result.get("warnings"):
+                print(f"\nℹ️ 참고: {result['warnings']}")
 
             # 결과 저장 여부
             save = input("\n결과를 파일로 저장하시겠습니까? (y/n): ").strip().lower()
@@ -298,4 +472,48 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="버핏 스타일 주식 분석기")
+    parser.add_argument("--batch", metavar="WATCHLIST",
+                        help="종목 목록 파일 (CSV 또는 줄 단위). 지정하면 비대화형 일괄 분석")
+    parser.add_argument("--output", default="results.jsonl",
+                        help="결과 JSONL 파일 또는 디렉토리 (기본: results.jsonl)")
+    parser.add_argument("--workers", type=int, default=4, help="동시 분석 수 (기본: 4)")
+    parser.add_argument("--pdf", default="stockking.pdf", help="RAG용 PDF 경로")
+    parser.add_argument("--letters", metavar="DIR",
+                        help="버크셔 서한 PDF 디렉토리 (지정하면 --pdf 대신 문서별 샤드 코퍼스 사용)")
+    parser.add_argument("--index-type", default="flat", choices=INDEX_TYPES,
+                        help="FAISS 인덱스 형식 (fp16/sq8: 양자화, ivf/ivfpq: 역파일, 기본: flat)")
+    parser.add_argument("--mmap", action="store_true",
+                        help="캐시된 인덱스를 메모리 맵으로 로드 (여러 프로세스가 메모리 공유)")
+    parser.add_argument("--retrieval", default="vector", choices=RETRIEVAL_MODES,
+                        help="RAG 검색 방식 (hybrid: 임베딩+BM25, lexical: BM25 만, 기본: vector)")
+    parser.add_argument("--context-budget", type=int, default=DEFAULT_CONTEXT_BUDGET,
+                        help=f"분석 프롬프트의 시장 정보 + 인사이트 토큰 상한 (기본: {DEFAULT_CONTEXT_BUDGET})")
+    parser.add_argument("--cassette", metavar="PATH",
+                        help="API 요청/응답 카세트 파일 (.cassette.gz)")
+    parser.add_argument("--cassette-mode", default="record", choices=CASSETTE_MODES,
+                        help="record: 실제 API 호출을 녹화, replay: 녹화된 응답으로 오프라인 실행")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="재생 지연 배율 (1: 녹화된 지연 그대로, 0: 즉시)")
+    parser.add_argument("--query-template", default="{ticker} 주식 분석",
+                        help="종목별 질문 템플릿 (기본: '{ticker} 주식 분석')")
+    args = parser.parse_args()
+
+    if args.batch:
+        run_batch(
+            args.batch,
+            args.output,
+            workers=args.workers,
+            pdf_path=args.pdf if os.path.exists(args.pdf) else None,
+            query_template=args.query_template,
+            letters_dir=args.letters,
+            index_type=args.index_type,
+            mmap_index=args.mmap,
+            retrieval_mode=args.retrieval,
+            context_token_budget=args.context_budget,
+            cassette=args.cassette,
+            cassette_mode=args.cassette_mode,
+            replay_speed=args.replay_speed
+        )
+    else:
+        main()
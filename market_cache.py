@@ -0,0 +1,208 @@
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+
+def normalize_query(query: str) -> str:
+    """캐시 키용 질문 정규화 (대소문자/공백 차이 무시)"""
+    return " ".join(query.lower().split()).rstrip("?!.")
+
+
+class MemoryBackend:
+    """프로세스 메모리 백엔드"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key: str, value: dict, stored_at: float):
+        with self._lock:
+            self._data[key] = (value, stored_at)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def purge(self, older_than: float):
+        with self._lock:
+            for key in [k for k, (_, t) in self._data.items() if t < older_than]:
+                del self._data[key]
+
+
+class SQLiteBackend:
+    """로컬 SQLite 파일 백엔드 (여러 프로세스가 공유 가능)"""
+
+    def __init__(self, path: str = ".market_cache.sqlite"):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS market_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # 호출마다 새 연결을 쓰므로 스레드 간 공유 문제가 없다
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, stored_at FROM market_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: dict, stored_at: float):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO market_cache (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), stored_at)
+            )
+
+    def delete(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM market_cache WHERE key = ?", (key,))
+
+    def purge(self, older_than: float):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM market_cache WHERE stored_at < ?", (older_than,))
+
+
+class MarketDataCache:
+    """Perplexity 시장 데이터 TTL + stale-while-revalidate 캐시
+
+    - ttl 이내: 캐시 그대로 반환 (hit)
+    - ttl ~ ttl + stale_ttl: 캐시 반환 + 백그라운드 갱신 (stale)
+    - 그 이후 / 없음: 동기 호출 (miss)
+    """
+
+    def __init__(self, backend: str = "memory", path: str = ".market_cache.sqlite",
+                 ttl: float = 300, stale_ttl: float = 3600):
+        if backend == "memory":
+            self.backend = MemoryBackend()
+        elif backend == "sqlite":
+            self.backend = SQLiteBackend(path)
+        else:
+            raise ValueError(f"지원하지 않는 캐시 백엔드: {backend}")
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        # 실행 중인 비동기 갱신 태스크가 GC 되지 않도록 참조 유지
+        self._refresh_tasks = set()
+
+    @staticmethod
+    def make_key(query: str, model: str, max_tokens: int, temperature: float) -> str:
+        """정규화된 질문 + 모델 파라미터로 캐시 키 생성"""
+        raw = json.dumps([normalize_query(query), model, int(max_tokens), round(float(temperature), 3)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_or_fetch(self, key: str, fetch):
+        """캐시 조회 후 필요하면 fetch() 호출. (값, 상태) 반환"""
+        entry = self.backend.get(key)
+        now = time.time()
+
+        if entry is not None:
+            value, stored_at = entry
+            age = now - stored_at
+            if age < self.ttl:
+                return value, "hit"
+            if age < self.ttl + self.stale_ttl:
+                self._refresh_in_background(key, fetch)
+                return value, "stale"
+
+        value = fetch()
+        self.backend.set(key, value, time.time())
+        self.purge_expired()
+        return value, "miss"
+
+    async def aget_or_fetch(self, key: str, afetch):
+        """get_or_fetch 의 비동기 버전 (afetch 는 코루틴 함수)"""
+        entry = self.backend.get(key)
+        now = time.time()
+
+        if entry is not None:
+            value, stored_at = entry
+            age = now - stored_at
+            if age < self.ttl:
+                return value, "hit"
+            if age < self.ttl + self.stale_ttl:
+                self._arefresh_in_background(key, afetch)
+                return value, "stale"
+
+        value = await afetch()
+        self.backend.set(key, value, time.time())
+        self.purge_expired()
+        return value, "miss"
+
+    def _arefresh_in_background(self, key: str, afetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                self.backend.set(key, await afetch(), time.time())
+                print(f"🔄 시장 데이터 캐시 갱신 완료: {key[:12]}")
+            except Exception as e:
+                print(f"⚠️ 시장 데이터 캐시 갱신 실패: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        task = asyncio.ensure_future(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def adrain(self):
+        """현재 루프에서 시작한 백그라운드 갱신이 끝날 때까지 대기
+
+        asyncio.run 이 끝나면 남은 태스크는 취소되므로 루프를 닫기 전에 호출한다.
+        """
+        loop = asyncio.get_running_loop()
+        tasks = [task for task in self._refresh_tasks if task.get_loop() is loop]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _refresh_in_background(self, key: str, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.backend.set(key, fetch(), time.time())
+                print(f"🔄 시장 데이터 캐시 갱신 완료: {key[:12]}")
+            except Exception as e:
+                # 갱신 실패 시 기존 값을 유지하고 다음 요청에서 재시도
+                print(f"⚠️ 시장 데이터 캐시 갱신 실패: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def invalidate(self, key: str):
+        """특정 항목 삭제"""
+        self.backend.delete(key)
+
+    def purge_expired(self):
+        """stale 기간까지 지난 항목 정리"""
+        self.backend.purge(time.time() - self.ttl - self.stale_ttl)
@@ -0,0 +1,200 @@
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 모델별 가격 (USD / 1M 토큰: 입력, 출력)
+PRICING = {
+    "gpt-4o": (2.50, 10.00),
+    "sonar-pro": (3.00, 15.00),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+# 프롬프트 캐시로 읽은 입력 토큰 가격 (USD / 1M 토큰)
+CACHED_INPUT_PRICING = {
+    "gpt-4o": 1.25,
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int = 0,
+                  cached_tokens: int = 0) -> float:
+    """토큰 수로 예상 비용(USD) 계산 (cached_tokens 는 prompt_tokens 중 캐시 적중분)"""
+    input_price, output_price = PRICING.get(model, (0.0, 0.0))
+    cached_price = CACHED_INPUT_PRICING.get(model, input_price)
+    return ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1_000_000
+
+
+_encoders = {}
+
+
+def _encoder(model: str):
+    if model not in _encoders:
+        try:
+            import tiktoken
+            try:
+                _encoders[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encoders[model] = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # tiktoken 미설치 또는 인코딩 파일을 받을 수 없는 오프라인 환경
+            _encoders[model] = None
+    return _encoders[model]
+
+
+def tokenizer_available(model: str = "gpt-4o") -> bool:
+    """tiktoken 인코딩을 쓸 수 있는지 (오프라인이면 False)"""
+    return _encoder(model) is not None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """tiktoken 으로 토큰 수 계산 (없으면 글자 수 기반 추정)"""
+    encoder = _encoder(model)
+    if encoder is None:
+        return max(1, len(text) // 4)
+    return len(encoder.encode(text))
+
+
+def node_metrics(wall_time: float, http_time: float = 0.0, model: str = None,
+                 prompt_tokens: int = 0, completion_tokens: int = 0, **extra) -> dict:
+    """InvestmentState.metrics 에 들어가는 노드별 측정값"""
+    return {
+        "wall_time": wall_time,
+        "http_time": http_time,
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": estimate_cost(
+            model, prompt_tokens, completion_tokens, extra.get("cached_tokens", 0)
+        ) if model else 0.0,
+        **extra,
+    }
+
+
+def summarize(metrics: dict) -> dict:
+    """노드별 측정값 합계"""
+    nodes = [m for m in metrics.values() if isinstance(m, dict)]
+    prompt_tokens = sum(m.get("prompt_tokens", 0) for m in nodes)
+    cached_tokens = sum(m.get("cached_tokens", 0) for m in nodes)
+    return {
+        "rate_limit_wait": sum(m.get("rate_limit_wait", 0.0) for m in nodes),
+        "http_time": sum(m.get("http_time", 0.0) for m in nodes),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": sum(m.get("completion_tokens", 0) for m in nodes),
+        "cached_tokens": cached_tokens,
+        "prompt_cache_hit_rate": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+        "cost_usd": sum(m.get("cost_usd", 0.0) for m in nodes),
+    }
+
+
+class LogSink:
+    """분석마다 노드별 측정값을 콘솔에 출력"""
+
+    def emit(self, metrics: dict, context: dict):
+        for node, m in metrics.items():
+            waited = f", 한도 대기 {m['rate_limit_wait']:.2f}초" if m.get("rate_limit_wait") else ""
+            print(f"📏 {node}: {m['wall_time']:.2f}초 (HTTP {m['http_time']:.2f}초{waited}) | "
+                  f"토큰 {m['prompt_tokens']}+{m['completion_tokens']} | ${m['cost_usd']:.4f}")
+        total = summarize(metrics)
+        print(f"📏 합계: 토큰 {total['prompt_tokens']}+{total['completion_tokens']} "
+              f"(캐시 적중 {total['prompt_cache_hit_rate']:.0%}) | ${total['cost_usd']:.4f}")
+
+
+class JsonlSink:
+    """분석마다 한 줄씩 JSONL 파일에 기록"""
+
+    def __init__(self, path: str = "metrics.jsonl"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, metrics: dict, context: dict):
+        record = {"timestamp": time.time(), **context, "metrics": metrics,
+                  "summary": summarize(metrics)}
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class PrometheusSink:
+    """Prometheus 텍스트 형식으로 누적 집계 (port 지정 시 /metrics 제공)"""
+
+    def __init__(self, port: int = None, host: str = "127.0.0.1"):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self.server = None
+        if port is not None:
+            self.serve(port, host)
+
+    def _inc(self, name: str, labels: dict, value: float):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def emit(self, metrics: dict, context: dict):
+        with self._lock:
+            self._inc("stockking_analyses_total", {}, 1)
+            for node, m in metrics.items():
+                labels = {"node": node}
+                self._inc("stockking_node_wall_seconds_sum", labels, m["wall_time"])
+                self._inc("stockking_node_wall_seconds_count", labels, 1)
+                self._inc("stockking_node_http_seconds_sum", labels, m["http_time"])
+                self._inc("stockking_tokens_total", {**labels, "kind": "prompt"}, m["prompt_tokens"])
+                self._inc("stockking_tokens_total", {**labels, "kind": "completion"},
+                          m["completion_tokens"])
+                # kind="cached" / kind="prompt" 비율이 공급자 프롬프트 캐시 적중률
+                if "cached_tokens" in m:
+                    self._inc("stockking_tokens_total", {**labels, "kind": "cached"},
+                              m["cached_tokens"])
+                self._inc("stockking_cost_usd_total", labels, m["cost_usd"])
+                # 캐시 조회 결과 (hit / miss / stale) 로 적중률 계산
+                for cache in ("cache", "embedding_cache"):
+                    if cache in m:
+                        self._inc("stockking_cache_lookups_total",
+                                  {**labels, "cache": cache, "result": m[cache]}, 1)
+                # 공유 속도 제한 큐에서 기다린 시간 (평균 = sum / count, 한도 산정용)
+                if "rate_limit_wait" in m:
+                    self._inc("stockking_rate_limit_wait_seconds_sum", labels, m["rate_limit_wait"])
+                    self._inc("stockking_rate_limit_wait_seconds_count", labels, 1)
+                # 컨텍스트 압축 전후 토큰 (절감률 = 1 - packed / raw)
+                if "context_tokens" in m:
+                    self._inc("stockking_context_tokens_total", {**labels, "kind": "packed"},
+                              m["context_tokens"])
+                    self._inc("stockking_context_tokens_total", {**labels, "kind": "raw"},
+                              m["context_tokens_raw"])
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """임의 카운터 증가 (캐시 적중 등 노드 밖 측정값용)"""
+        with self._lock:
+            self._inc(name, labels, value)
+
+    def render(self) -> str:
+        """Prometheus exposition 텍스트"""
+        with self._lock:
+            items = sorted(self._counters.items())
+        lines = []
+        for (name, labels), value in items:
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """백그라운드 스레드에서 /metrics 엔드포인트 시작"""
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = sink.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"📈 Prometheus 메트릭: http://{host}:{self.server.server_port}/metrics")
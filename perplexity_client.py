@@ -0,0 +1,285 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+DEFAULT_BASE_URL = "https://api.perplexity.ai"
+
+
+class PerplexityClient:
+    """Perplexity chat-completions 클라이언트
+
+    - requests.Session + HTTPAdapter 로 keep-alive 연결 재사용
+    - 호출마다 (connect, read) 타임아웃
+    - 429/5xx/연결 오류 시 full-jitter 지수 백오프 재시도 (Retry-After 우선)
+    - hedge_percentile 설정 시, 첫 요청이 최근 지연시간의 해당 백분위를 넘기면
+      두 번째 요청을 보내고 먼저 끝난 응답을 사용
+    - achat_completions 는 같은 정책을 httpx.AsyncClient 로 수행
+    - base_url 을 주지 않으면 PERPLEXITY_BASE_URL 환경 변수 (OpenAI SDK 의 OPENAI_BASE_URL 과 같은 방식)
+    """
+
+    def __init__(self, api_key: str, base_url: str = None,
+                 connect_timeout: float = 5.0, read_timeout: float = 60.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 pool_size: int = 10, hedge_percentile: float = None,
+                 hedge_min_samples: int = 20, hedge_max_delay: float = 30.0):
+        self.api_key = api_key
+        self.base_url = (base_url or os.environ.get("PERPLEXITY_BASE_URL", DEFAULT_BASE_URL)).rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_max_delay = hedge_max_delay
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        self.session.headers.update(self.headers)
+
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=pool_size) if hedge_percentile else None
+        # AsyncClient 는 생성된 이벤트 루프에 묶이므로 async_session 이 루프별로 열고 닫는다
+        self._async_clients = {}
+        # 루프별로 그 풀을 쓰는 중인 async_session 구간 수
+        self._async_sessions = {}
+        self.stats = {"requests": 0, "retries": 0, "hedged": 0, "hedge_wins": 0}
+
+    def chat_completions(self, payload: dict) -> dict:
+        """POST /chat/completions 결과(JSON) 반환"""
+        delay = self._hedge_delay()
+        if delay is None:
+            return self._post_with_retry(payload)
+        return self._post_hedged(payload, delay)
+
+    def _hedge_delay(self):
+        """최근 지연시간 백분위 (샘플이 부족하면 헤징하지 않음)"""
+        if not self.hedge_percentile:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.hedge_min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile))
+        return min(samples[index], self.hedge_max_delay)
+
+    def _post_hedged(self, payload: dict, delay: float) -> dict:
+        first = self._hedge_pool.submit(self._post_with_retry, payload)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        with self._lock:
+            self.stats["hedged"] += 1
+        second = self._hedge_pool.submit(self._post_with_retry, payload)
+        pending = {first, second}
+        error = None
+        # 먼저 성공한 응답 사용, 둘 다 실패하면 마지막 오류를 올린다
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is second:
+                    with self._lock:
+                        self.stats["hedge_wins"] += 1
+                return result
+        raise error
+
+    def _post_with_retry(self, payload: dict) -> dict:
+        url = f"{self.base_url}/chat/completions"
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            retry_after = None
+            try:
+                with self._lock:
+                    self.stats["requests"] += 1
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    with self._lock:
+                        self._latencies.append(time.perf_counter() - started)
+                    return response.json()
+                retry_after = response.headers.get("Retry-After")
+                error = requests.HTTPError(
+                    f"{response.status_code} Error for url: {url}", response=response
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+
+            if attempt >= self.max_retries:
+                raise error
+            attempt += 1
+            with self._lock:
+                self.stats["retries"] += 1
+            time.sleep(self._backoff(attempt, retry_after))
+
+    async def achat_completions(self, payload: dict) -> dict:
+        """POST /chat/completions 비동기 버전"""
+        delay = self._hedge_delay()
+        if delay is None:
+            return await self._apost_with_retry(payload)
+
+        first = asyncio.ensure_future(self._apost_with_retry(payload))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        with self._lock:
+            self.stats["hedged"] += 1
+        second = asyncio.ensure_future(self._apost_with_retry(payload))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is second:
+                        with self._lock:
+                            self.stats["hedge_wins"] += 1
+                    return task.result()
+            raise error
+        finally:
+            # 비동기 요청은 진 쪽을 취소할 수 있다
+            for task in pending:
+                task.cancel()
+
+    def _new_async_client(self) -> httpx.AsyncClient:
+        connect_timeout, read_timeout = self.timeout
+        return httpx.AsyncClient(
+            headers=self.headers,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=self.pool_size,
+                                max_keepalive_connections=self.pool_size)
+        )
+
+    @asynccontextmanager
+    async def _borrow_async_client(self):
+        """현재 루프의 async_session 풀, 구간 밖이면 이번 요청에만 쓰고 닫는 클라이언트"""
+        with self._lock:
+            client = self._async_clients.get(asyncio.get_running_loop())
+        if client is not None:
+            yield client
+            return
+        async with self._new_async_client() as client:
+            yield client
+
+    async def _apost_with_retry(self, payload: dict) -> dict:
+        async with self._borrow_async_client() as client:
+            return await self._apost_with_retry_on(client, payload)
+
+    async def _apost_with_retry_on(self, client: httpx.AsyncClient, payload: dict) -> dict:
+        url = f"{self.base_url}/chat/completions"
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            retry_after = None
+            try:
+                with self._lock:
+                    self.stats["requests"] += 1
+                response = await client.post(url, json=payload)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    with self._lock:
+                        self._latencies.append(time.perf_counter() - started)
+                    return response.json()
+                retry_after = response.headers.get("Retry-After")
+                error = httpx.HTTPStatusError(
+                    f"{response.status_code} Error for url: {url}",
+                    request=response.request, response=response
+                )
+            except httpx.TransportError as e:
+                error = e
+
+            if attempt >= self.max_retries:
+                raise error
+            attempt += 1
+            with self._lock:
+                self.stats["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    def _backoff(self, attempt: int, retry_after: str = None) -> float:
+        """Retry-After 헤더 우선, 없으면 full-jitter 지수 백오프"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def close(self):
+        """연결 풀 정리"""
+        self.session.close()
+        if self._hedge_pool:
+            self._hedge_pool.shutdown(wait=False)
+
+    async def aclose(self):
+        """비동기 연결 풀 정리 (현재 루프에서 연 클라이언트)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.pop(loop, None)
+            self._async_sessions.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+    async def _close_stale_clients(self):
+        """이미 닫힌 루프에 남은 풀 정리 (구간이 끝나지 못한 채 루프가 사라진 경우)"""
+        with self._lock:
+            stale = [loop for loop in self._async_clients if loop.is_closed()]
+            clients = [self._async_clients.pop(loop) for loop in stale]
+            for loop in stale:
+                self._async_sessions.pop(loop, None)
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception:
+                # 연결이 죽은 루프에 묶여 있어 정상 종료가 안 될 수 있다
+                pass
+
+    @asynccontextmanager
+    async def async_session(self):
+        """이 구간 동안 현재 루프의 비동기 연결 풀 사용
+
+        구간 밖의 achat_completions 는 요청마다 클라이언트를 열고 닫는다.
+        같은 루프에서 겹친 구간은 풀 하나를 함께 쓰고, 모두 끝날 때 닫는다.
+        """
+        await self._close_stale_clients()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_clients:
+                self._async_clients[loop] = self._new_async_client()
+                self._async_sessions[loop] = 0
+            self._async_sessions[loop] += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                remaining = self._async_sessions.get(loop)
+                if remaining is not None:
+                    remaining -= 1
+                    self._async_sessions[loop] = remaining
+            if remaining == 0:
+                await self.aclose()
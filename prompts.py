@@ -0,0 +1,65 @@
+import hashlib
+from functools import lru_cache
+from langchain_core.messages import SystemMessage, HumanMessage
+from context_packer import PackedContext, pack_context
+
+# OpenAI 는 앞부분 1024 토큰 이상이 같은 요청끼리 입력을 캐시한다.
+# 고정 지시문과 인덱스별로 항상 같은 원칙을 앞에, 질문별 데이터는 뒤에 둔다.
+ANALYSIS_INSTRUCTIONS = """당신은 워렌 버핏의 투자 철학을 깊이 이해하는 전문 애널리스트입니다.
+
+사용자 메시지의 질문, Perplexity가 수집한 최신 시장 정보, 버크셔 해서웨이 서한의 관련 구절과
+아래 투자 원칙을 바탕으로 다음 구조로 분석하세요:
+
+1. **회사 및 티커 확인**
+2. **비즈니스 이해도** (1-5점)
+3. **경제적 해자** (1-5점)
+4. **경영진 평가** (1-5점)
+5. **밸류에이션** (1-5점)
+6. **종합 투자 의견**
+
+한국어로 명확하고 실용적으로 작성해주세요."""
+
+# 고정 원칙 몫 토큰 상한 (질문별 컨텍스트 예산과 별도)
+PRINCIPLES_TOKEN_BUDGET = 1200
+
+
+@lru_cache(maxsize=32)
+def pack_principles(principles: tuple, model: str = "gpt-4o") -> list:
+    """고정 검색어 결과를 중복 제거 후 문장 단위로 자른 원칙 목록
+
+    같은 입력이면 항상 같은 결과여야 접두부가 바이트 단위로 같아 캐시에 적중한다.
+    인덱스마다 결과가 같으므로 한 번만 계산한다.
+    """
+    return pack_context("", "", list(principles), PRINCIPLES_TOKEN_BUDGET, model).insights
+
+
+def build_system_prompt(principles: list) -> str:
+    """요청 사이에 공유되는 접두부 (지시문 + 고정 원칙)"""
+    lines = "\n".join(f"- {principle}" for principle in principles)
+    return f"{ANALYSIS_INSTRUCTIONS}\n\n## 버크셔 해서웨이 서한에서 추출한 투자 원칙\n{lines}"
+
+
+def build_user_prompt(user_query: str, packed: PackedContext) -> str:
+    """질문마다 달라지는 부분 (질문별 구절 + 시장 정보 + 질문)"""
+    sections = []
+    if packed.insights:
+        sections.append("## 질문과 관련된 서한 구절\n"
+                        + "\n".join(f"- {insight}" for insight in packed.insights))
+    sections.append(f"## Perplexity가 수집한 최신 시장 정보\n{packed.market_text or '정보 없음'}")
+    sections.append(f"## 사용자 질문\n{user_query}")
+    return "\n\n".join(sections)
+
+
+def analysis_messages(system_prompt: str, user_prompt: str) -> list:
+    return [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
+
+
+def prompt_cache_key(system_prompt: str) -> str:
+    """같은 접두부 요청을 같은 캐시 서버로 보내기 위한 키"""
+    return "stockking-analysis-" + hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def cached_tokens(response) -> int:
+    """응답 usage 에서 공급자 프롬프트 캐시로 읽은 입력 토큰 수"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    return (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
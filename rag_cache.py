@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from langchain_community.vectorstores import FAISS
+from compact_index import io_flags
+from bm25 import BM25Index
+
+# 저장 형식이 바뀌면 올려서 기존 캐시를 자동 무효화 (2: 고정 검색어 벡터 + BM25 파일 추가)
+CACHE_VERSION = 2
+# 인덱스와 함께 보관하는 고정 검색어 벡터 (retrieval.STATIC_QUERIES)
+STATIC_VECTORS_FILE = "static_query_vectors.json"
+# 같은 청크로 만든 BM25 역색인 (retrieval.attach_bm25)
+BM25_FILE = "bm25.json"
+
+
+class RAGIndexCache:
+    """PDF 내용 해시 기반 FAISS 인덱스 디스크 캐시
+
+    키 = sha256(PDF 바이트 + 분할/임베딩 설정). 키가 같으면 임베딩 호출 없이 로드하고,
+    max_entries / max_bytes 를 넘으면 가장 오래 사용되지 않은 항목부터 삭제한다.
+    mmap=True 이면 인덱스를 메모리 맵으로 열어 같은 항목을 읽는 프로세스끼리 메모리를 공유한다.
+    """
+
+    def __init__(self, cache_dir: str = ".rag_cache", max_entries: int = 8,
+                 max_bytes: int = 2 * 1024 ** 3, mmap: bool = False):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def file_digest(path: str) -> str:
+        """파일 내용 sha256"""
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def make_key(self, pdf_sha256: str, chunk_size: int, chunk_overlap: int,
+                 embedding_model: str, index_type: str = "flat") -> str:
+        """PDF 내용 해시와 설정으로 캐시 키 생성"""
+        settings = {
+            "version": CACHE_VERSION,
+            "pdf_sha256": pdf_sha256,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "embedding_model": embedding_model,
+        }
+        # 기존 평면 인덱스 캐시 키는 그대로 유지
+        if index_type != "flat":
+            settings["index_type"] = index_type
+        settings = json.dumps(settings, sort_keys=True)
+        return hashlib.sha256(settings.encode("utf-8")).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self._entry_dir(key), "meta.json")
+
+    def _read_meta(self, key: str) -> dict:
+        try:
+            with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, key: str, meta: dict):
+        tmp_path = self._meta_path(key) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path(key))
+
+    def load(self, key: str, embeddings):
+        """캐시된 인덱스 로드 (없으면 None)"""
+        entry_dir = self._entry_dir(key)
+        meta = self._read_meta(key)
+        if not meta:
+            return None
+
+        try:
+            # 이 캐시 디렉토리는 우리가 직접 저장한 파일만 담고 있다
+            vector_store = FAISS.load_local(
+                entry_dir, embeddings, allow_dangerous_deserialization=True,
+                io_flags=io_flags(meta.get("index_type", "flat"), self.mmap)
+            )
+        except Exception as e:
+            print(f"⚠️ 캐시 로드 실패, 항목 삭제: {str(e)}")
+            self.invalidate(key)
+            return None
+
+        try:
+            with open(os.path.join(entry_dir, STATIC_VECTORS_FILE), "r", encoding="utf-8") as f:
+                vector_store.static_query_vectors = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        try:
+            with open(os.path.join(entry_dir, BM25_FILE), "r", encoding="utf-8") as f:
+                vector_store.bm25 = BM25Index.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            pass
+
+        meta["last_used"] = time.time()
+        self._write_meta(key, meta)
+        return vector_store
+
+    def save(self, key: str, vector_store, meta: dict = None):
+        """인덱스 저장 후 eviction 정책 적용"""
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        vector_store.save_local(tmp_dir)
+        static_vectors = getattr(vector_store, "static_query_vectors", None)
+        if static_vectors:
+            with open(os.path.join(tmp_dir, STATIC_VECTORS_FILE), "w", encoding="utf-8") as f:
+                json.dump({q: list(map(float, v)) for q, v in static_vectors.items()}, f)
+        bm25 = getattr(vector_store, "bm25", None)
+        if bm25 is not None:
+            with open(os.path.join(tmp_dir, BM25_FILE), "w", encoding="utf-8") as f:
+                json.dump(bm25.to_dict(), f, ensure_ascii=False)
+        now = time.time()
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({**(meta or {}), "created": now, "last_used": now}, f, ensure_ascii=False)
+
+        # 다른 프로세스가 먼저 저장했다면 그쪽 결과를 유지
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.evict()
+
+    def invalidate(self, key: str):
+        """특정 캐시 항목 삭제"""
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def invalidate_pdf(self, pdf_path: str):
+        """해당 PDF 내용으로 만든 모든 캐시 항목 삭제"""
+        self.invalidate_digest(self.file_digest(pdf_path))
+
+    def invalidate_digest(self, pdf_sha256: str):
+        """PDF 내용 해시로 만든 모든 캐시 항목 삭제"""
+        for entry in self.entries():
+            if entry["meta"].get("pdf_sha256") == pdf_sha256:
+                self.invalidate(entry["key"])
+
+    def clear(self):
+        """캐시 전체 삭제"""
+        for entry in self.entries():
+            self.invalidate(entry["key"])
+
+    def entries(self) -> list:
+        """캐시 항목 목록 (최근 사용 순)"""
+        result = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = self._entry_dir(name)
+            if ".tmp" in name or not os.path.isdir(entry_dir):
+                continue
+            meta = self._read_meta(name)
+            try:
+                size = sum(
+                    os.path.getsize(os.path.join(entry_dir, f))
+                    for f in os.listdir(entry_dir)
+                )
+            except OSError:
+                # 다른 프로세스가 삭제 중인 항목
+                continue
+            result.append({"key": name, "meta": meta, "size": size,
+                           "last_used": meta.get("last_used", 0)})
+        result.sort(key=lambda e: e["last_used"], reverse=True)
+        return result
+
+    def evict(self):
+        """LRU 순서로 max_entries / max_bytes 초과분 삭제 (None 이면 제한 없음)"""
+        entries = self.entries()
+        total = sum(e["size"] for e in entries)
+        while entries and ((self.max_entries is not None and len(entries) > self.max_entries)
+                           or (self.max_bytes is not None and total > self.max_bytes)):
+            oldest = entries.pop()
+            self.invalidate(oldest["key"])
+            total -= oldest["size"]
+            print(f"🧹 RAG 캐시 항목 삭제: {oldest['key'][:12]}")
@@ -0,0 +1,302 @@
+import os
+import time
+import heapq
+import sqlite3
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import NamedTuple
+
+
+class AsyncTokenBucket:
+    """asyncio 용 토큰 버킷 (초당 rate 개, 최대 capacity 개까지 버스트)"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """토큰을 얻을 때까지 대기하고 대기 시간(초)을 반환"""
+        started = time.monotonic()
+        # 락을 잡은 순서대로 토큰을 받으므로 FIFO 가 보장된다
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= amount
+        return time.monotonic() - started
+
+
+PROVIDERS = ("perplexity", "embeddings", "openai")
+DEFAULT_USER = "default"
+
+
+class ProviderLimit(NamedTuple):
+    """공급자 분당 한도 (None 이면 제한 없음, 버스트는 1분치까지)"""
+    requests_per_minute: float = None
+    tokens_per_minute: float = None
+
+
+def _take(levels: dict, limit: ProviderLimit, tokens: float, now: float) -> float:
+    """levels {"requests" | "tokens": (남은 양, 갱신 시각)} 에서 요청 1건 + tokens 를 한꺼번에 꺼낸다
+
+    둘 다 충분하면 꺼내고 0, 하나라도 모자라면 꺼내지 않고 기다려야 할 초를 반환한다.
+    """
+    budgets = {"requests": (limit.requests_per_minute, 1.0), "tokens": (limit.tokens_per_minute, tokens)}
+    refilled, wait = {}, 0.0
+    for kind, (per_minute, amount) in budgets.items():
+        if not per_minute:
+            continue
+        level, updated = levels.get(kind, (per_minute, now))
+        level = min(per_minute, level + (now - updated) * per_minute / 60)
+        # 1분치보다 큰 요청도 버킷이 가득 차면 통과시킨다
+        amount = min(amount, per_minute)
+        refilled[kind] = (level, amount)
+        if level < amount:
+            wait = max(wait, (amount - level) * 60 / per_minute)
+    for kind, (level, amount) in refilled.items():
+        levels[kind] = (level if wait else level - amount, now)
+    return wait
+
+
+class MemoryBudgetStore:
+    """프로세스 안에서만 공유하는 요청 / 토큰 예산"""
+
+    def __init__(self):
+        self._levels = {}
+        self._lock = threading.Lock()
+
+    def take(self, provider: str, limit: ProviderLimit, tokens: float) -> float:
+        with self._lock:
+            return _take(self._levels.setdefault(provider, {}), limit, tokens, time.monotonic())
+
+
+class SQLiteBudgetStore:
+    """같은 파일을 쓰는 프로세스끼리 나눠 쓰는 요청 / 토큰 예산 (Streamlit 여러 대, 배치 워커 등)"""
+
+    def __init__(self, path: str = ".rate_limit.sqlite"):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS budgets ("
+                "provider TEXT NOT NULL, kind TEXT NOT NULL, level REAL NOT NULL, "
+                "updated REAL NOT NULL, PRIMARY KEY (provider, kind))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def take(self, provider: str, limit: ProviderLimit, tokens: float) -> float:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = {
+                    kind: (level, updated) for kind, level, updated in conn.execute(
+                        "SELECT kind, level, updated FROM budgets WHERE provider = ?", (provider,)
+                    )
+                }
+                # 프로세스 간에는 monotonic 시계를 공유할 수 없다
+                wait = _take(levels, limit, tokens, time.time())
+                conn.executemany(
+                    "INSERT OR REPLACE INTO budgets (provider, kind, level, updated) VALUES (?, ?, ?, ?)",
+                    [(provider, kind, level, updated) for kind, (level, updated) in levels.items()]
+                )
+                conn.execute("COMMIT")
+                return wait
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+
+class RateLimiter:
+    """공급자별 요청 / 토큰 한도 + 사용자별 공정 큐
+
+    한도가 있는 공급자는 사용자별 start-time fair queuing 으로 차례를 정한다. 요청마다
+    사용자의 이전 요청이 끝난 가상 시각부터 비용(토큰 한도가 있으면 토큰 수, 없으면 1)만큼
+    태그를 매기고, 태그가 가장 작은 요청부터 예산을 받는다. 배치가 요청을 수백 개 쌓아도
+    새로 온 대화형 사용자의 요청은 현재 가상 시각에서 시작하므로 바로 다음 차례가 된다.
+    weights 로 사용자별 몫을 조정한다 (기본 1).
+    세션마다 사용자가 새로 생기므로, 가상 시각보다 앞선 사용자 상태는 요청이 통과할 때 지우고
+    사용자별 대기 통계는 최근 max_stats_users 명만 남긴다.
+
+    토큰 예산은 요청 전에 입력 추정치 + max_tokens 로 잡는다 (OpenAI 도 같은 방식으로 센다).
+    store 에 SQLiteBudgetStore 를 주면 예산은 여러 프로세스가 나눠 쓰고, 공정 큐는 프로세스마다 둔다.
+    """
+
+    def __init__(self, limits: dict = None, store=None, weights: dict = None,
+                 poll_interval: float = 0.05, max_stats_users: int = 1000):
+        self.limits = {
+            provider: limit for provider, limit in (limits or {}).items()
+            if limit.requests_per_minute or limit.tokens_per_minute
+        }
+        self.store = store or MemoryBudgetStore()
+        self.weights = weights or {}
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._pending = {provider: [] for provider in self.limits}
+        self._virtual = {provider: 0.0 for provider in self.limits}
+        self._finish = {provider: {} for provider in self.limits}
+        # 맨 앞 요청이 _cond 밖에서 예산 저장소를 확인하는 중인 공급자
+        self._taking = set()
+        self._sequence = itertools.count()
+        self._stats = OrderedDict()
+        self.max_stats_users = max_stats_users
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """{PROVIDER}_RPM / {PROVIDER}_TPM 환경 변수 (예: OPENAI_TPM=30000), RATE_LIMIT_DB 면 프로세스 간 공유"""
+        limits = {}
+        for provider in PROVIDERS:
+            rpm = os.environ.get(f"{provider.upper()}_RPM")
+            tpm = os.environ.get(f"{provider.upper()}_TPM")
+            limits[provider] = ProviderLimit(float(rpm) if rpm else None, float(tpm) if tpm else None)
+        path = os.environ.get("RATE_LIMIT_DB")
+        return cls(limits, SQLiteBudgetStore(path) if path else None)
+
+    def _enqueue(self, provider: str, user: str, tokens: float) -> tuple:
+        limit = self.limits[provider]
+        cost = (max(tokens, 1.0) if limit.tokens_per_minute else 1.0) / self.weights.get(user, 1.0)
+        finish = self._finish[provider]
+        start = max(self._virtual[provider], finish.get(user, 0.0))
+        finish[user] = start + cost
+        ticket = (start, next(self._sequence), user)
+        heapq.heappush(self._pending[provider], ticket)
+        return ticket
+
+    def _claim(self, provider: str, ticket: tuple) -> bool:
+        """차례이고 다른 요청이 예산을 확인하는 중이 아니면 확인할 권리를 잡는다 (호출 측에서 _cond 보유)"""
+        if self._pending[provider][0] is not ticket or provider in self._taking:
+            return False
+        self._taking.add(provider)
+        return True
+
+    def _take_budget(self, provider: str, ticket: tuple, tokens: float) -> float:
+        """_claim 한 요청의 예산을 꺼내 0 또는 기다릴 초 반환
+
+        저장소 왕복(SQLite 는 디스크 잠금)은 _cond 밖에서 하고, 결과는 잠금 안에서 반영한다.
+        그동안 더 앞선 태그의 요청이 들어와도 이미 예산을 받았으므로 그대로 통과시킨다.
+        """
+        wait = None
+        try:
+            wait = self.store.take(provider, self.limits[provider], tokens)
+        finally:
+            with self._cond:
+                self._taking.discard(provider)
+                if wait == 0:
+                    self._dequeue(provider, ticket)
+                self._cond.notify_all()
+        return wait
+
+    def _dequeue(self, provider: str, ticket: tuple):
+        """예산을 받은 요청을 큐에서 빼고 가상 시각을 옮긴다 (호출 측에서 _cond 보유)"""
+        queue = self._pending[provider]
+        if queue[0] is ticket:
+            heapq.heappop(queue)
+        else:
+            queue.remove(ticket)
+            heapq.heapify(queue)
+        # 큐가 비면 (SFQ 의 유휴 구간) 가상 시각을 지금까지 통과한 요청의 마지막 종료 태그로 옮긴다
+        finish = self._finish[provider]
+        self._virtual[provider] = ticket[0] if queue else max(finish.values(), default=ticket[0])
+        self._prune(provider)
+
+    def _prune(self, provider: str):
+        """가상 시각 이전에 끝난 사용자 상태 삭제 (다음 요청의 시작 태그는 어차피 가상 시각)"""
+        virtual = self._virtual[provider]
+        finish = self._finish[provider]
+        for user in [user for user, tag in finish.items() if tag <= virtual]:
+            del finish[user]
+
+    def _cancel(self, provider: str, ticket: tuple):
+        queue = self._pending[provider]
+        if ticket in queue:
+            queue.remove(ticket)
+            heapq.heapify(queue)
+            self._cond.notify_all()
+
+    def acquire(self, provider: str, tokens: float = 0, user: str = DEFAULT_USER) -> float:
+        """차례가 오고 예산이 생길 때까지 대기하고 대기 시간(초)을 반환 (한도 없는 공급자는 바로 0)"""
+        if provider not in self.limits:
+            return 0.0
+        started = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(provider, user, tokens)
+        try:
+            while True:
+                with self._cond:
+                    while not self._claim(provider, ticket):
+                        # 앞 요청이 통과하거나 예산 확인을 마치면 깨어난다
+                        self._cond.wait(self.poll_interval * 20)
+                wait = self._take_budget(provider, ticket, tokens)
+                if wait == 0:
+                    break
+                with self._cond:
+                    # 다른 프로세스가 예산을 쓸 수 있어 기다린 만큼 지난 뒤 다시 확인
+                    self._cond.wait(wait)
+        except BaseException:
+            with self._cond:
+                self._cancel(provider, ticket)
+            raise
+        return self._record(provider, user, time.monotonic() - started)
+
+    async def aacquire(self, provider: str, tokens: float = 0, user: str = DEFAULT_USER) -> float:
+        """acquire 의 비동기 버전 (이벤트 루프를 막지 않도록 폴링)"""
+        if provider not in self.limits:
+            return 0.0
+        started = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(provider, user, tokens)
+        try:
+            while True:
+                with self._cond:
+                    claimed = self._claim(provider, ticket)
+                wait = self._take_budget(provider, ticket, tokens) if claimed else None
+                if wait == 0:
+                    break
+                await asyncio.sleep(wait or self.poll_interval)
+        except BaseException:
+            with self._cond:
+                self._cancel(provider, ticket)
+            raise
+        return self._record(provider, user, time.monotonic() - started)
+
+    def _record(self, provider: str, user: str, waited: float) -> float:
+        with self._cond:
+            key = (provider, user)
+            stats = self._stats.setdefault(key, {"requests": 0, "wait_sum": 0.0, "wait_max": 0.0})
+            stats["requests"] += 1
+            stats["wait_sum"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+            # 가장 오래 요청이 없던 사용자부터 통계에서 뺀다
+            self._stats.move_to_end(key)
+            while len(self._stats) > self.max_stats_users:
+                self._stats.popitem(last=False)
+        return waited
+
+    def stats(self) -> dict:
+        """{공급자: {"queued": 대기 중 요청 수, "users": {최근 사용자: 요청 수 / 평균 / 최대 대기}}}"""
+        with self._cond:
+            report = {provider: {"queued": len(queue), "users": {}} for provider, queue in self._pending.items()}
+            for (provider, user), s in self._stats.items():
+                report[provider]["users"][user] = {**s, "wait_mean": s["wait_sum"] / s["requests"]}
+        return report
+
+
+# 환경 변수로 한도를 주면 이 프로세스의 모든 에이전트(세션, 워커)가 함께 쓴다
+default_rate_limiter = RateLimiter.from_env()
@@ -0,0 +1,190 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from bm25 import BM25Index
+
+# 매 분석마다 같은 고정 검색어 (벡터는 인덱스와 함께 한 번만 계산)
+STATIC_QUERIES = [
+    "competitive advantage moat",
+    "business quality evaluation",
+]
+# 검색어별 문서 수. 고정 검색어 결과는 분석 프롬프트의 공유 접두부가 되므로
+# 공급자 프롬프트 캐시 최소 길이(1024 토큰)를 넘도록 조금 더 가져온다
+QUERY_DEPTH = 2
+PRINCIPLE_DEPTH = 3
+
+# 검색 방식: vector(임베딩), hybrid(임베딩 + BM25, RRF 결합), lexical(BM25 만, 네트워크 호출 없음)
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+# RRF 결합 전에 각 방식에서 가져올 후보 수와 순위 평활 상수
+FUSION_DEPTH = 10
+RRF_K = 60
+
+
+class EmbeddingLRU:
+    """(모델, 텍스트) -> 임베딩 벡터 LRU 캐시 (스레드 안전, 프로세스 공유)"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            vector = self._data.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        with self._lock:
+            self._data[key] = vector
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+# 검색어 벡터는 API 키와 무관하므로 모든 에이전트가 공유
+query_embedding_cache = EmbeddingLRU()
+
+
+def embed_query_cached(embeddings, text: str, model: str, throttle=None):
+    """LRU 를 거쳐 검색어 임베딩. (벡터, 캐시 적중 여부) 반환
+
+    throttle 은 캐시 미스로 API 를 호출하기 직전에만 부른다 (속도 제한 대기).
+    """
+    key = (model, text)
+    vector = query_embedding_cache.get(key)
+    if vector is not None:
+        return vector, True
+    if throttle is not None:
+        throttle()
+    vector = embeddings.embed_query(text)
+    query_embedding_cache.put(key, vector)
+    return vector, False
+
+
+async def aembed_query_cached(embeddings, text: str, model: str, throttle=None):
+    """embed_query_cached 의 비동기 버전 (throttle 은 코루틴 함수)"""
+    key = (model, text)
+    vector = query_embedding_cache.get(key)
+    if vector is not None:
+        return vector, True
+    if throttle is not None:
+        await throttle()
+    vector = await embeddings.aembed_query(text)
+    query_embedding_cache.put(key, vector)
+    return vector, False
+
+
+def attach_static_vectors(vector_store, embeddings, vectors: dict = None) -> dict:
+    """고정 검색어 벡터를 인덱스 객체에 붙여 둔다 (없으면 한 번의 배치 호출로 계산)"""
+    existing = getattr(vector_store, "static_query_vectors", None)
+    if existing and all(q in existing for q in STATIC_QUERIES):
+        return existing
+    if not vectors or not all(q in vectors for q in STATIC_QUERIES):
+        vectors = dict(zip(STATIC_QUERIES, embeddings.embed_documents(STATIC_QUERIES)))
+    vector_store.static_query_vectors = vectors
+    return vectors
+
+
+def _search_store(vector_store, matrix, k: int) -> list:
+    """검색어별 (거리, 문서) 목록"""
+    if getattr(vector_store, "_normalize_L2", False):
+        import faiss
+        matrix = matrix.copy()
+        faiss.normalize_L2(matrix)
+
+    distances, indices = vector_store.index.search(matrix, k)
+    results = []
+    for row_distances, row in zip(distances, indices):
+        hits = []
+        for distance, i in zip(row_distances, row):
+            if i == -1:
+                continue
+            doc_id = vector_store.index_to_docstore_id[i]
+            hits.append((float(distance), vector_store.docstore.search(doc_id)))
+        results.append(hits)
+    return results
+
+
+def batch_search(vector_store, vectors: list, k: int = 2) -> list:
+    """여러 검색어 벡터를 FAISS 한 번의 search 호출로 검색. 검색어별 문서 목록 반환
+
+    vector_store 가 여러 샤드(corpus.ShardedIndex)이면 샤드마다 검색한 뒤 거리순으로 합친다.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    shards = getattr(vector_store, "shards", None)
+    if shards is None:
+        return [[doc for _, doc in hits] for hits in _search_store(vector_store, matrix, k)]
+
+    merged = [[] for _ in vectors]
+    for shard in shards:
+        for row, hits in zip(merged, _search_store(shard, matrix, k)):
+            row.extend(hits)
+    descending = getattr(vector_store, "higher_is_closer", False)
+    return [
+        [doc for _, doc in sorted(row, key=lambda hit: hit[0], reverse=descending)[:k]]
+        for row in merged
+    ]
+
+
+def attach_bm25(vector_store, index: BM25Index = None) -> BM25Index:
+    """FAISS 스토어와 같은 청크로 BM25 역색인을 만들어 붙여 둔다 (이미 있으면 재사용)"""
+    existing = getattr(vector_store, "bm25", None)
+    if existing is not None:
+        return existing
+    if index is None:
+        texts = [
+            vector_store.docstore.search(vector_store.index_to_docstore_id[i]).page_content
+            for i in range(len(vector_store.index_to_docstore_id))
+        ]
+        index = BM25Index.build(texts)
+    vector_store.bm25 = index
+    return index
+
+
+def lexical_search(vector_store, queries: list, k: int = 2) -> list:
+    """BM25 로 검색어별 문서 목록 반환 (샤드가 여러 개면 점수순으로 합친다)"""
+    stores = getattr(vector_store, "shards", None) or [vector_store]
+    merged = [[] for _ in queries]
+    for store in stores:
+        bm25 = attach_bm25(store)
+        for row, query in zip(merged, queries):
+            for i, score in bm25.search(query, k):
+                doc_id = store.index_to_docstore_id[i]
+                row.append((score, store.docstore.search(doc_id)))
+    return [
+        [doc for _, doc in sorted(row, key=lambda hit: hit[0], reverse=True)[:k]]
+        for row in merged
+    ]
+
+
+def rrf_fuse(rankings: list, k: int = 2, rrf_k: int = RRF_K) -> list:
+    """여러 순위 목록을 reciprocal rank fusion 으로 합쳐 상위 k 개 문서 반환"""
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            # 같은 docstore 의 Document 객체는 같은 청크를 가리킨다
+            key = id(doc)
+            docs[key] = doc
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ranked[:k]]
+
+
+def index_signature(vector_store) -> tuple:
+    """인덱스 식별값 (빌드마다 새로 만들어지고 캐시에서 로드해도 같은 docstore id 사용)"""
+    if vector_store is None:
+        return ()
+    stores = getattr(vector_store, "shards", None) or [vector_store]
+    return tuple(
+        (store.index_to_docstore_id[0], len(store.index_to_docstore_id)) if store.index_to_docstore_id
+        else ("", 0)
+        for store in stores
+    )
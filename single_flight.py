@@ -0,0 +1,236 @@
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class _Call:
+    """진행 중인 실행 하나와 그 결과를 기다리는 쪽들"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = []
+
+    def wait(self):
+        self.event.wait()
+        return self.outcome()
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SQLiteFlightStore:
+    """프로세스 간 실행 병합용 SQLite 테이블 (같은 파일을 쓰는 워커끼리 리더 한 명만 실행)
+
+    리더는 행을 선점하고 끝나면 결과(JSON)를 기록한다. 그동안 도착한 다른 프로세스는
+    poll_interval 마다 결과를 확인한다. lease 초 안에 끝나지 않은 리더는 죽은 것으로 보고
+    다른 프로세스가 넘겨받는다.
+    """
+
+    def __init__(self, path: str = ".single_flight.sqlite", poll_interval: float = 0.05,
+                 lease: float = 300, result_ttl: float = 60):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.result_ttl = result_ttl
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS flights ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, started REAL NOT NULL, "
+                "finished REAL, result TEXT, error TEXT)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _claim(self, key: str, arrived: float) -> str:
+        """리더가 되면 owner 토큰, 이미 진행 중이면 None"""
+        now = time.time()
+        owner = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT started, finished FROM flights WHERE key = ?", (key,)
+                ).fetchone()
+                in_flight = row is not None and (
+                    (row[1] is None and row[0] > now - self.lease)
+                    # 도착 이후에 끝난 실행의 결과는 기다리던 쪽이 가져간다
+                    or (row[1] is not None and row[1] >= arrived)
+                )
+                if in_flight:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "INSERT OR REPLACE INTO flights (key, owner, started, finished, result, error) "
+                    "VALUES (?, ?, ?, NULL, NULL, NULL)",
+                    (key, owner, now)
+                )
+                conn.execute("COMMIT")
+                return owner
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _poll(self, key: str, arrived: float):
+        """(완료 여부, 결과). 리더가 사라졌으면 (None, None) 으로 다시 선점 시도"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT started, finished, result, error FROM flights WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (row[1] is None and row[0] <= time.time() - self.lease):
+            return None, None
+        if row[1] is None:
+            return False, None
+        if row[1] < arrived:
+            return None, None
+        if row[3] is not None:
+            raise RuntimeError(f"병합된 실행 실패: {row[3]}")
+        return True, json.loads(row[2])
+
+    def _finish(self, key: str, owner: str, result=None, error: str = None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE flights SET finished = ?, result = ?, error = ? WHERE key = ? AND owner = ?",
+                (now, None if error else json.dumps(result, ensure_ascii=False, default=str),
+                 error, key, owner)
+            )
+            conn.execute("DELETE FROM flights WHERE finished < ?", (now - self.result_ttl,))
+
+    def run(self, key: str, fn) -> tuple:
+        """(결과, 다른 프로세스 결과를 받았는지)"""
+        arrived = time.time()
+        while True:
+            owner = self._claim(key, arrived)
+            if owner is not None:
+                try:
+                    result = fn()
+                except Exception as e:
+                    self._finish(key, owner, error=str(e))
+                    raise
+                self._finish(key, owner, result)
+                return result, False
+            while True:
+                done, result = self._poll(key, arrived)
+                if done is None:
+                    break
+                if done:
+                    return result, True
+                time.sleep(self.poll_interval)
+
+    async def arun(self, key: str, afn) -> tuple:
+        """run 의 비동기 버전 (afn 은 코루틴 함수)"""
+        arrived = time.time()
+        while True:
+            owner = self._claim(key, arrived)
+            if owner is not None:
+                try:
+                    result = await afn()
+                except Exception as e:
+                    self._finish(key, owner, error=str(e))
+                    raise
+                self._finish(key, owner, result)
+                return result, False
+            while True:
+                done, result = self._poll(key, arrived)
+                if done is None:
+                    break
+                if done:
+                    return result, True
+                await asyncio.sleep(self.poll_interval)
+
+
+class SingleFlight:
+    """같은 키로 동시에 들어온 실행을 하나로 합친다
+
+    처음 도착한 호출(리더)만 실제로 실행하고, 끝나기 전에 같은 키로 들어온 호출은
+    그 결과(또는 예외)를 함께 받는다. 스레드와 이벤트 루프를 가리지 않으며,
+    store(SQLiteFlightStore)를 주면 같은 파일을 쓰는 다른 프로세스와도 합친다.
+    """
+
+    def __init__(self, store: SQLiteFlightStore = None):
+        self.store = store
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def begin(self, key: str, loop=None) -> tuple:
+        """(call, 리더 여부, 팔로워용 future). loop 를 주면 팔로워는 future 로 결과를 받는다"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.stats["leaders"] += 1
+                return call, True, None
+            self.stats["followers"] += 1
+            future = None
+            if loop is not None:
+                future = loop.create_future()
+                call.waiters.append((loop, future))
+            return call, False, future
+
+    def finish(self, key: str, call: _Call, result=None, error: BaseException = None):
+        """리더가 결과를 알리고 키를 비운다 (이후 도착한 호출은 새로 실행)"""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.error = error
+        call.event.set()
+        for loop, future in call.waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def do(self, key: str, fn) -> tuple:
+        """(결과, 다른 실행의 결과를 받았는지)"""
+        call, leader, _ = self.begin(key)
+        if not leader:
+            return call.wait(), True
+        try:
+            if self.store is not None:
+                result, shared = self.store.run(key, fn)
+            else:
+                result, shared = fn(), False
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result)
+        return result, shared
+
+    async def ado(self, key: str, afn) -> tuple:
+        """do 의 비동기 버전 (afn 은 코루틴 함수)"""
+        call, leader, future = self.begin(key, asyncio.get_running_loop())
+        if not leader:
+            await future
+            return call.outcome(), True
+        try:
+            if self.store is not None:
+                result, shared = await self.store.arun(key, afn)
+            else:
+                result, shared = await afn(), False
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result)
+        return result, shared
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+# 프로세스 안의 모든 에이전트(Streamlit 세션 등)가 공유
+default_single_flight = SingleFlight()
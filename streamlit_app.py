@@ -1,6 +1,11 @@
 import streamlit as st
 import os
-from agent import InvestmentAgent
+from agent import EMBEDDING_MODEL
+from corpus import LetterCorpus
+from app_session import base_documents, login, logout, upload_pdf, start_analysis
+from langchain_openai import OpenAIEmbeddings
+from market_cache import MarketDataCache
+from answer_cache import SemanticAnswerCache
 from streamlit_extras.colored_header import colored_header
 from streamlit_extras.add_vertical_space import add_vertical_space
 from streamlit_option_menu import option_menu
@@ -39,11 +44,43 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+
+@st.cache_resource
+def get_market_cache():
+    """모든 세션이 공유하는 Perplexity 시장 데이터 캐시"""
+    return MarketDataCache(ttl=300, stale_ttl=3600)
+
+
+@st.cache_resource
+def get_answer_cache():
+    """모든 세션이 공유하는 의미 기반 답변 캐시 (비슷한 질문은 15분간 재사용)"""
+    return SemanticAnswerCache(threshold=0.93, ttl=900, max_entries=500)
+
+
+@st.cache_resource
+def get_corpus():
+    """모든 세션이 공유하는 서한 코퍼스 (문서별 샤드, 업로드 PDF 는 내용 해시로 최근 200개까지 저장)"""
+    return LetterCorpus(max_uploads=200)
+
+
+@st.cache_resource(show_spinner="📚 버크셔 서한 인덱스 준비 중...")
+def get_base_documents(pdf_path: str, pdf_mtime: float, _openai_api_key: str) -> list:
+    """프로세스당 한 번만 기본 PDF 를 코퍼스에 등록 (모든 세션이 읽기 전용으로 공유)
+
+    pdf_mtime 이 바뀌면 다시 등록한다. 샤드가 디스크에 있으면 임베딩 호출 없이 로드되고,
+    없을 때만 처음 로그인한 사용자의 키로 한 번 임베딩한다.
+    """
+    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, api_key=_openai_api_key)
+    return base_documents(get_corpus(), pdf_path, embeddings)
+
+
 # 세션 상태 초기화
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
 if "agent" not in st.session_state:
     st.session_state.agent = None
+if "uploaded_docs" not in st.session_state:
+    st.session_state.uploaded_docs = []
 
 # 로그인 페이지
 if not st.session_state.logged_in:
@@ -97,16 +134,19 @@ if not st.session_state.logged_in:
                 else:
                     try:
                         with st.spinner("로그인 중..."):
-                            default_pdf = "stockking.pdf"
-                            pdf_path = default_pdf if os.path.exists(default_pdf) else None
-
-                            agent = InvestmentAgent(
-                                openai_api_key=openai_key,
-                                perplexity_api_key=perplexity_key,
-                                pdf_path=pdf_path
+                            default_pdf = os.path.abspath("stockking.pdf")
+                            base_docs = []
+                            if os.path.exists(default_pdf):
+                                base_docs = get_base_documents(
+                                    default_pdf, os.path.getmtime(default_pdf), openai_key
+                                )
+
+                            agent = login(
+                                st.session_state, get_corpus(), base_docs,
+                                openai_key, perplexity_key,
+                                market_cache=get_market_cache(),
+                                answer_cache=get_answer_cache()
                             )
-                            st.session_state.agent = agent
-                            st.session_state.logged_in = True
 
                             if agent.vector_store:
                                 st.success(f"✅ 로그인 성공! RAG 시스템 활성화됨", icon="✨")
@@ -152,8 +192,7 @@ else:
     with col_logout:
         add_vertical_space(1)
         if st.button("🚪 로그아웃", use_container_width=True, type="secondary"):
-            st.session_state.logged_in = False
-            st.session_state.agent = None
+            logout(st.session_state)
             st.rerun()
 
     st.markdown("---")
@@ -187,22 +226,18 @@ else:
 
         add_vertical_space(1)
 
-        # 변수 초기화 (여기에 추가!)
+        # 변수 초기화 (슬라이더 값은 key 로 세션에 저장되어 analysis_params 가 읽는다)
         uploaded_file = None
-        perplexity_max_tokens = 1500
-        perplexity_temperature = 0.2
-        openai_max_tokens = 2000
-        openai_temperature = 0.3
 
         if selected == "🎛️ 파라미터":
             st.markdown("### 🔍 Perplexity 설정")
-            perplexity_max_tokens = st.slider(
+            st.slider(
                 "Max Tokens",
                 500, 3000, 1500,
                 key="pplx_tokens",
                 help="응답 길이"
             )
-            perplexity_temperature = st.slider(
+            st.slider(
                 "Temperature",
                 0.0, 1.0, 0.2,
                 step=0.1,
@@ -213,13 +248,13 @@ else:
             add_vertical_space(1)
 
             st.markdown("### 🤖 OpenAI 설정")
-            openai_max_tokens = st.slider(
+            st.slider(
                 "Max Tokens",
                 500, 4000, 2000,
                 key="openai_tokens",
                 help="분석 길이"
             )
-            openai_temperature = st.slider(
+            st.slider(
                 "Temperature",
                 0.0, 1.0, 0.3,
                 step=0.1,
@@ -227,6 +262,22 @@ else:
                 help="분석 창의성"
             )
 
+            add_vertical_space(1)
+
+            st.markdown("### 📚 서한 검색 방식")
+            st.radio(
+                "검색 방식",
+                ["vector", "hybrid", "lexical"],
+                format_func={
+                    "vector": "의미 검색 (임베딩)",
+                    "hybrid": "하이브리드 (임베딩 + 키워드)",
+                    "lexical": "키워드 검색 (BM25, API 호출 없음)",
+                }.get,
+                key="retrieval_mode",
+                label_visibility="collapsed",
+                help="임베딩 API가 느리거나 장애일 때는 키워드 검색을 사용하세요"
+            )
+
         else:  # PDF 업로드
             st.markdown("### 📄 버크셔 서한 업로드")
             uploaded_file = st.file_uploader(
@@ -236,10 +287,17 @@ else:
             )
 
             if uploaded_file:
-                with open("temp_uploaded.pdf", "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                st.success("✓ PDF 업로드 완료", icon="✅")
-                st.info(f"📄 {uploaded_file.name}")
+                with st.spinner("📚 업로드한 서한 인덱싱 중..."):
+                    digest = upload_pdf(
+                        st.session_state, get_corpus(),
+                        uploaded_file.getvalue(), uploaded_file.name
+                    )
+                if digest:
+                    st.success("✓ PDF 업로드 완료", icon="✅")
+                    st.info(f"📄 {uploaded_file.name} (검색 대상 서한 "
+                            f"{len(st.session_state.base_docs) + len(st.session_state.uploaded_docs)}편)")
+                else:
+                    st.warning("PDF에서 텍스트를 추출하지 못했습니다.", icon="⚠️")
             else:
                 st.info("PDF를 업로드하면 버핏의 인사이트가 분석에 반영됩니다.", icon="💡")
 
@@ -304,31 +362,21 @@ else:
         else:
             with st.spinner("🔍 시장 데이터 수집 중..."):
                 try:
-                    # 파라미터 가져오기
-                    if 'pplx_tokens' in st.session_state:
-                        perplexity_max_tokens = st.session_state.pplx_tokens
-                        perplexity_temperature = st.session_state.pplx_temp
-                        openai_max_tokens = st.session_state.openai_tokens
-                        openai_temperature = st.session_state.openai_temp
-                    else:
-                        perplexity_max_tokens = 1500
-                        perplexity_temperature = 0.2
-                        openai_max_tokens = 2000
-                        openai_temperature = 0.3
-
-                    pdf_path = "temp_uploaded.pdf" if uploaded_file else None
-
-                    result = st.session_state.agent.analyze_stock(
-                        user_query=user_query,
-                        pdf_path=pdf_path,
-                        perplexity_max_tokens=perplexity_max_tokens,
-                        perplexity_temperature=perplexity_temperature,
-                        openai_max_tokens=openai_max_tokens,
-                        openai_temperature=openai_temperature
-                    )
+                    # 사이드바 파라미터와 검색 방식은 세션 상태에서 읽는다
+                    events = start_analysis(st.session_state, user_query)
+
+                    result = {}
+
+                    def analysis_tokens():
+                        """분석 토큰만 화면으로 흘려보내고 최종 상태는 result에 저장"""
+                        for kind, payload in events:
+                            if kind == "token":
+                                yield payload
+                            else:
+                                result.update(payload)
 
                     add_vertical_space(1)
-                    st.success("✅ 분석 완료!", icon="✨")
+                    status_area = st.empty()
 
                     # 결과 탭
                     tab1, tab2, tab3 = st.tabs([
@@ -344,7 +392,11 @@ else:
                             color_name="green-70"
                         )
 
-                        st.markdown(result["final_analysis"])
+                        # 토큰이 도착하는 대로 표시
+                        streamed = st.write_stream(analysis_tokens())
+                        if not streamed:
+                            # 오류 등으로 토큰 없이 끝난 경우
+                            st.markdown(result["final_analysis"])
 
                         add_vertical_space(1)
 
@@ -358,6 +410,40 @@ else:
                                 use_container_width=True
                             )
 
+                    with status_area.container():
+                        st.success("✅ 분석 완료!", icon="✨")
+
+                        timings = result.get("node_timings", {})
+                        if result.get("cached_from"):
+                            st.caption(
+                                f"💾 비슷한 질문 \"{result['cached_from']}\"의 분석을 재사용했습니다 "
+                                f"({timings.get('total', 0):.2f}초)"
+                            )
+                        elif timings:
+                            st.caption(
+                                f"⏱️ Perplexity {timings.get('perplexity_research', 0):.1f}초 · "
+                                f"RAG {timings.get('rag_wisdom', 0):.1f}초 (병렬) → "
+                                f"첫 토큰 {timings.get('time_to_first_token', 0):.1f}초 · "
+                                f"OpenAI {timings.get('openai_analysis', 0):.1f}초 · "
+                                f"전체 {timings.get('total', 0):.1f}초"
+                            )
+
+                        node_metrics = result.get("metrics", {})
+                        if node_metrics:
+                            with st.expander("⏱️ 단계별 처리 시간 · 토큰 · 비용", expanded=False):
+                                st.table([
+                                    {
+                                        "단계": node,
+                                        "전체(초)": round(m["wall_time"], 2),
+                                        "HTTP(초)": round(m["http_time"], 2),
+                                        "입력 토큰": m["prompt_tokens"],
+                                        "캐시 입력 토큰": m.get("cached_tokens", 0),
+                                        "출력 토큰": m["completion_tokens"],
+                                        "예상 비용($)": round(m["cost_usd"], 4),
+                                    }
+                                    for node, m in node_metrics.items()
+                                ])
+
                     with tab2:
                         colored_header(
                             label="Perplexity 수집 정보",
@@ -392,6 +478,8 @@ else:
 
                     if result.get("error"):
                         st.warning(f"⚠️ {result['error']}", icon="⚠️")
+                    if result.get("warnings"):
+                        st.info(result["warnings"], icon="ℹ️")
 
                 except Exception as e:
                     st.error(f"❌ 오류 발생: {str(e)}", icon="🚨")
@@ -0,0 +1,285 @@
+"""Perplexity / OpenAI 호환 로컬 스텁 서버 (벤치마크, 부하 테스트용)
+
+    POST .../chat/completions  (model 이 sonar* 이면 Perplexity 형식, stream=true 면 SSE)
+    POST .../embeddings        (입력별 결정적 단위 벡터)
+
+지연은 프로필로 정한다: 첫 바이트까지 시간, 초당 출력 토큰, 임베딩 호출/항목당 시간, 지터, 429 비율.
+테스트는 inject 로 다음 요청들에 정해진 실패(429/5xx)나 추가 지연을 건다.
+"""
+import json
+import time
+import random
+import hashlib
+import threading
+import numpy as np
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 초 단위, tokens_per_second=None 이면 출력 토큰 생성 지연 없음
+PROFILES = {
+    "instant": {
+        "first_byte": 0.0, "tokens_per_second": None, "completion_tokens": 400,
+        "embedding_latency": 0.0, "embedding_per_item": 0.0, "jitter": 0.0, "error_rate": 0.0,
+    },
+    "fast": {
+        "first_byte": 0.05, "tokens_per_second": 2000, "completion_tokens": 400,
+        "embedding_latency": 0.01, "embedding_per_item": 0.0001, "jitter": 0.1, "error_rate": 0.0,
+    },
+    # 실제 API 에서 관측한 수준 (Perplexity 는 검색 포함 몇 초, gpt-4o 는 초당 수십 토큰)
+    "realistic": {
+        "first_byte": 0.6, "tokens_per_second": 70, "completion_tokens": 700,
+        "perplexity_first_byte": 3.0, "perplexity_tokens_per_second": 120,
+        "embedding_latency": 0.15, "embedding_per_item": 0.001, "jitter": 0.25, "error_rate": 0.0,
+    },
+}
+EMBEDDING_DIM = 1536
+# OpenAI 는 1024 토큰 이상의 같은 접두부를 128 토큰 단위로 캐시한다
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_BLOCK = 128
+
+_FILLER = (
+    "The company reported steady revenue growth and healthy free cash flow. "
+    "Analysts expect margins to remain stable as competition intensifies. "
+    "Management reiterated its capital allocation priorities, including buybacks. "
+)
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def embedding_vector(text, dim: int = EMBEDDING_DIM) -> list:
+    """입력(문자열 또는 토큰 id 목록)마다 항상 같은 단위 벡터"""
+    raw = text if isinstance(text, str) else json.dumps(text)
+    seed = int.from_bytes(hashlib.sha256(raw.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class StubProvider:
+    """프로필에 따라 지연과 응답을 만드는 요청 처리기 (서버와 분리해 재사용)"""
+
+    def __init__(self, profile: dict, latency_scale: float = 1.0, seed: int = 0):
+        self.profile = profile
+        self.latency_scale = latency_scale
+        self._random = random.Random(seed)
+        self._prefixes = set()
+        self._lock = threading.Lock()
+        self.stats = {"chat": 0, "perplexity": 0, "embeddings": 0, "embedded_items": 0, "errors": 0}
+        # 도착 순서대로 요청에 하나씩 적용할 (상태 코드, 추가 지연, Retry-After)
+        self._faults = deque()
+
+    def inject(self, status: int = None, delay: float = 0.0, count: int = 1, retry_after: str = "0"):
+        """다음 count 개 요청을 status 로 실패시키거나 delay 초 늦춘다 (재시도 / 헤징 테스트용)"""
+        with self._lock:
+            self._faults.extend([(status, delay, retry_after)] * count)
+
+    def next_fault(self):
+        """이번 요청에 적용할 장애 (없으면 None)"""
+        with self._lock:
+            if not self._faults:
+                return None
+            fault = self._faults.popleft()
+            if fault[0]:
+                self.stats["errors"] += 1
+            return fault
+
+    def _delay(self, seconds: float) -> float:
+        with self._lock:
+            jitter = self._random.uniform(-1, 1) * self.profile.get("jitter", 0.0)
+        return max(0.0, seconds * (1 + jitter) * self.latency_scale)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            failed = self._random.random() < self.profile.get("error_rate", 0.0)
+            if failed:
+                self.stats["errors"] += 1
+        return failed
+
+    def _setting(self, name: str, perplexity: bool):
+        if perplexity and f"perplexity_{name}" in self.profile:
+            return self.profile[f"perplexity_{name}"]
+        return self.profile[name]
+
+    def _cached_tokens(self, messages: list) -> int:
+        """앞 메시지(시스템 프롬프트)가 이전 요청과 같으면 캐시 적중으로 보고"""
+        if len(messages) < 2:
+            return 0
+        prefix = json.dumps(messages[:-1], ensure_ascii=False, sort_keys=True)
+        tokens = _estimate_tokens(prefix)
+        with self._lock:
+            seen = prefix in self._prefixes
+            self._prefixes.add(prefix)
+        if not seen or tokens < PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        return tokens // PROMPT_CACHE_BLOCK * PROMPT_CACHE_BLOCK
+
+    def chat(self, payload: dict) -> tuple:
+        """(응답 본문, 첫 바이트 지연, 토큰 간 지연, 출력 토큰 목록)"""
+        model = payload.get("model", "")
+        perplexity = model.startswith("sonar")
+        messages = payload.get("messages", [])
+        with self._lock:
+            self.stats["perplexity" if perplexity else "chat"] += 1
+
+        limit = payload.get("max_tokens") or self.profile["completion_tokens"]
+        count = min(limit, self.profile["completion_tokens"])
+        words = (_FILLER * (count // 30 + 1)).split()
+        pieces = [w + " " for w in words][:count]
+        prompt_tokens = sum(_estimate_tokens(str(m.get("content", ""))) for m in messages)
+
+        rate = self._setting("tokens_per_second", perplexity)
+        body = {
+            "id": f"stub-{hashlib.sha1(json.dumps(messages).encode()).hexdigest()[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(pieces)},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(pieces),
+                "total_tokens": prompt_tokens + len(pieces),
+                "prompt_tokens_details": {"cached_tokens": 0 if perplexity else self._cached_tokens(messages)},
+            },
+        }
+        if perplexity:
+            body["citations"] = [f"https://example.com/news/{i}" for i in range(3)]
+        return (body, self._delay(self._setting("first_byte", perplexity)),
+                self._delay(1 / rate) if rate else 0.0, pieces)
+
+    def embeddings(self, payload: dict) -> tuple:
+        """(응답 본문, 지연)"""
+        inputs = payload.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dim = payload.get("dimensions") or EMBEDDING_DIM
+        with self._lock:
+            self.stats["embeddings"] += 1
+            self.stats["embedded_items"] += len(inputs)
+        body = {
+            "object": "list",
+            "model": payload.get("model", ""),
+            "data": [{"object": "embedding", "index": i, "embedding": embedding_vector(item, dim)}
+                     for i, item in enumerate(inputs)],
+            "usage": {"prompt_tokens": sum(_estimate_tokens(json.dumps(x)) for x in inputs),
+                      "total_tokens": sum(_estimate_tokens(json.dumps(x)) for x in inputs)},
+        }
+        delay = self.profile["embedding_latency"] + self.profile["embedding_per_item"] * len(inputs)
+        return body, self._delay(delay)
+
+
+class StubServer:
+    """StubProvider 를 백그라운드 스레드 HTTP 서버로 띄운다
+
+    with StubServer("realistic", latency_scale=0.1) as stub:
+        agent = InvestmentAgent(..., openai_base_url=stub.openai_url,
+                                perplexity_base_url=stub.perplexity_url)
+    """
+
+    def __init__(self, profile="instant", latency_scale: float = 1.0, host: str = "127.0.0.1",
+                 port: int = 0, seed: int = 0):
+        if isinstance(profile, str):
+            profile = PROFILES[profile]
+        self.provider = StubProvider(profile, latency_scale, seed)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}"
+        # OpenAI SDK 는 base_url 뒤에 /chat/completions, /embeddings 를 붙인다
+        self.openai_url = f"{self.url}/v1"
+        self.perplexity_url = self.url
+        self._thread = None
+
+    def _handler(self):
+        provider = self.provider
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                fault = provider.next_fault()
+                if fault is not None:
+                    status, delay, retry_after = fault
+                    time.sleep(delay)
+                    if status:
+                        self._send_json(status, {"error": {"message": f"stub error {status}", "type": "stub"}},
+                                        {"Retry-After": retry_after} if retry_after else None)
+                        return
+                if provider.should_fail():
+                    self._send_json(429, {"error": {"message": "stub rate limit", "type": "rate_limit"}},
+                                    {"Retry-After": "0"})
+                    return
+                if self.path.endswith("/chat/completions"):
+                    self._chat(payload)
+                elif self.path.endswith("/embeddings"):
+                    body, delay = provider.embeddings(payload)
+                    time.sleep(delay)
+                    self._send_json(200, body)
+                else:
+                    self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+            def _chat(self, payload: dict):
+                body, first_byte, per_token, pieces = provider.chat(payload)
+                time.sleep(first_byte)
+                if not payload.get("stream"):
+                    time.sleep(per_token * len(pieces))
+                    self._send_json(200, body)
+                    return
+
+                # OpenAI SSE: 토큰마다 delta, include_usage 면 마지막에 usage 청크
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                base = {"id": body["id"], "object": "chat.completion.chunk",
+                        "created": body["created"], "model": body["model"]}
+                for piece in pieces:
+                    self._event({**base, "choices": [
+                        {"index": 0, "delta": {"content": piece}, "finish_reason": None}
+                    ]})
+                    time.sleep(per_token)
+                self._event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                if (payload.get("stream_options") or {}).get("include_usage"):
+                    self._event({**base, "choices": [], "usage": body["usage"]})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _event(self, data: dict):
+                self.wfile.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def _send_json(self, status: int, body: dict, headers: dict = None):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,85 @@
+# test_market_cache.py
+import time
+import asyncio
+from market_cache import MarketDataCache
+
+
+def perplexity_calls(stub) -> int:
+    return stub.provider.stats["perplexity"]
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_fresh_entry_is_served_without_a_call(stub, client, payload):
+    cache = MarketDataCache(ttl=60, stale_ttl=60)
+    fetch = lambda: client.chat_completions(payload)
+
+    first, status = cache.get_or_fetch("aapl", fetch)
+    assert status == "miss"
+    second, status = cache.get_or_fetch("aapl", fetch)
+    assert status == "hit"
+    assert second == first
+    assert perplexity_calls(stub) == 1
+
+
+def test_stale_entry_is_served_then_refreshed_in_background(stub, client, payload):
+    cache = MarketDataCache(ttl=0.1, stale_ttl=60)
+    fetch = lambda: client.chat_completions(payload)
+    first, _ = cache.get_or_fetch("aapl", fetch)
+    time.sleep(0.15)
+
+    # 갱신이 오래 걸려도 stale 값은 기다리지 않고 바로 나온다
+    stub.provider.inject(delay=0.5)
+    started = time.perf_counter()
+    value, status = cache.get_or_fetch("aapl", fetch)
+    assert status == "stale"
+    assert value == first
+    assert time.perf_counter() - started < 0.3
+
+    assert wait_for(lambda: perplexity_calls(stub) == 2 and not cache._refreshing)
+    assert cache.get_or_fetch("aapl", fetch)[1] == "hit"
+
+
+def test_failed_refresh_keeps_the_stale_value(stub, client, payload):
+    cache = MarketDataCache(ttl=0.1, stale_ttl=60)
+    fetch = lambda: client.chat_completions(payload)
+    first, _ = cache.get_or_fetch("aapl", fetch)
+    time.sleep(0.15)
+
+    stub.provider.inject(status=503, count=client.max_retries + 1)
+    assert cache.get_or_fetch("aapl", fetch) == (first, "stale")
+    assert wait_for(lambda: not cache._refreshing)
+    assert cache.get_or_fetch("aapl", fetch) == (first, "stale")
+
+
+def test_expired_entry_is_fetched_synchronously(stub, client, payload):
+    cache = MarketDataCache(ttl=0.05, stale_ttl=0.05)
+    fetch = lambda: client.chat_completions(payload)
+    cache.get_or_fetch("aapl", fetch)
+    time.sleep(0.15)
+    assert cache.get_or_fetch("aapl", fetch)[1] == "miss"
+    assert perplexity_calls(stub) == 2
+
+
+def test_async_refresh_finishes_before_the_loop_closes(stub, client, payload):
+    cache = MarketDataCache(ttl=0.1, stale_ttl=60)
+
+    async def run():
+        async with client.async_session():
+            afetch = lambda: client.achat_completions(payload)
+            await cache.aget_or_fetch("aapl", afetch)
+            await asyncio.sleep(0.15)
+            stub.provider.inject(delay=0.2)
+            _, status = await cache.aget_or_fetch("aapl", afetch)
+            await cache.adrain()
+            return status
+
+    assert asyncio.run(run()) == "stale"
+    assert perplexity_calls(stub) == 2
+    assert not cache._refreshing
+    assert cache.get_or_fetch("aapl", lambda: None)[1] == "hit"
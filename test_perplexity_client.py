@@ -0,0 +1,147 @@
+# test_perplexity_client.py
+import time
+import asyncio
+import httpx
+import pytest
+import requests
+from perplexity_client import PerplexityClient
+
+
+def warm_up(client, payload, count: int):
+    """헤징 기준이 될 최근 지연시간 샘플을 채운다"""
+    for _ in range(count):
+        client.chat_completions(payload)
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retries_retryable_status_then_succeeds(stub, client, payload, status):
+    stub.provider.inject(status=status, count=2)
+    result = client.chat_completions(payload)
+
+    assert result["choices"][0]["message"]["content"]
+    assert client.stats["requests"] == 3
+    assert client.stats["retries"] == 2
+
+
+def test_gives_up_after_max_retries(stub, client, payload):
+    stub.provider.inject(status=503, count=client.max_retries + 1)
+    with pytest.raises(requests.HTTPError):
+        client.chat_completions(payload)
+    assert client.stats["requests"] == client.max_retries + 1
+
+
+def test_client_error_is_not_retried(stub, client, payload):
+    stub.provider.inject(status=400)
+    with pytest.raises(requests.HTTPError):
+        client.chat_completions(payload)
+    assert client.stats["retries"] == 0
+
+
+def test_retry_after_header_sets_the_backoff(stub, payload):
+    client = PerplexityClient("pplx-test", base_url=stub.perplexity_url, backoff_base=0.01)
+    stub.provider.inject(status=429, retry_after="0.3")
+    started = time.perf_counter()
+    client.chat_completions(payload)
+    assert time.perf_counter() - started >= 0.3
+
+
+def test_async_retries_retryable_status(stub, client, payload):
+    stub.provider.inject(status=429, count=2)
+
+    async def run():
+        async with client.async_session():
+            return await client.achat_completions(payload)
+
+    assert asyncio.run(run())["choices"][0]["message"]["content"]
+    assert client.stats["retries"] == 2
+
+
+def test_async_gives_up_after_max_retries(stub, client, payload):
+    stub.provider.inject(status=502, count=client.max_retries + 1)
+
+    async def run():
+        async with client.async_session():
+            return await client.achat_completions(payload)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(run())
+
+
+@pytest.fixture
+def hedged(stub):
+    client = PerplexityClient("pplx-test", base_url=stub.perplexity_url, hedge_percentile=0.5,
+                              hedge_min_samples=5)
+    yield client
+    client.close()
+
+
+def test_no_hedge_until_enough_samples(stub, hedged, payload):
+    stub.provider.inject(delay=0.3)
+    hedged.chat_completions(payload)
+    assert hedged.stats["hedged"] == 0
+
+
+def test_slow_request_is_hedged_and_the_hedge_wins(stub, hedged, payload):
+    warm_up(hedged, payload, 5)
+    # 첫 요청만 늦추면 두 번째(헤지) 요청이 먼저 끝난다
+    stub.provider.inject(delay=1.0)
+    started = time.perf_counter()
+    result = hedged.chat_completions(payload)
+
+    assert result["choices"][0]["message"]["content"]
+    assert time.perf_counter() - started < 0.8
+    assert hedged.stats["hedged"] == 1
+    assert hedged.stats["hedge_wins"] == 1
+
+
+def test_async_slow_request_is_hedged(stub, hedged, payload):
+    warm_up(hedged, payload, 5)
+    stub.provider.inject(delay=1.0)
+
+    async def run():
+        async with hedged.async_session():
+            started = time.perf_counter()
+            await hedged.achat_completions(payload)
+            return time.perf_counter() - started
+
+    assert asyncio.run(run()) < 0.8
+    assert hedged.stats["hedge_wins"] == 1
+
+
+def test_async_session_closes_only_the_pool_it_opened(stub, client, payload):
+    async def run():
+        async with client.async_session():
+            async with client.async_session():
+                await client.achat_completions(payload)
+            # 안쪽 구간이 끝나도 바깥 구간이 쓰는 풀은 남는다
+            assert len(client._async_clients) == 1
+            await client.achat_completions(payload)
+        return client._async_clients
+
+    assert asyncio.run(run()) == {}
+
+
+def test_async_call_outside_a_session_keeps_no_pool(stub, client, payload):
+    async def run():
+        await client.achat_completions(payload)
+        return client._async_clients
+
+    for _ in range(3):
+        # 루프마다 클라이언트가 쌓이지 않는다
+        assert asyncio.run(run()) == {}
+
+
+def test_pool_left_on_a_closed_loop_is_closed(stub, client, payload):
+    loop = asyncio.new_event_loop()
+    stale = loop.run_until_complete(client.async_session().__aenter__())
+    loop.close()
+    assert stale is client
+    stale_pool = client._async_clients[loop]
+
+    async def run():
+        async with client.async_session():
+            await client.achat_completions(payload)
+        return client._async_clients
+
+    assert asyncio.run(run()) == {}
+    assert stale_pool.is_closed
@@ -0,0 +1,178 @@
+# test_rate_limit.py
+import time
+import asyncio
+import threading
+from rate_limit import RateLimiter, ProviderLimit, MemoryBudgetStore, SQLiteBudgetStore
+from benchmark_pipeline import make_agent
+
+# 초당 100 토큰, 요청 하나(20 토큰)가 0.2초
+TOKENS_PER_MINUTE = 6000
+COST = 20
+
+
+def drained_limiter(**kwargs) -> RateLimiter:
+    """토큰 예산을 다 쓴 상태의 한도 (다음 요청부터 대기)"""
+    limiter = RateLimiter({"openai": ProviderLimit(None, TOKENS_PER_MINUTE)}, **kwargs)
+    limiter.acquire("openai", TOKENS_PER_MINUTE, "warm-up")
+    return limiter
+
+
+def wait_until_queued(limiter: RateLimiter, count: int, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while limiter.stats()["openai"]["queued"] < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert limiter.stats()["openai"]["queued"] >= count
+
+
+def test_unlimited_provider_does_not_wait():
+    limiter = RateLimiter({"openai": ProviderLimit(None, TOKENS_PER_MINUTE)})
+    assert limiter.acquire("perplexity", 10 ** 6) == 0.0
+
+
+def test_request_and_token_budgets_both_apply():
+    limiter = RateLimiter({"openai": ProviderLimit(requests_per_minute=600, tokens_per_minute=None)})
+    for _ in range(600):
+        assert limiter.acquire("openai") < 0.05
+    # 요청 예산이 바닥나면 초당 10건씩
+    assert limiter.acquire("openai") >= 0.05
+
+    limiter = drained_limiter()
+    assert limiter.acquire("openai", COST) >= 0.15
+
+
+def test_interactive_user_is_served_before_a_queued_batch():
+    limiter = drained_limiter()
+    served = []
+    lock = threading.Lock()
+
+    def request(user):
+        limiter.acquire("openai", COST, user)
+        with lock:
+            served.append(user)
+
+    batch = [threading.Thread(target=request, args=("batch",)) for _ in range(10)]
+    for thread in batch:
+        thread.start()
+    wait_until_queued(limiter, 10)
+
+    started = time.monotonic()
+    request("alice")
+    # 배치가 10개를 쌓아 둬도 대화형 사용자는 맨 앞 요청 하나만 기다린다
+    assert time.monotonic() - started < 0.6
+    assert served.index("alice") <= 1
+    for thread in batch:
+        thread.join()
+
+    report = limiter.stats()["openai"]
+    assert report["queued"] == 0
+    assert report["users"]["batch"]["requests"] == 10
+    assert report["users"]["batch"]["wait_max"] > report["users"]["alice"]["wait_max"]
+
+
+def test_async_requests_follow_the_same_order():
+    limiter = drained_limiter()
+    served = []
+
+    async def request(user):
+        await limiter.aacquire("openai", COST, user)
+        served.append(user)
+
+    async def run():
+        batch = [asyncio.create_task(request("batch")) for _ in range(6)]
+        await asyncio.sleep(0.05)
+        await request("alice")
+        await asyncio.gather(*batch)
+
+    asyncio.run(run())
+    assert served.index("alice") <= 1
+
+
+def test_weights_give_a_larger_share():
+    limiter = drained_limiter(weights={"gold": 3.0})
+    served = []
+    lock = threading.Lock()
+
+    def request(user):
+        limiter.acquire("openai", COST, user)
+        with lock:
+            served.append(user)
+
+    threads = [threading.Thread(target=request, args=(user,)) for user in ["basic"] * 4 + ["gold"] * 4]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join()
+
+    # gold 는 basic 보다 태그가 3배 천천히 늘어 앞쪽 차례를 더 많이 받는다
+    assert served[:4].count("gold") >= 3
+
+
+def test_cancelled_request_leaves_the_queue():
+    limiter = drained_limiter()
+
+    async def run():
+        waiting = asyncio.create_task(limiter.aacquire("openai", COST, "gone"))
+        await asyncio.sleep(0.02)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        return limiter.stats()["openai"]["queued"]
+
+    assert asyncio.run(run()) == 0
+    assert limiter.acquire("openai", COST, "next") < 0.5
+
+
+def test_sqlite_store_shares_the_budget_across_limiters(tmp_path):
+    path = str(tmp_path / "budgets.sqlite")
+    limits = {"openai": ProviderLimit(None, TOKENS_PER_MINUTE)}
+    first = RateLimiter(limits, SQLiteBudgetStore(path))
+    second = RateLimiter(limits, SQLiteBudgetStore(path))
+
+    assert first.acquire("openai", TOKENS_PER_MINUTE) < 0.05
+    # 다른 프로세스(여기서는 다른 인스턴스)가 쓴 예산은 이쪽에서도 비어 있다
+    assert second.acquire("openai", COST) >= 0.15
+
+
+class SlowStore(MemoryBudgetStore):
+    """디스크 잠금을 오래 기다리는 SQLite 처럼 예산 확인이 느린 저장소"""
+
+    def take(self, provider, limit, tokens):
+        time.sleep(0.3)
+        return super().take(provider, limit, tokens)
+
+
+def test_slow_store_does_not_hold_the_limiter_lock():
+    limiter = RateLimiter({"openai": ProviderLimit(None, TOKENS_PER_MINUTE)}, SlowStore())
+    thread = threading.Thread(target=limiter.acquire, args=("openai", COST, "batch"))
+    thread.start()
+    wait_until_queued(limiter, 1)
+
+    started = time.monotonic()
+    limiter.stats()
+    # 저장소 왕복 중에도 다른 스레드가 큐를 보거나 요청을 넣을 수 있다
+    assert time.monotonic() - started < 0.1
+    thread.join()
+    assert limiter.stats()["openai"]["queued"] == 0
+
+
+def test_per_user_state_stays_bounded():
+    limiter = RateLimiter({"openai": ProviderLimit(10 ** 6, None)}, max_stats_users=50)
+    for i in range(2000):
+        limiter.acquire("openai", 0, f"session-{i}")
+
+    assert limiter._finish["openai"] == {}
+    assert len(limiter.stats()["openai"]["users"]) == 50
+    assert "session-1999" in limiter.stats()["openai"]["users"]
+
+
+def test_analysis_reports_rate_limit_wait(stub):
+    limiter = RateLimiter({"openai": ProviderLimit(requests_per_minute=60)})
+    agent = make_agent(stub, rag_cache_dir=None, rate_limiter=limiter)
+    for _ in range(60):
+        limiter.acquire("openai", 0, "warm-up")
+
+    result = agent.analyze_stock("애플 주식 분석해줘", user_id="alice")
+
+    assert not result.get("error")
+    assert result["metrics"]["openai_analysis"]["rate_limit_wait"] >= 0.5
+    assert limiter.stats()["openai"]["users"]["alice"]["requests"] == 1
@@ -0,0 +1,52 @@
+# test_retrieval_fallback.py
+import asyncio
+import pytest
+from langchain_community.vectorstores import FAISS
+import agent as agent_module
+from answer_cache import SemanticAnswerCache
+from market_cache import MarketDataCache
+from single_flight import SingleFlight
+from benchmark_pipeline import make_agent
+
+LETTERS = [
+    "Our favorite holding period is forever, and a durable moat protects the business.",
+    "Price is what you pay; value is what you get, so buy wonderful companies at fair prices.",
+    "Management should allocate capital rationally and treat shareholders as partners.",
+    "Stay within your circle of competence and avoid businesses you cannot understand.",
+    "Coca-Cola has a brand moat that lets it raise prices without losing customers.",
+]
+
+
+@pytest.fixture
+def agent(stub, monkeypatch):
+    agent = make_agent(stub, rag_cache_dir=None, answer_cache=SemanticAnswerCache(),
+                       single_flight=SingleFlight(), market_cache=MarketDataCache())
+    agent.vector_store = FAISS.from_texts(LETTERS, agent.embeddings)
+
+    def broken_search(*args, **kwargs):
+        raise TimeoutError("embedding search timed out")
+
+    # 질문 임베딩(답변 캐시 조회)은 성공하고 벡터 검색만 실패해 BM25 로 대체된다
+    monkeypatch.setattr(agent_module, "batch_search", broken_search)
+    return agent
+
+
+def assert_degraded_but_successful(result):
+    assert result["error"] == ""
+    assert "어휘 검색으로 대체" in result["warnings"]
+    assert result["metrics"]["rag_wisdom"]["retrieval"] == "lexical"
+    assert result["buffett_insights"]
+    assert result["final_analysis"]
+
+
+def test_lexical_fallback_is_a_warning_and_the_answer_is_cached(agent):
+    result = agent.analyze_stock("코카콜라의 경제적 해자는?")
+    assert_degraded_but_successful(result)
+
+    again = agent.analyze_stock("코카콜라의 경제적 해자는?")
+    assert again["cached_from"] == "코카콜라의 경제적 해자는?"
+
+
+def test_async_lexical_fallback_is_a_warning(agent):
+    result = asyncio.run(agent.aanalyze_stock("코카콜라의 경제적 해자는?"))
+    assert_degraded_but_successful(result)
@@ -0,0 +1,128 @@
+# test_single_flight.py
+import asyncio
+import itertools
+import threading
+import pytest
+import requests
+from single_flight import SingleFlight, SQLiteFlightStore
+from answer_cache import SemanticAnswerCache
+from market_cache import MarketDataCache
+from stub_providers import StubServer
+from benchmark_pipeline import make_agent
+
+CALLERS = 8
+
+
+def run_threads(target, count: int = CALLERS) -> list:
+    """count 개 스레드가 동시에 target() 을 호출하고 (결과 또는 예외) 목록 반환"""
+    barrier = threading.Barrier(count)
+    outcomes = [None] * count
+
+    def worker(index):
+        barrier.wait()
+        try:
+            outcomes[index] = target()
+        except Exception as e:
+            outcomes[index] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    return outcomes
+
+
+def test_threads_share_one_call(stub, client, payload):
+    flight = SingleFlight()
+    # 리더의 요청이 끝나기 전에 모든 스레드가 도착하도록 늦춘다
+    stub.provider.inject(delay=0.3)
+    outcomes = run_threads(lambda: flight.do("aapl", lambda: client.chat_completions(payload)))
+
+    assert stub.provider.stats["perplexity"] == 1
+    assert sorted(shared for _, shared in outcomes) == [False] + [True] * (CALLERS - 1)
+    assert all(result == outcomes[0][0] for result, _ in outcomes)
+    assert flight.stats == {"leaders": 1, "followers": CALLERS - 1}
+
+
+def test_coroutines_share_one_call(stub, client, payload):
+    flight = SingleFlight()
+    stub.provider.inject(delay=0.3)
+
+    async def run():
+        async with client.async_session():
+            return await asyncio.gather(*(
+                flight.ado("aapl", lambda: client.achat_completions(payload)) for _ in range(CALLERS)
+            ))
+
+    outcomes = asyncio.run(run())
+    assert stub.provider.stats["perplexity"] == 1
+    assert [shared for _, shared in outcomes].count(False) == 1
+
+
+def test_coroutine_joins_a_call_started_on_a_thread(stub, client, payload):
+    flight = SingleFlight()
+    stub.provider.inject(delay=0.3)
+    leader = threading.Thread(target=flight.do, args=("aapl", lambda: client.chat_completions(payload)))
+    leader.start()
+
+    async def follow():
+        await asyncio.sleep(0.05)
+        return await flight.ado("aapl", lambda: client.achat_completions(payload))
+
+    result, shared = asyncio.run(follow())
+    leader.join()
+    assert shared
+    assert result["choices"][0]["message"]["content"]
+    assert stub.provider.stats["perplexity"] == 1
+
+
+def test_leader_error_reaches_every_follower(stub, client, payload):
+    flight = SingleFlight()
+    client.max_retries = 0
+    stub.provider.inject(status=503, delay=0.3)
+    outcomes = run_threads(lambda: flight.do("aapl", lambda: client.chat_completions(payload)))
+
+    assert all(isinstance(outcome, requests.HTTPError) for outcome in outcomes)
+    assert stub.provider.stats["errors"] == 1
+
+
+def test_next_call_after_finish_runs_again(stub, client, payload):
+    flight = SingleFlight()
+    first, _ = flight.do("aapl", lambda: client.chat_completions(payload))
+    second, shared = flight.do("aapl", lambda: client.chat_completions(payload))
+    assert not shared
+    assert stub.provider.stats["perplexity"] == 2
+
+
+def test_sqlite_store_merges_across_instances(stub, client, payload, tmp_path):
+    # 같은 파일을 쓰는 SingleFlight 인스턴스 = 서로 다른 워커 프로세스
+    path = str(tmp_path / "flights.sqlite")
+    flights = [SingleFlight(SQLiteFlightStore(path, poll_interval=0.01)) for _ in range(2)]
+    picks = itertools.count()
+    stub.provider.inject(delay=0.3)
+    outcomes = run_threads(
+        lambda: flights[next(picks) % 2].do("aapl", lambda: client.chat_completions(payload)),
+        count=4
+    )
+
+    assert stub.provider.stats["perplexity"] == 1
+    assert [shared for _, shared in outcomes].count(False) == 1
+
+
+@pytest.fixture
+def fast_stub():
+    # 분석 한 번이 수백 ms 걸려야 동시 요청이 진행 중인 실행에 합류한다
+    with StubServer("fast") as server:
+        yield server
+
+
+def test_concurrent_analyses_run_the_pipeline_once(fast_stub):
+    agent = make_agent(fast_stub, rag_cache_dir=None, single_flight=SingleFlight(),
+                       answer_cache=SemanticAnswerCache(), market_cache=MarketDataCache())
+    outcomes = run_threads(lambda: agent.analyze_stock("애플 주식 분석해줘"), count=4)
+
+    assert fast_stub.provider.stats["chat"] == 1
+    assert fast_stub.provider.stats["perplexity"] == 1
+    assert len({result["final_analysis"] for result in outcomes}) == 1
+    assert sum("coalesced_from" in result for result in outcomes) == 3
@@ -0,0 +1,66 @@
+# test_ticker_resolver.py
+import pytest
+from ticker_resolver import TickerResolver, canonical_query, resolve_ticker
+
+
+@pytest.fixture(scope="module")
+def resolver():
+    return TickerResolver()
+
+
+def tickers(resolver, query):
+    return [r.ticker for r in resolver.extract_all(query)]
+
+
+@pytest.mark.parametrize("query, expected", [
+    # 다른 단어 속의 한글 별칭은 종목이 아니다
+    ("소비자 물가가 코카콜라에 미치는 영향", ["KO"]),
+    ("애플리케이션 개발 트렌드", []),
+    ("메타버스 관련주", []),
+    ("메타도시 계획", []),
+    # 조사가 붙은 한글 별칭은 종목
+    ("애플의 배당 정책", ["AAPL"]),
+    ("삼성전자에서는 무엇을", ["005930.KS"]),
+    ("테슬라와 애플", ["TSLA", "AAPL"]),
+    ("비자는 어때?", ["V"]),
+    ("(메타) 실적", ["META"]),
+    # 영문 별칭은 단어 경계에서만
+    ("pineapple prices", []),
+    ("Apple supply-chain risk", ["AAPL"]),
+    ("sk하이닉스 전망", ["000660.KS"]),
+])
+def test_extract_all_respects_word_boundaries(resolver, query, expected):
+    assert tickers(resolver, query) == expected
+
+
+def test_extract_all_returns_every_ticker_in_order(resolver):
+    assert tickers(resolver, "AMD vs NVIDIA") == ["AMD", "NVDA"]
+    assert tickers(resolver, "엔비디아랑 AMD 비교") == ["NVDA", "AMD"]
+
+
+def test_single_letter_symbols_need_uppercase(resolver):
+    assert tickers(resolver, "V 주가") == ["V"]
+    assert tickers(resolver, "v 주가") == []
+
+
+def test_resolve_ticker_and_canonical_query():
+    assert resolve_ticker("소비자 물가가 코카콜라에 미치는 영향") == "KO"
+    assert resolve_ticker("애플리케이션 개발") == ""
+    assert canonical_query("애플 분석") == canonical_query("Apple 분석") == "aapl 분석"
+    assert canonical_query("애플리케이션 분석") == "애플리케이션 분석"
+
+
+@pytest.mark.parametrize("query, expected", [
+    # NFKC 가 길이를 바꾸는 합자/호환 문자가 앞에 있어도 위치가 어긋나지 않는다
+    ("ﬁ 애플 주식 분석", ("AAPL", "애플", 3)),
+    ("Ⅻ 테슬라 주가", ("TSLA", "테슬라", 4)),
+    ("㈜삼성전자 전망", ("005930.KS", "삼성전자", 3)),
+])
+def test_offsets_follow_the_normalized_query(resolver, query, expected):
+    [resolution] = resolver.extract_all(query)
+    assert (resolution.ticker, resolution.matched, resolution.start) == expected
+
+
+def test_canonical_query_with_compatibility_characters():
+    assert canonical_query("ﬁ 애플 주식 분석") == "fi aapl 주식 분석"
+    assert canonical_query("Ⅻ 테슬라 주가") == "xii tsla 주가"
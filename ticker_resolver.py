@@ -0,0 +1,197 @@
+import re
+import unicodedata
+from typing import NamedTuple
+
+# (티커, 시장, 영문 이름/별칭, 한글 이름/별칭)
+COMPANIES = [
+    ("AAPL", "US", ["apple", "apple inc"], ["애플"]),
+    ("MSFT", "US", ["microsoft", "msft"], ["마이크로소프트", "마소"]),
+    ("NVDA", "US", ["nvidia"], ["엔비디아"]),
+    ("GOOGL", "US", ["alphabet", "google"], ["알파벳", "구글"]),
+    ("AMZN", "US", ["amazon", "amazon.com"], ["아마존"]),
+    ("META", "US", ["meta platforms", "facebook"], ["메타", "페이스북"]),
+    ("TSLA", "US", ["tesla"], ["테슬라"]),
+    ("BRK.B", "US", ["berkshire hathaway", "berkshire"], ["버크셔 해서웨이", "버크셔해서웨이", "버크셔"]),
+    ("AVGO", "US", ["broadcom"], ["브로드컴"]),
+    ("AMD", "US", ["advanced micro devices"], ["에이엠디"]),
+    ("INTC", "US", ["intel"], ["인텔"]),
+    ("QCOM", "US", ["qualcomm"], ["퀄컴"]),
+    ("TSM", "US", ["tsmc", "taiwan semiconductor"], ["tsmc", "대만 반도체", "티에스엠씨"]),
+    ("ASML", "US", ["asml"], ["asml"]),
+    ("ORCL", "US", ["oracle"], ["오라클"]),
+    ("CRM", "US", ["salesforce"], ["세일즈포스"]),
+    ("ADBE", "US", ["adobe"], ["어도비"]),
+    ("NFLX", "US", ["netflix"], ["넷플릭스"]),
+    ("PLTR", "US", ["palantir"], ["팔란티어"]),
+    ("IBM", "US", ["ibm"], ["아이비엠"]),
+    ("KO", "US", ["coca-cola", "coca cola", "coke"], ["코카콜라", "코카 콜라"]),
+    ("PEP", "US", ["pepsico", "pepsi"], ["펩시코", "펩시"]),
+    ("AXP", "US", ["american express", "amex"], ["아메리칸 익스프레스", "아멕스"]),
+    ("BAC", "US", ["bank of america"], ["뱅크오브아메리카", "뱅크 오브 아메리카"]),
+    ("JPM", "US", ["jpmorgan", "jp morgan", "jpmorgan chase"], ["제이피모건", "jp모건"]),
+    ("V", "US", ["visa"], ["비자"]),
+    ("MA", "US", ["mastercard"], ["마스터카드"]),
+    ("OXY", "US", ["occidental petroleum", "occidental"], ["옥시덴탈"]),
+    ("CVX", "US", ["chevron"], ["셰브론", "쉐브론"]),
+    ("XOM", "US", ["exxon mobil", "exxonmobil", "exxon"], ["엑슨모빌", "엑손모빌"]),
+    ("KHC", "US", ["kraft heinz"], ["크래프트 하인즈", "크래프트하인즈"]),
+    ("MCO", "US", ["moody's", "moodys"], ["무디스"]),
+    ("WMT", "US", ["walmart"], ["월마트"]),
+    ("COST", "US", ["costco"], ["코스트코"]),
+    ("JNJ", "US", ["johnson & johnson", "johnson and johnson"], ["존슨앤드존슨", "존슨앤존슨"]),
+    ("PG", "US", ["procter & gamble", "procter and gamble"], ["프록터앤드갬블", "피앤지"]),
+    ("DIS", "US", ["disney", "walt disney"], ["디즈니"]),
+    ("NKE", "US", ["nike"], ["나이키"]),
+    ("SBUX", "US", ["starbucks"], ["스타벅스"]),
+    ("MCD", "US", ["mcdonald's", "mcdonalds"], ["맥도날드"]),
+    ("LLY", "US", ["eli lilly", "lilly"], ["일라이 릴리", "일라이릴리"]),
+    ("NVO", "US", ["novo nordisk"], ["노보 노디스크", "노보노디스크"]),
+    ("UNH", "US", ["unitedhealth"], ["유나이티드헬스"]),
+    ("BA", "US", ["boeing"], ["보잉"]),
+    ("F", "US", ["ford motor", "ford"], ["포드"]),
+    ("GM", "US", ["general motors"], ["제너럴모터스", "제너럴 모터스"]),
+    ("UBER", "US", ["uber"], ["우버"]),
+    ("COIN", "US", ["coinbase"], ["코인베이스"]),
+    ("005930.KS", "KR", ["samsung electronics", "samsung"], ["삼성전자", "삼전"]),
+    ("000660.KS", "KR", ["sk hynix", "hynix"], ["sk하이닉스", "하이닉스", "에스케이하이닉스"]),
+    ("373220.KS", "KR", ["lg energy solution"], ["lg에너지솔루션", "엘지에너지솔루션", "엘지엔솔"]),
+    ("207940.KS", "KR", ["samsung biologics"], ["삼성바이오로직스", "삼바"]),
+    ("005380.KS", "KR", ["hyundai motor", "hyundai"], ["현대차", "현대자동차"]),
+    ("000270.KS", "KR", ["kia"], ["기아"]),
+    ("035420.KS", "KR", ["naver"], ["네이버"]),
+    ("035720.KS", "KR", ["kakao"], ["카카오"]),
+    ("005490.KS", "KR", ["posco holdings", "posco"], ["포스코홀딩스", "포스코"]),
+    ("051910.KS", "KR", ["lg chem"], ["lg화학", "엘지화학"]),
+    ("006400.KS", "KR", ["samsung sdi"], ["삼성sdi", "삼성에스디아이"]),
+    ("068270.KS", "KR", ["celltrion"], ["셀트리온"]),
+    ("105560.KS", "KR", ["kb financial"], ["kb금융", "케이비금융"]),
+    ("055550.KS", "KR", ["shinhan financial"], ["신한지주", "신한금융"]),
+    ("012450.KS", "KR", ["hanwha aerospace"], ["한화에어로스페이스", "한화에어로"]),
+    ("329180.KS", "KR", ["hd hyundai heavy industries"], ["hd현대중공업", "현대중공업"]),
+]
+
+_WORD_CHAR = re.compile(r"[a-z0-9]")
+_HANGUL = re.compile(r"[가-힣ㄱ-ㅎㅏ-ㅣ]")
+# 한글 별칭 뒤에 붙어도 되는 조사 ("애플의", "삼성전자에서는"), 그 뒤는 한글이 아니어야 한다
+_PARTICLES = re.compile(
+    r"(?:으로|에서|에게|까지|부터|보다|처럼|하고|이랑|랑|은|는|이|가|의|에|과|와|을|를|도|만|로|요)*(?![가-힣ㄱ-ㅎㅏ-ㅣ])"
+)
+
+
+class Resolution(NamedTuple):
+    ticker: str
+    market: str
+    # matched / start 는 NFKC 정규화한 질문 기준 ("ﬁ" -> "fi" 처럼 길이가 바뀔 수 있다)
+    matched: str
+    start: int
+
+
+def _casefold(text: str) -> str:
+    # 소문자로 바꾸면 길이가 달라지는 문자("İ")는 그대로 둬 NFKC 문자열과 위치를 맞춘다
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def _normalize(text: str) -> str:
+    # 전각 문자/호환 문자를 통일하고 대소문자 무시
+    return _casefold(unicodedata.normalize("NFKC", text))
+
+
+class TickerResolver:
+    """질문에서 종목 티커를 찾는 로컬 별칭 색인 (API 호출 없음)
+
+    별칭을 첫 글자별로 묶어 긴 별칭부터 비교하므로 질문 길이에 비례하는 시간에 끝난다.
+    영문 별칭은 단어 경계에서만 매칭한다. 한글 별칭은 앞이 한글이 아니어야 하고 뒤에는 조사만
+    허용해("애플의") 다른 단어 속의 별칭("소비자" 의 "비자", "애플리케이션")은 무시한다.
+    티커 기호 자체는 질문에 대문자로 쓰였을 때만 인정한다 ("V", "F" 같은 한 글자 티커 보호).
+    """
+
+    def __init__(self, companies: list = COMPANIES):
+        self._markets = {}
+        self._by_first_char = {}
+        self._symbols = {}
+        for ticker, market, english, korean in companies:
+            self._markets[ticker] = market
+            for alias in english + korean:
+                self._add(_normalize(alias), ticker)
+            # 숫자 코드(005930)와 거래소 접미사 없는 기호도 티커로 인정
+            self._symbols[ticker] = ticker
+            self._symbols[ticker.split(".")[0]] = ticker
+        for aliases in self._by_first_char.values():
+            aliases.sort(key=lambda item: len(item[0]), reverse=True)
+        symbols = sorted(self._symbols, key=len, reverse=True)
+        self._symbol_pattern = re.compile(
+            r"(?<![A-Za-z0-9.])(" + "|".join(re.escape(s) for s in symbols) + r")(?![A-Za-z0-9])"
+        )
+
+    def _add(self, alias: str, ticker: str):
+        if alias:
+            self._by_first_char.setdefault(alias[0], []).append((alias, ticker))
+
+    def extract_all(self, query: str) -> list:
+        """질문에 나온 모든 종목 (등장 순서, 같은 티커는 한 번)"""
+        folded = unicodedata.normalize("NFKC", query)
+        text = _casefold(folded)
+        found = []
+        i = 0
+        while i < len(text):
+            match = None
+            # 단어 중간("pineapple" 의 "apple", "소비자" 의 "비자")에서 시작하는 별칭은 건너뜀
+            at_boundary = i == 0 or not _WORD_CHAR.match(text[i - 1])
+            after_hangul = i > 0 and _HANGUL.match(text[i - 1])
+            for alias, ticker in self._by_first_char.get(text[i], ()):
+                if not text.startswith(alias, i):
+                    continue
+                end = i + len(alias)
+                if _WORD_CHAR.match(alias[0]) and not at_boundary:
+                    continue
+                if _HANGUL.match(alias[0]) and after_hangul:
+                    continue
+                if _WORD_CHAR.match(alias[-1]) and end < len(text) and _WORD_CHAR.match(text[end]):
+                    continue
+                if _HANGUL.match(alias[-1]) and not _PARTICLES.match(text, end):
+                    continue
+                match = Resolution(ticker, self._markets[ticker], text[i:end], i)
+                break
+            if match is not None:
+                found.append(match)
+                i += len(match.matched)
+            else:
+                i += 1
+
+        for m in self._symbol_pattern.finditer(folded):
+            ticker = self._symbols[m.group(1)]
+            found.append(Resolution(ticker, self._markets[ticker], m.group(1), m.start()))
+
+        found.sort(key=lambda r: r.start)
+        seen = set()
+        return [r for r in found if not (r.ticker in seen or seen.add(r.ticker))]
+
+    def resolve(self, query: str) -> Resolution:
+        """질문의 첫 번째 종목 (없으면 None)"""
+        found = self.extract_all(query)
+        return found[0] if found else None
+
+
+# 색인은 한 번만 만들어 모든 에이전트가 공유
+default_resolver = TickerResolver()
+
+
+def resolve_ticker(query: str) -> str:
+    """질문의 대표 티커 (찾지 못하면 빈 문자열)"""
+    resolution = default_resolver.resolve(query)
+    return resolution.ticker if resolution else ""
+
+
+def canonical_query(query: str) -> str:
+    """종목 표현을 티커로 바꾼 정규화 질문 ("애플 분석", "Apple 분석" -> "aapl 분석")"""
+    text = _normalize(query)
+    parts = []
+    last = 0
+    for resolution in default_resolver.extract_all(query):
+        if resolution.start < last:
+            continue
+        parts.append(text[last:resolution.start])
+        parts.append(resolution.ticker.lower())
+        last = resolution.start + len(resolution.matched)
+    parts.append(text[last:])
+    return " ".join("".join(parts).split()).rstrip("?!.")